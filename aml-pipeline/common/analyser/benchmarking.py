@@ -1,12 +1,54 @@
+import hashlib
 import importlib
 import json
+import multiprocessing
 import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
 
+import requests
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
 from azure.identity import ClientSecretCredential
-from azure.storage.blob import ContainerClient
+from azure.storage.blob import BlobProperties, ContainerClient
 from loguru import logger as logging
 
+# ground truth of the worker processes, sent once to each worker rather than with every predictions file
+_ground_truth = None
+
+
+def _init_worker(ground_truth: Dict[str, Any]):
+    global _ground_truth
+    _ground_truth = ground_truth
+
+
+def _evaluate_predictions(predictions_path: str, dataset_name: str, calculators: List[Tuple[str, str, str, Dict[str, Any]]]):
+    """
+    Runs the calculators of one predictions file in a worker process. Returns None when the predictions are for another dataset, else
+    (calculator class name, calculate / apply result, calculator) of each calculator, the calculators without their inputs, so that only the
+    results are sent back to the main process, which logs them to mlflow.
+    """
+
+    with open(predictions_path, "rb") as f:
+        predictions_json = json.load(f)
+    if predictions_json["dataset_name"] != dataset_name:
+        return None
+
+    results = []
+    for kind, class_name, module_name, params in calculators:
+        calculator = BenchmarkingCalculator._class_from_name(class_name, module_name)(
+            ground_truth=_ground_truth,
+            predictions=predictions_json,
+            params=params,
+        )
+        result = calculator.calculate() if kind == "metrics_type" else calculator.apply()
+        calculator.ground_truth = calculator.predictions = None
+        results.append((class_name, result, calculator))
+
+    return results
+
 
 class BenchmarkingCalculator:
     def __init__(self, config_file_path: str):
@@ -23,6 +65,13 @@ class BenchmarkingCalculator:
         else:
             self._mlflow_logging_path = "./logs"
 
+        # downloaded blobs are kept in cache_dir under their ETag, so unchanged predictions are only downloaded once across runs
+        self._cache_dir = configs.get("cache_dir", os.path.join(".cache", "benchmarking"))
+        self._download_concurrency = configs.get("download_concurrency", 16)
+        # calculators run in the main process by default, or in n_workers processes when configured: each worker holds the ground truth, a
+        # predictions file and the models the calculators load, so only raise it as far as memory allows
+        self._n_workers = configs.get("n_workers", 1)
+
         try:
             credential = ClientSecretCredential(
                 tenant_id=self._predictions_storage["tenant_id"],
@@ -33,10 +82,16 @@ class BenchmarkingCalculator:
             logging.error(e)
             raise ValueError(e)
 
+        # one connection per download thread
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self._download_concurrency)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
         self._container = ContainerClient(
             account_url=self._predictions_storage["blob_account_url"],
             container_name=self._predictions_storage["container_name"],
             credential=credential,
+            transport=RequestsTransport(session=session, session_owner=False),
         )
 
         if self._container is not None:
@@ -60,14 +115,49 @@ class BenchmarkingCalculator:
         file_content = None
         blob_client = self._container.get_blob_client(file_path)
 
-        if blob_client.exists():
-            download_stream = blob_client.download_blob()
-            file_content = download_stream.readall()
-        else:
+        try:
+            file_content = blob_client.download_blob().readall()
+        except ResourceNotFoundError:
             logging.warning(f"blob {file_path} does not exists")
 
         return file_content
 
+    def _cached_file(self, blob: BlobProperties) -> str:
+        """Local path of the content of a listed blob, downloaded unless its ETag is already in the cache."""
+
+        name_hash = hashlib.sha1(blob.name.encode("utf-8")).hexdigest()
+        path = os.path.join(self._cache_dir, f"{name_hash}_{re.sub(r'[^0-9A-Za-z]', '', blob.etag)}.json")
+        if os.path.exists(path):
+            logging.debug(f"Reading file {blob.name} from cache {path}")
+            return path
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+        file_content = self._read_file(blob.name)
+        if file_content is None:
+            raise FileNotFoundError(f"blob {blob.name} does not exists")
+
+        # write then rename, so that an interrupted download never leaves a truncated file under the ETag
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(file_content)
+        os.replace(tmp_path, path)
+
+        # previous versions of the blob
+        for file_name in os.listdir(self._cache_dir):
+            if file_name.startswith(f"{name_hash}_") and file_name.endswith(".json") and os.path.join(self._cache_dir, file_name) != path:
+                os.remove(os.path.join(self._cache_dir, file_name))
+
+        return path
+
+    def _worker_pool(self, ground_truth: Dict[str, Any]):
+        if self._n_workers > 1:
+            # spawned rather than forked, the download threads run while the workers start
+            return ProcessPoolExecutor(max_workers=self._n_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+                                       initargs=(ground_truth,))
+
+        _init_worker(ground_truth)
+        return ThreadPoolExecutor(max_workers=1)
+
     @staticmethod
     def _json_blobs_in_path(blob_container: ContainerClient, path: str):
         path_content = blob_container.list_blobs(name_starts_with=path)
@@ -111,71 +201,51 @@ class BenchmarkingCalculator:
             msg = f"No annotation json file was found in dataset path {gt_path}"
             logging.error(msg)
             raise FileNotFoundError(msg)
-        gt_json = json.loads(self._read_file(gt_path_content[0].name))
+        with open(self._cached_file(gt_path_content[0]), "rb") as f:
+            gt_json = json.load(f)
+
+        calculators = []
+        for kind in ("metrics_type", "error_analysis_type"):
+            if kind in self._metrics_types.keys():
+                calculators.append((kind, self._metrics_types[kind][0], self._metrics_types[kind][1], self._metrics_types["params"]))
 
-        # load predictions and calculate metrics
+        # list the predictions of all model versions
         model_results_base_dir = self._predictions_storage["model_results_base_dir"]
+        model_versions = [
+            (model["model_name"], version)
+            for model in self._predictions_results["models_predictions"]
+            for version in model["model_versions"]
+        ]
 
-        for model in self._predictions_results["models_predictions"]:
-            for version in model["model_versions"]:
-                tmp_model_version = os.path.join(
-                    model_results_base_dir, model["model_name"], version
-                )
-                model_prediction_path_content = self._json_blobs_in_path(
-                    self._container, tmp_model_version
-                )
-
-                for predictions_file_blob in model_prediction_path_content:
-                    predictions_json = json.loads(self._read_file(predictions_file_blob.name))
-
-                    if predictions_json["dataset_name"] == dataset_name:
-
-                        if "metrics_type" in self._metrics_types.keys():
-                            if not self._metrics_types["metrics_type"][0] in self._results.keys():
-                                self._results[self._metrics_types["metrics_type"][0]] = []
-                            metrics_calculator = self._class_from_name(
-                                self._metrics_types["metrics_type"][0],
-                                self._metrics_types["metrics_type"][1],
-                            )(
-                                ground_truth=gt_json,
-                                predictions=predictions_json,
-                                params=self._metrics_types["params"],
-                            )
-                            metrics = metrics_calculator.calculate()
-                            if mlflow_logging:
-                                metrics_calculator.mlflow_log(log_path=
-                                                              os.path.join(self._mlflow_logging_path,
-                                                                           model["model_name"],
-                                                                           version))
-                            self._results[self._metrics_types["metrics_type"][0]].append({
-                                predictions_file_blob.name: metrics
-                            })
-
-                        if "error_analysis_type" in self._metrics_types.keys():
-                            if not self._metrics_types["error_analysis_type"][0] in self._results.keys():
-                                self._results[self._metrics_types["error_analysis_type"][0]] = []
-                            error_analysis_calculator = self._class_from_name(
-                                self._metrics_types["error_analysis_type"][0],
-                                self._metrics_types["error_analysis_type"][1],
-                            )(
-                                ground_truth=gt_json,
-                                predictions=predictions_json,
-                                params=self._metrics_types["params"],
-                            )
-                            error_analysis = error_analysis_calculator.apply()
-                            if mlflow_logging:
-                                error_analysis_calculator.mlflow_log(log_path=
-                                                                     os.path.join(self._mlflow_logging_path,
-                                                                                  model["model_name"],
-                                                                                  version))
-                            self._results[self._metrics_types["error_analysis_type"][0]].append({
-                                predictions_file_blob.name: error_analysis
-                            })
-
-                    else:
-                        msg = f"{predictions_file_blob.name} doesn't match dataset"\
-                              f"{dataset_name}. It will be ignored"
-                        logging.warning(msg)
+        with ThreadPoolExecutor(max_workers=self._download_concurrency) as downloads, self._worker_pool(gt_json) as workers:
+            listings = downloads.map(
+                lambda model_version: self._json_blobs_in_path(self._container, os.path.join(model_results_base_dir, *model_version)),
+                model_versions,
+            )
+            predictions_files = [
+                (model_name, version, predictions_file_blob)
+                for (model_name, version), blobs in zip(model_versions, listings)
+                for predictions_file_blob in blobs
+            ]
+
+            # predictions are evaluated as soon as they are downloaded, while the next ones download
+            local_paths = downloads.map(lambda predictions_file: self._cached_file(predictions_file[2]), predictions_files)
+            evaluations = [workers.submit(_evaluate_predictions, local_path, dataset_name, calculators) for local_path in local_paths]
+
+            for (model_name, version, predictions_file_blob), evaluation in zip(predictions_files, evaluations):
+                results = evaluation.result()
+                if results is None:
+                    msg = f"{predictions_file_blob.name} doesn't match dataset"\
+                          f"{dataset_name}. It will be ignored"
+                    logging.warning(msg)
+                    continue
+
+                for class_name, result, calculator in results:
+                    if mlflow_logging:
+                        calculator.mlflow_log(log_path=os.path.join(self._mlflow_logging_path, model_name, version))
+                    self._results.setdefault(class_name, []).append({
+                        predictions_file_blob.name: result
+                    })
 
         print("results: ", self._results)
 
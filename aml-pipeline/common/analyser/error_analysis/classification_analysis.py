@@ -8,12 +8,13 @@ import mlflow
 import pandas as pd
 import torch
 from loguru import logger as logging
-from sklearn.metrics import ConfusionMatrixDisplay, confusion_matrix
+from sklearn.metrics import ConfusionMatrixDisplay
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 
 from common.analyser.error_analysis.error_analyser import ErrorAnalyser
 from common.analyser.helper_classes.similarity import FeaturesExtractor, SimilarityDataset
+from common.analyser.metrics.confusion_metrics import ConfusionMetrics
 from common.analyser.parsers.classification_parser import ClassificationParser
 
 
@@ -43,10 +44,7 @@ class ClassificationAnalysis(ErrorAnalyser):
         return True
 
     def parse_input(self):
-        classification_parser = ClassificationParser(
-            ground_truth=self.ground_truth, predictions=self.predictions
-        )
-        return classification_parser.parse()
+        return ClassificationParser.parse_cached(ground_truth=self.ground_truth, predictions=self.predictions)
 
     def apply(self):
 
@@ -56,7 +54,7 @@ class ClassificationAnalysis(ErrorAnalyser):
         if input_valid:
             y_true, y_pred, y_scores, labels, img_list = self.parse_input()
 
-            y_score = [max(x) for x in y_scores]
+            y_score = y_scores.max(axis=1)
 
             confusion_matrix_fig = self.create_report(
                 img_list=img_list,
@@ -167,7 +165,7 @@ class ClassificationAnalysis(ErrorAnalyser):
         labels: List[Union[int, str]],
     ) -> Tuple[plt.Figure]:
         # create confusion matrix and matplot figure
-        cm = confusion_matrix(y_true, y_pred, labels=labels)
+        cm = ConfusionMetrics(y_true=y_true, y_pred=y_pred, labels=labels).confusion_matrix
         cm_display = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=labels)
         cm_fig, ax = plt.subplots(figsize=(30, 30), facecolor="white")
         ax.tick_params(axis="both", which="major", labelsize=18)
@@ -1,5 +1,6 @@
 from typing import Any, Dict, List, Tuple, Union
 
+from common.analyser.metrics.confusion_metrics import ConfusionMetrics
 from common.analyser.metrics.metric_calculator import MetricCalculator
 from common.analyser.parsers.classification_parser import ClassificationParser
 
@@ -8,13 +9,6 @@ import time
 import os
 from loguru import logger as logging
 import numpy as np
-from sklearn.metrics import (
-    accuracy_score,
-    f1_score,
-    precision_score,
-    recall_score,
-    top_k_accuracy_score,
-)
 
 
 class ClassificationMetrics(MetricCalculator):
@@ -52,9 +46,7 @@ class ClassificationMetrics(MetricCalculator):
         return True
 
     def parse_input(self):
-        classification_parser = ClassificationParser(ground_truth=self.ground_truth,
-                                                     predictions=self.predictions)
-        return classification_parser.parse()
+        return ClassificationParser.parse_cached(ground_truth=self.ground_truth, predictions=self.predictions)
 
     def calculate(self):
 
@@ -63,22 +55,17 @@ class ClassificationMetrics(MetricCalculator):
         if input_valid:
             y_true, y_pred, y_score, labels, img_list = self.parse_input()
 
-            accuracy, precision, recall, f1 = self.get_base_metrics(
-                y_true=y_true, y_pred=y_pred
-            )
-            metrics["accuracy"] = accuracy
-            metrics["precision"] = precision
-            metrics["recall"] = recall
-            metrics["f1"] = f1
-
-            # For k = 2: Calculating top k accuracy score using probabilities for class 1
-            if self.top_k_accuracy == [2]:
-                y_score = np.array([score[0] for score in y_score])
-
-            for k in self.top_k_accuracy:
-                top_acc = self.get_top_k_accuracy(
-                    y_true=y_true, y_score=y_score, labels=labels, k=k
-                )
+            # one confusion matrix and one ranking of the true categories for all the metrics
+            confusion = ConfusionMetrics(y_true=y_true, y_pred=y_pred, labels=labels, y_score=y_score)
+            metrics["accuracy"] = confusion.accuracy()
+            metrics["precision"] = confusion.precision()
+            metrics["recall"] = confusion.recall()
+            metrics["f1"] = confusion.f1()
+            metrics["precision_weighted"] = confusion.precision("weighted")
+            metrics["recall_weighted"] = confusion.recall("weighted")
+            metrics["f1_weighted"] = confusion.f1("weighted")
+
+            for k, top_acc in confusion.top_k_accuracies(self.top_k_accuracy).items():
                 metrics[f"top_{k}_accuracy"] = top_acc
 
             self._metrics = metrics
@@ -111,12 +98,9 @@ class ClassificationMetrics(MetricCalculator):
         y_true: List[Union[int, str]],
         y_pred: List[Union[int, str]],
     ) -> Tuple[float, float, float, float]:
-        precision = precision_score(y_true, y_pred, average="macro")
-        recall = recall_score(y_true, y_pred, average="macro")
-        f1 = f1_score(y_true, y_pred, average="macro")
-        accuracy = accuracy_score(y_true, y_pred)
+        confusion = ConfusionMetrics(y_true=y_true, y_pred=y_pred, labels=np.union1d(y_true, y_pred))
 
-        return accuracy, precision, recall, f1
+        return confusion.accuracy(), confusion.precision(), confusion.recall(), confusion.f1()
 
     @staticmethod
     def get_top_k_accuracy(
@@ -125,4 +109,4 @@ class ClassificationMetrics(MetricCalculator):
         labels: List[Union[int, str]],
         k: int,
     ) -> float:
-        return top_k_accuracy_score(y_true=y_true, y_score=y_score, labels=labels, k=k)
+        return ConfusionMetrics(y_true=y_true, y_pred=y_true, labels=labels, y_score=np.asarray(y_score)).top_k_accuracy(k)
@@ -0,0 +1,192 @@
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # 0 where the denominator is 0, as sklearn does with zero_division="warn"
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+
+class ConfusionMetrics:
+    """
+    Single label classification metrics derived from one confusion matrix, built with np.bincount, and from the rank of the true category in
+    the score matrix. Results match sklearn's accuracy_score, precision/recall/f1_score and top_k_accuracy_score, including the tie breaking
+    of top_k_accuracy_score (among equal scores the highest category index ranks first).
+
+    Args:
+        y_true: true category of each prediction, one of labels
+        y_pred: predicted category of each prediction, one of labels
+        labels: sorted category ids, the rows and columns order of the confusion matrix and the columns order of y_score
+        y_score: optional (predictions x labels) score matrix, needed for top k accuracy
+    """
+
+    def __init__(self, y_true: Sequence[int], y_pred: Sequence[int], labels: Sequence[int], y_score: np.ndarray = None):
+        self.labels = np.asarray(labels)
+        self._true = self._label_index(y_true)
+        self._pred = self._label_index(y_pred)
+        self._y_score = y_score
+        self._true_rank = None
+
+        n_labels = len(self.labels)
+        self.confusion_matrix = np.bincount(self._true * n_labels + self._pred, minlength=n_labels * n_labels).reshape(n_labels, n_labels)
+
+        self.true_positives = np.diag(self.confusion_matrix)
+        self.support = self.confusion_matrix.sum(axis=1)
+        self.predicted = self.confusion_matrix.sum(axis=0)
+        self.precision_per_class = _safe_divide(self.true_positives, self.predicted)
+        self.recall_per_class = _safe_divide(self.true_positives, self.support)
+        self.f1_per_class = _safe_divide(2 * self.true_positives, self.support + self.predicted)
+
+        # sklearn averages over the labels present in y_true or y_pred, not over all categories
+        self._present = (self.support + self.predicted) > 0
+
+    def _label_index(self, y: Sequence[int]) -> np.ndarray:
+        y = np.asarray(y)
+        index = np.searchsorted(self.labels, y)
+        if len(y) and not np.array_equal(self.labels[np.minimum(index, len(self.labels) - 1)], y):
+            raise ValueError("y_true and y_pred must only contain values of labels")
+        return index.astype(np.int64)
+
+    @property
+    def n_samples(self) -> int:
+        return len(self._true)
+
+    def accuracy(self) -> float:
+        return float(self.true_positives.sum() / self.n_samples) if self.n_samples else 0.0
+
+    def _average(self, per_class: np.ndarray, average: str) -> float:
+        if average == "macro":
+            return float(per_class[self._present].mean()) if self._present.any() else 0.0
+        if average == "weighted":
+            return float((per_class * self.support).sum() / self.support.sum()) if self.support.sum() else 0.0
+        if average == "micro":
+            # each wrong prediction is one false positive and one false negative, so micro precision, recall and f1 all equal the accuracy
+            return self.accuracy()
+        raise ValueError(f"average must be one of macro, micro, weighted, got {average}")
+
+    def precision(self, average: str = "macro") -> float:
+        return self._average(self.precision_per_class, average)
+
+    def recall(self, average: str = "macro") -> float:
+        return self._average(self.recall_per_class, average)
+
+    def f1(self, average: str = "macro") -> float:
+        return self._average(self.f1_per_class, average)
+
+    def per_class(self) -> Dict[int, Dict[str, float]]:
+        """{category id: {precision, recall, f1, support}} for every label."""
+
+        return {
+            label: {"precision": precision, "recall": recall, "f1": f1, "support": support}
+            for label, precision, recall, f1, support in zip(
+                self.labels.tolist(),
+                self.precision_per_class.tolist(),
+                self.recall_per_class.tolist(),
+                self.f1_per_class.tolist(),
+                self.support.tolist(),
+            )
+        }
+
+    def top_k_accuracy(self, k: int) -> float:
+        return self.top_k_accuracies([k])[k]
+
+    def top_k_accuracies(self, ks: List[int]) -> Dict[int, float]:
+        """Top k accuracy for each k, from a single pass over the score matrix."""
+
+        if self._y_score is None:
+            raise ValueError("y_score is required for top k accuracy")
+        if not self.n_samples:
+            return {k: 0.0 for k in ks}
+
+        if self._true_rank is None:
+            rows = np.arange(self.n_samples)
+            true_score = self._y_score[rows, self._true][:, None]
+            columns = np.arange(len(self.labels))
+            ties_ranked_first = (self._y_score == true_score) & (columns > self._true[:, None])
+            self._true_rank = (self._y_score > true_score).sum(axis=1) + ties_ranked_first.sum(axis=1)
+
+        return {k: float(np.mean(self._true_rank < k)) for k in ks}
+
+
+class MultilabelConfusionMetrics:
+    """
+    Multi-label classification metrics from one (categories x 2 x 2) confusion matrix, built with a single np.bincount over the categories, and
+    per category average precision ranked over the whole score matrix at once. Results match sklearn's precision/recall/f1_score on indicator
+    matrices and average_precision_score (without interpolation, ties grouped) averaged over the categories with positive samples.
+
+    Args:
+        y_true: (samples x labels) 0/1 matrix of the true categories
+        y_score: (samples x labels) score matrix
+        threshold: minimum score of a predicted category
+    """
+
+    def __init__(self, y_true: np.ndarray, y_score: np.ndarray, threshold: float = 0.5):
+        self.y_true = np.asarray(y_true).astype(bool)
+        self.y_score = np.asarray(y_score, dtype=np.float64)
+        self.y_pred = self.y_score >= threshold
+
+        n_labels = self.y_true.shape[1]
+        cells = np.arange(n_labels) * 4 + self.y_true * 2 + self.y_pred
+        # confusion_matrix[c] = [[tn, fp], [fn, tp]] as sklearn's multilabel_confusion_matrix
+        self.confusion_matrix = np.bincount(cells.ravel(), minlength=n_labels * 4).reshape(n_labels, 2, 2)
+
+        self.true_positives = self.confusion_matrix[:, 1, 1]
+        self.support = self.confusion_matrix[:, 1].sum(axis=1)
+        self.predicted = self.confusion_matrix[:, :, 1].sum(axis=1)
+        self.precision_per_class = _safe_divide(self.true_positives, self.predicted)
+        self.recall_per_class = _safe_divide(self.true_positives, self.support)
+        self.f1_per_class = _safe_divide(2 * self.true_positives, self.support + self.predicted)
+        self._average_precision = None
+
+    def subset_accuracy(self) -> float:
+        """Fraction of samples whose predicted categories are exactly the true ones."""
+
+        return float((self.y_true == self.y_pred).all(axis=1).mean()) if len(self.y_true) else 0.0
+
+    def _average(self, per_class: np.ndarray, numerator: np.ndarray, denominator: np.ndarray, average: str) -> float:
+        if average == "macro":
+            return float(per_class.mean()) if len(per_class) else 0.0
+        if average == "weighted":
+            return float((per_class * self.support).sum() / self.support.sum()) if self.support.sum() else 0.0
+        if average == "micro":
+            return float(_safe_divide(numerator.sum(), denominator.sum()))
+        raise ValueError(f"average must be one of macro, micro, weighted, got {average}")
+
+    def precision(self, average: str = "macro") -> float:
+        return self._average(self.precision_per_class, self.true_positives, self.predicted, average)
+
+    def recall(self, average: str = "macro") -> float:
+        return self._average(self.recall_per_class, self.true_positives, self.support, average)
+
+    def f1(self, average: str = "macro") -> float:
+        return self._average(self.f1_per_class, 2 * self.true_positives, self.support + self.predicted, average)
+
+    def average_precision(self) -> np.ndarray:
+        """Average precision of each category, NaN for categories without positive samples."""
+
+        if self._average_precision is not None:
+            return self._average_precision
+
+        # every column ranked by decreasing score at once, precision and recall taken at the last sample of each run of equal scores
+        order = np.argsort(-self.y_score, axis=0, kind="stable")
+        scores = np.take_along_axis(self.y_score, order, axis=0)
+        tp = np.cumsum(np.take_along_axis(self.y_true, order, axis=0), axis=0)
+        last_of_ties = np.ones_like(scores, dtype=bool)
+        last_of_ties[:-1] = scores[1:] != scores[:-1]
+        precision = tp / np.arange(1, len(scores) + 1)[:, None]
+        recall = _safe_divide(tp, np.broadcast_to(self.support, tp.shape))
+        # recall nondecreases down a column, so the recall of the previous kept point is the running max of the kept recalls above
+        previous_recall = np.zeros_like(recall)
+        previous_recall[1:] = np.maximum.accumulate(np.where(last_of_ties, recall, 0.0), axis=0)[:-1]
+        average_precision = np.where(last_of_ties, (recall - previous_recall) * precision, 0.0).sum(axis=0)
+
+        self._average_precision = np.where(self.support > 0, average_precision, np.nan)
+        return self._average_precision
+
+    def mean_average_precision(self) -> float:
+        average_precision = self.average_precision()
+        average_precision = average_precision[~np.isnan(average_precision)]
+        return float(average_precision.mean()) if len(average_precision) else 0.0
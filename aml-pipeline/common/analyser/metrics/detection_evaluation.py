@@ -0,0 +1,223 @@
+from typing import Dict, Sequence
+
+import numpy as np
+
+# COCO evaluation parameters
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+MAX_DETECTIONS = 100
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray, crowd: np.ndarray = None) -> np.ndarray:
+    """
+    IoU of [x, y, width, height] boxes, computed on the broadcast of the leading dimensions: pass (n, 4) and (n, 4) arrays for the IoU of
+    each pair of rows, or boxes_a[:, None] and boxes_b[None] for the (n, m) IoU matrix. Where crowd is true, boxes_b is a crowd region and, as
+    in pycocotools, the intersection is divided by the area of boxes_a alone.
+    """
+
+    boxes_a = np.asarray(boxes_a, dtype=np.float64)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64)
+    width = np.minimum(boxes_a[..., 0] + boxes_a[..., 2], boxes_b[..., 0] + boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0])
+    height = np.minimum(boxes_a[..., 1] + boxes_a[..., 3], boxes_b[..., 1] + boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area_a = boxes_a[..., 2] * boxes_a[..., 3]
+    union = area_a + boxes_b[..., 2] * boxes_b[..., 3] - intersection
+    if crowd is not None:
+        union = np.where(crowd, area_a, union)
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def _segment_starts(keys: np.ndarray) -> np.ndarray:
+    # start of each run of equal values of a sorted array
+    return np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+
+
+class DetectionEvaluation:
+    """
+    COCO style object detection evaluation (all areas, pycocotools' COCOeval with useCats=1), vectorised to scale to millions of boxes:
+
+    - the IoU is only computed for the (detection, ground truth box) pairs of the same image and category, all pairs at once
+    - the greedy matching of COCO is sequential within an image and category, detections by decreasing score each taking the unmatched box of
+      highest IoU, but independent across them: it runs in rounds, round r matching the r-th detection of every image and category together,
+      so the number of numpy passes is bounded by max_detections rather than the number of boxes
+    - precision / recall curves of all categories are accumulated in single cumulative sums
+
+    Crowd ground truth boxes are ignored as in COCO: they do not count in the recall, and a detection that matches no other box but overlaps a
+    crowd box by the IoU threshold (intersection over the detection's area) is neither a true nor a false positive. A crowd box can absorb any
+    number of detections.
+
+    Args:
+        gt_image, gt_category, gt_boxes: image index, category index and [x, y, width, height] box of each ground truth box
+        dt_image, dt_category, dt_boxes, dt_scores: image index, category index, box and confidence of each detection
+        n_categories: number of categories, category indices are in [0, n_categories)
+        iou_thresholds: IoU thresholds of the matching, [.5:.05:.95] by default
+        max_detections: highest scoring detections kept per image and category
+        gt_crowd: whether each ground truth box is a crowd region, none is by default
+    """
+
+    def __init__(
+        self,
+        gt_image: np.ndarray,
+        gt_category: np.ndarray,
+        gt_boxes: np.ndarray,
+        dt_image: np.ndarray,
+        dt_category: np.ndarray,
+        dt_boxes: np.ndarray,
+        dt_scores: np.ndarray,
+        n_categories: int,
+        iou_thresholds: Sequence[float] = IOU_THRESHOLDS,
+        max_detections: int = MAX_DETECTIONS,
+        gt_crowd: np.ndarray = None,
+    ):
+        self.iou_thresholds = np.asarray(iou_thresholds, dtype=np.float64)
+        self.n_categories = n_categories
+        gt_image = np.asarray(gt_image, dtype=np.int64)
+        gt_category = np.asarray(gt_category, dtype=np.int64)
+        dt_image = np.asarray(dt_image, dtype=np.int64)
+        dt_category = np.asarray(dt_category, dtype=np.int64)
+        dt_scores = np.asarray(dt_scores, dtype=np.float64)
+        gt_crowd = np.zeros(len(gt_image), dtype=bool) if gt_crowd is None else np.asarray(gt_crowd, dtype=bool)
+
+        # detections by image and category, then decreasing score, keeping the first max_detections of each
+        dt_group = dt_image * n_categories + dt_category
+        order = np.lexsort((-dt_scores, dt_group))
+        dt_group = dt_group[order]
+        starts = _segment_starts(dt_group)
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        keep = rank < max_detections
+        order, dt_group, rank = order[keep], dt_group[keep], rank[keep]
+        self._dt_category = dt_category[order]
+        self._dt_image = dt_image[order]
+        self._dt_scores = dt_scores[order]
+        self._dt_rank = rank
+
+        # ground truth boxes by image and category, and the range of boxes of the group of each detection
+        gt_group = gt_image * n_categories + gt_category
+        gt_order = np.argsort(gt_group, kind="stable")
+        gt_group = gt_group[gt_order]
+        gt_start = np.searchsorted(gt_group, dt_group, side="left")
+        gt_count = np.searchsorted(gt_group, dt_group, side="right") - gt_start
+        self.n_gt = np.bincount(gt_category[~gt_crowd], minlength=n_categories)
+        gt_crowd = gt_crowd[gt_order]
+
+        # every (detection, ground truth box) pair of the same image and category, ordered by round, detection and ground truth box
+        pair_dt = np.repeat(np.arange(len(order)), gt_count)
+        pair_offset = np.arange(len(pair_dt)) - np.repeat(np.cumsum(gt_count) - gt_count, gt_count)
+        pair_gt = np.repeat(gt_start, gt_count) + pair_offset
+        by_round = np.argsort(rank[pair_dt], kind="stable")
+        pair_dt, pair_gt = pair_dt[by_round], pair_gt[by_round]
+        pair_crowd = gt_crowd[pair_gt]
+        pair_iou = box_iou(np.asarray(dt_boxes, dtype=np.float64)[order][pair_dt], np.asarray(gt_boxes, dtype=np.float64)[gt_order][pair_gt],
+                           pair_crowd)
+        round_bounds = np.searchsorted(rank[pair_dt], np.arange(max_detections + 1), side="left")
+
+        # tp[t, d]: whether detection d matches a ground truth box at IoU threshold t
+        self._tp = np.zeros((len(self.iou_thresholds), len(order)), dtype=bool)
+        rounds = []
+        for begin, end in zip(round_bounds[:-1], round_bounds[1:]):
+            if begin == end:
+                continue
+            round_dt = pair_dt[begin:end]
+            segment_starts = _segment_starts(round_dt)
+            rounds.append((round_dt, pair_gt[begin:end], pair_iou[begin:end], pair_crowd[begin:end], segment_starts,
+                           np.diff(np.r_[segment_starts, end - begin])))
+
+        # ignored[t, d]: whether detection d only matches crowd boxes at IoU threshold t
+        self._ignored = np.zeros_like(self._tp)
+        for t, threshold in enumerate(self.iou_thresholds):
+            matched_gt = np.zeros(len(gt_group), dtype=bool)
+            for round_dt, round_gt, round_iou, round_crowd, segment_starts, segment_lengths in rounds:
+                # crowd boxes are only matched by the detections that match no other box
+                candidate_iou = np.where((round_iou >= threshold) & ~matched_gt[round_gt] & ~round_crowd, round_iou, -1.0)
+                best = np.flatnonzero((candidate_iou >= 0) & (candidate_iou == np.repeat(np.maximum.reduceat(candidate_iou, segment_starts), segment_lengths)))
+                # pycocotools keeps the last of equally good boxes
+                best_dt = round_dt[best]
+                best = best[np.r_[best_dt[1:] != best_dt[:-1], True]] if len(best) else best
+                matched_gt[round_gt[best]] = True
+                self._tp[t, round_dt[best]] = True
+                crowd_dt = round_dt[(round_iou >= threshold) & round_crowd]
+                self._ignored[t, crowd_dt] = ~self._tp[t, crowd_dt]
+
+        self._average_precision = None
+
+    def average_precision(self) -> np.ndarray:
+        """(IoU thresholds x categories) average precision, interpolated at 101 recall points, NaN for categories without ground truth boxes."""
+
+        if self._average_precision is not None:
+            return self._average_precision
+
+        # detections of each category by decreasing score, ties in image order, as pycocotools accumulates them
+        order = np.lexsort((self._dt_rank, self._dt_image, -self._dt_scores, self._dt_category))
+        category = self._dt_category[order]
+        starts = _segment_starts(category)
+        lengths = np.diff(np.r_[starts, len(order)])
+        n_gt = np.maximum(self.n_gt[category], 1)
+        bounds = list(zip(category[starts].tolist(), starts.tolist(), (starts + lengths).tolist()))
+
+        average_precision = np.zeros((len(self.iou_thresholds), self.n_categories))
+        for t, (tp, ignored) in enumerate(zip(self._tp, self._ignored)):
+            tp = tp[order]
+            counted = ~ignored[order]
+            tp_sum = np.cumsum(tp)
+            tp_sum -= np.repeat(tp_sum[starts] - tp[starts], lengths)
+            counted_sum = np.cumsum(counted)
+            counted_sum -= np.repeat(counted_sum[starts] - counted[starts], lengths)
+            recall = tp_sum / n_gt
+            # ignored detections repeat the previous point, 0 precision before the first counted detection as in pycocotools
+            precision = np.divide(tp_sum, counted_sum, out=np.zeros(len(order)), where=counted_sum > 0)
+            for c, begin, end in bounds:
+                # precision envelope, then the precision at the first point reaching each recall threshold, 0 when it is never reached
+                envelope = np.maximum.accumulate(precision[begin:end][::-1])[::-1]
+                index = np.searchsorted(recall[begin:end], RECALL_THRESHOLDS, side="left")
+                average_precision[t, c] = envelope[index[index < end - begin]].sum() / len(RECALL_THRESHOLDS)
+
+        average_precision[:, self.n_gt == 0] = np.nan
+        self._average_precision = average_precision
+        return average_precision
+
+    def recall(self) -> np.ndarray:
+        """(IoU thresholds x categories) recall of the kept detections, NaN for categories without ground truth boxes."""
+
+        tp_per_category = np.stack([np.bincount(self._dt_category[tp], minlength=self.n_categories) for tp in self._tp]) if len(self._tp) else \
+            np.zeros((0, self.n_categories))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n_gt > 0, tp_per_category / self.n_gt, np.nan)
+
+    def _threshold_index(self, iou_threshold: float) -> int:
+        index = np.flatnonzero(np.isclose(self.iou_thresholds, iou_threshold))
+        if not len(index):
+            raise ValueError(f"IoU threshold {iou_threshold} is not one of the evaluated thresholds {self.iou_thresholds.tolist()}")
+        return int(index[0])
+
+    @staticmethod
+    def _mean(values: np.ndarray) -> float:
+        values = values[~np.isnan(values)]
+        return float(values.mean()) if len(values) else 0.0
+
+    def mean_average_precision(self, iou_threshold: float = None) -> float:
+        """mAP over the categories with ground truth boxes, averaged over all IoU thresholds when iou_threshold is None."""
+
+        average_precision = self.average_precision()
+        if iou_threshold is not None:
+            average_precision = average_precision[self._threshold_index(iou_threshold)]
+        return self._mean(average_precision)
+
+    def mean_recall(self, iou_threshold: float) -> float:
+        return self._mean(self.recall()[self._threshold_index(iou_threshold)])
+
+    def per_class(self, iou_thresholds: Sequence[float] = (0.5, 0.75)) -> Dict[int, Dict[str, float]]:
+        """{category index: {ap, ap_<iou>, recall_<iou>, n_gt}}, NaN metrics of categories without ground truth boxes as None."""
+
+        average_precision = self.average_precision()
+        recall = self.recall()
+        # columns of categories without ground truth boxes are all NaN
+        columns = {"ap": average_precision.mean(axis=0)}
+        for iou_threshold in iou_thresholds:
+            t = self._threshold_index(iou_threshold)
+            columns[f"ap_{round(iou_threshold * 100)}"] = average_precision[t]
+            columns[f"recall_{round(iou_threshold * 100)}"] = recall[t]
+
+        return {
+            c: dict({name: None if np.isnan(values[c]) else float(values[c]) for name, values in columns.items()}, n_gt=int(self.n_gt[c]))
+            for c in range(self.n_categories)
+        }
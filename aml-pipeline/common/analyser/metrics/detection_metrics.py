@@ -0,0 +1,110 @@
+import os
+import time
+from typing import Any, Dict
+
+import mlflow
+from loguru import logger as logging
+
+from common.analyser.metrics.detection_evaluation import IOU_THRESHOLDS, MAX_DETECTIONS, DetectionEvaluation
+from common.analyser.metrics.metric_calculator import MetricCalculator
+from common.analyser.parsers.detection_parser import DetectionParser
+
+
+class DetectionMetrics(MetricCalculator):
+    """
+    COCO style object detection metrics: mAP@[.5:.95], and mAP and recall at each of the fixed IoU thresholds, overall and per category.
+
+    params:
+        fixed_iou_thresholds: IoU thresholds of the mAP_<iou> and recall_<iou> metrics, [0.5, 0.75] by default
+        iou_thresholds: IoU thresholds averaged in mAP, [.5:.05:.95] by default, must include the fixed thresholds
+        max_detections: highest scoring detections kept per image and category, 100 by default
+    """
+
+    def __init__(
+        self,
+        ground_truth: Dict[str, Any],
+        predictions: Dict[str, Any],
+        params: Dict[str, Any],
+        verbose: bool = False,
+    ):
+        self._metrics = {}
+        self.fixed_iou_thresholds = params.get("fixed_iou_thresholds", [0.5, 0.75])
+        self.iou_thresholds = params.get("iou_thresholds", IOU_THRESHOLDS)
+        self.max_detections = params.get("max_detections", MAX_DETECTIONS)
+        super().__init__(
+            ground_truth=ground_truth, predictions=predictions, verbose=verbose
+        )
+
+    def validate_input(self):
+
+        super().validate_input()
+
+        # check that predictions file has object detection predictions
+        if "object_detection" not in self.predictions["predictions"]:
+            msg = "no object detection predictions were found in predictions file"
+            logging.error(msg)
+            raise KeyError(msg)
+
+        # check that the fixed thresholds are evaluated
+        for threshold in self.fixed_iou_thresholds:
+            if not any(abs(threshold - x) < 1e-9 for x in self.iou_thresholds):
+                msg = f"fixed IoU threshold {threshold} is not one of the evaluated iou_thresholds"
+                logging.error(msg)
+                raise ValueError(msg)
+
+        return True
+
+    def parse_input(self):
+        return DetectionParser(ground_truth=self.ground_truth, predictions=self.predictions, verbose=self._verbose).parse()
+
+    def calculate(self):
+
+        input_valid = self.validate_input()
+        metrics = {}
+        if input_valid:
+            parsed = self.parse_input()
+
+            evaluation = DetectionEvaluation(
+                gt_image=parsed.gt_image,
+                gt_category=parsed.gt_category,
+                gt_boxes=parsed.gt_boxes,
+                gt_crowd=parsed.gt_crowd,
+                dt_image=parsed.dt_image,
+                dt_category=parsed.dt_category,
+                dt_boxes=parsed.dt_boxes,
+                dt_scores=parsed.dt_scores,
+                n_categories=len(parsed.labels),
+                iou_thresholds=self.iou_thresholds,
+                max_detections=self.max_detections,
+            )
+            metrics["mAP"] = evaluation.mean_average_precision()
+            for threshold in self.fixed_iou_thresholds:
+                metrics[f"mAP_{round(threshold * 100)}"] = evaluation.mean_average_precision(threshold)
+                metrics[f"recall_{round(threshold * 100)}"] = evaluation.mean_recall(threshold)
+
+            per_class = evaluation.per_class(self.fixed_iou_thresholds)
+            metrics["per_class"] = {name: per_class[c] for c, name in enumerate(parsed.label_names)}
+
+            self._metrics = metrics
+
+        return self._metrics
+
+    def mlflow_log(self, log_path: str, log_name: str = "detection_metrics"):
+
+        max_retries = 5
+        retry_delay = 3
+
+        retries = 0
+        while retries < max_retries:
+            try:
+                if log_name.endswith(".json"):
+                    mlflow.log_dict(self._metrics, os.path.join(log_path, log_name))
+                else:
+                    mlflow.log_dict(self._metrics, os.path.join(log_path, log_name+".json"))
+                break
+            except Exception as e:
+                logging.warning(
+                    f"Failed to log to MLflow. Retrying in {retry_delay} seconds. Error: {e}"
+                )
+                time.sleep(retry_delay)
+                retries += 1
@@ -0,0 +1,86 @@
+import os
+import time
+from typing import Any, Dict
+
+import mlflow
+from loguru import logger as logging
+
+from common.analyser.metrics.confusion_metrics import MultilabelConfusionMetrics
+from common.analyser.metrics.metric_calculator import MetricCalculator
+from common.analyser.parsers.classification_parser import MultilabelClassificationParser
+
+
+class MultilabelClassificationMetrics(MetricCalculator):
+    """
+    Multi-label classification metrics: mAP over the score matrix, and subset accuracy, macro and micro precision, recall and f1 of the
+    categories scored at least params["threshold"] (0.5 by default).
+    """
+
+    def __init__(
+        self,
+        ground_truth: Dict[str, Any],
+        predictions: Dict[str, Any],
+        params: Dict[str, Any],
+        verbose: bool = False,
+    ):
+        self._metrics = {}
+        self.threshold = params.get("threshold", 0.5)
+        super().__init__(
+            ground_truth=ground_truth, predictions=predictions, verbose=verbose
+        )
+
+    def validate_input(self):
+
+        super().validate_input()
+
+        # check that predictions file has classification predictions
+        if "classification" not in self.predictions["predictions"]:
+            msg = "no classification predictions were found in predictions file"
+            logging.error(msg)
+            raise KeyError(msg)
+
+        return True
+
+    def parse_input(self):
+        return MultilabelClassificationParser.parse_cached(ground_truth=self.ground_truth, predictions=self.predictions)
+
+    def calculate(self):
+
+        input_valid = self.validate_input()
+        metrics = {}
+        if input_valid:
+            y_true, y_score, labels, img_list = self.parse_input()
+
+            confusion = MultilabelConfusionMetrics(y_true=y_true, y_score=y_score, threshold=self.threshold)
+            metrics["mAP"] = confusion.mean_average_precision()
+            metrics["subset_accuracy"] = confusion.subset_accuracy()
+            metrics["precision"] = confusion.precision()
+            metrics["recall"] = confusion.recall()
+            metrics["f1"] = confusion.f1()
+            metrics["precision_micro"] = confusion.precision("micro")
+            metrics["recall_micro"] = confusion.recall("micro")
+            metrics["f1_micro"] = confusion.f1("micro")
+
+            self._metrics = metrics
+
+        return self._metrics
+
+    def mlflow_log(self, log_path: str, log_name: str = "multilabel_classification_metrics"):
+
+        max_retries = 5
+        retry_delay = 3
+
+        retries = 0
+        while retries < max_retries:
+            try:
+                if log_name.endswith(".json"):
+                    mlflow.log_dict(self._metrics, os.path.join(log_path, log_name))
+                else:
+                    mlflow.log_dict(self._metrics, os.path.join(log_path, log_name+".json"))
+                break
+            except Exception as e:
+                logging.warning(
+                    f"Failed to log to MLflow. Retrying in {retry_delay} seconds. Error: {e}"
+                )
+                time.sleep(retry_delay)
+                retries += 1
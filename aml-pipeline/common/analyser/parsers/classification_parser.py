@@ -1,10 +1,34 @@
-from common.analyser.parsers.parser_base import Parser
-from typing import Any, Dict
+from itertools import chain
+from operator import itemgetter
+from common.analyser.parsers.parser_base import IdentityCache, Parser
+from typing import Any, Dict, List, NamedTuple, Tuple
 
+import numpy as np
 from loguru import logger as logging
 
 
+class ParsedClassification(NamedTuple):
+    """
+    y_true: true category id of each prediction, as a predictions category id
+    y_pred: predicted (highest score) category id of each prediction
+    y_score: (predictions x categories) score matrix, columns in labels order, 0 for categories without a score
+    labels: sorted predictions category ids
+    img_list: file names of the ground truth images
+    """
+
+    y_true: np.ndarray
+    y_pred: np.ndarray
+    y_score: np.ndarray
+    labels: List[int]
+    img_list: List[str]
+
+
 class ClassificationParser(Parser):
+    # parsed results of the last (ground truth, predictions) pair, shared by the calculators run on the same inputs, one entry per parser class
+    _cache = IdentityCache(size=2)
+    # ground truth index, shared by the parses of all the predictions evaluated against the same ground truth
+    _ground_truth_cache = IdentityCache(size=1)
+
     def __init__(
         self,
         ground_truth: Dict[str, Any],
@@ -16,71 +40,148 @@ class ClassificationParser(Parser):
         self.ground_truth = ground_truth
         self.predictions = predictions
 
-    def parse(self):
-
-        gt_categories = self.ground_truth["categories"]
-        gt_annotations = self.ground_truth["annotations"]
-        gt_images = self.ground_truth["images"]
-
-        img_list = [x["file_name"] for x in gt_images]
-
-        # gt dict {category_id: category_name}
-        gt_categories_dict = dict([(x["id"], x["name"]) for x in gt_categories])
-
-        # gt dict {img_id: file_name}
-        gt_images_dict = dict([(x["id"], x["file_name"]) for x in gt_images])
+    @classmethod
+    def parse_cached(cls, ground_truth: Dict[str, Any], predictions: Dict[str, Any]) -> ParsedClassification:
+        """
+        Parse, or return the result of a previous parse of the same ground truth and predictions objects. The returned arrays are read only. The
+        inputs must not be mutated once parsed, or the caches cleared after mutating them.
+        """
+
+        def parse():
+            parsed = cls(ground_truth=ground_truth, predictions=predictions).parse()
+            for array in parsed:
+                if isinstance(array, np.ndarray):
+                    array.setflags(write=False)
+            return parsed
+
+        return cls._cache.get((ground_truth, predictions), parse, tag=cls)
+
+    @classmethod
+    def _ground_truth_index(cls, ground_truth: Dict[str, Any]) -> Tuple[List[str], List[Tuple[str, str]], Dict[str, str]]:
+        """
+        (file names of the images, (image file name, category name) of each annotation, {image file name: category name}) of the ground truth,
+        built once per ground truth object.
+        """
+
+        def index():
+            img_list = [x["file_name"] for x in ground_truth["images"]]
+            # gt dict {category_id: category_name}
+            gt_categories_dict = dict([(x["id"], x["name"]) for x in ground_truth["categories"]])
+            # gt dict {img_id: file_name}
+            gt_images_dict = dict([(x["id"], x["file_name"]) for x in ground_truth["images"]])
+            annotations = [(gt_images_dict[x["image_id"]], gt_categories_dict[x["category_id"]]) for x in ground_truth["annotations"]]
+            return img_list, annotations, dict(annotations)
+
+        return cls._ground_truth_cache.get((ground_truth,), index)
+
+    @staticmethod
+    def _score_matrix(classification_predictions: List[Dict[str, Any]], labels: List[int]) -> np.ndarray:
+        n = len(classification_predictions)
+
+        # all scores flattened in one pass, then scattered into the matrix, columns found by binary search in the sorted labels
+        counts = np.fromiter((len(x["scores"]) for x in classification_predictions), dtype=np.int64, count=n)
+        all_scores = list(chain.from_iterable(x["scores"] for x in classification_predictions))
+        category_ids = np.fromiter(map(itemgetter("category_id"), all_scores), dtype=np.int64, count=len(all_scores))
+        scores = np.fromiter(map(itemgetter("score"), all_scores), dtype=np.float64, count=len(all_scores))
+        labels_array = np.asarray(labels, dtype=np.int64)
+        columns = np.searchsorted(labels_array, category_ids)
+        if not np.array_equal(labels_array[np.minimum(columns, len(labels) - 1)], category_ids):
+            msg = "predictions scores refer to categories missing in predictions categories"
+            logging.error(msg)
+            raise KeyError(msg)
+
+        y_score = np.zeros((n, len(labels)), dtype=np.float64)
+        y_score[np.repeat(np.arange(n), counts), columns] = scores
+
+        return y_score
+
+    def parse(self) -> ParsedClassification:
 
         # gt dict {image_name: category_name}
-        gt_annotations_dict = dict(
-            [
-                (gt_images_dict[x["image_id"]], gt_categories_dict[x["category_id"]])
-                for x in gt_annotations
-            ]
+        img_list, _, gt_annotations_dict = self._ground_truth_index(self.ground_truth)
+
+        # predictions dict {category_name: category_id}
+        predictions_categories_reverse_dict = dict(
+            [(x["name"], x["id"]) for x in self.predictions["categories"]]
         )
 
-        predictions_images = self.predictions["images"]
-        predictions_categories = self.predictions["categories"]
+        labels = sorted(predictions_categories_reverse_dict.values())
 
         # predictions dict {img_id: img_name}
         predictions_images_dict = dict(
-            [(x["id"], x["name"]) for x in predictions_images]
+            [(x["id"], x["name"]) for x in self.predictions["images"]]
         )
 
+        classification_predictions = self.predictions["predictions"]["classification"]
+        n = len(classification_predictions)
+        y_score = self._score_matrix(classification_predictions, labels)
+        labels_array = np.asarray(labels, dtype=np.int64)
+        y_pred = labels_array[y_score.argmax(axis=1)] if len(labels) else np.empty(0, dtype=np.int64)
+
+        y_true = np.fromiter(
+            (
+                predictions_categories_reverse_dict[gt_annotations_dict[predictions_images_dict[x["image_id"]]]]
+                for x in classification_predictions
+            ),
+            dtype=np.int64,
+            count=n,
+        )
+
+        if self._verbose:
+            logging.info(f"parsed {n} classification predictions over {len(labels)} categories")
+
+        return ParsedClassification(y_true, y_pred, y_score, labels, img_list)
+
+
+class ParsedMultilabelClassification(NamedTuple):
+    """
+    y_true: (predictions x categories) 0/1 matrix of the ground truth categories of each prediction, columns in labels order
+    y_score: (predictions x categories) score matrix, columns in labels order, 0 for categories without a score
+    labels: sorted predictions category ids
+    img_list: file names of the ground truth images
+    """
+
+    y_true: np.ndarray
+    y_score: np.ndarray
+    labels: List[int]
+    img_list: List[str]
+
+
+class MultilabelClassificationParser(ClassificationParser):
+    """Classification parser keeping every ground truth category of an image, images without annotations have none."""
+
+    def parse(self) -> ParsedMultilabelClassification:
+
+        img_list, gt_annotations, _ = self._ground_truth_index(self.ground_truth)
+
         # predictions dict {category_name: category_id}
         predictions_categories_reverse_dict = dict(
-            [(x["name"], x["id"]) for x in predictions_categories]
+            [(x["name"], x["id"]) for x in self.predictions["categories"]]
         )
+        labels = sorted(predictions_categories_reverse_dict.values())
+
+        predictions_images_dict = dict([(x["id"], x["name"]) for x in self.predictions["images"]])
+
+        classification_predictions = self.predictions["predictions"]["classification"]
+        n = len(classification_predictions)
+        y_score = self._score_matrix(classification_predictions, labels)
+
+        # rows of the predictions of each image name, then one (row, column) pair per ground truth annotation
+        rows_by_image = {}
+        for row, x in enumerate(classification_predictions):
+            rows_by_image.setdefault(predictions_images_dict[x["image_id"]], []).append(row)
+        columns_by_category = {category_id: column for column, category_id in enumerate(labels)}
+        rows, columns = [], []
+        for image_name, category_name in gt_annotations:
+            column = columns_by_category[predictions_categories_reverse_dict[category_name]]
+            for row in rows_by_image.get(image_name, ()):
+                rows.append(row)
+                columns.append(column)
+
+        y_true = np.zeros((n, len(labels)), dtype=np.int8)
+        y_true[np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)] = 1
+
+        if self._verbose:
+            logging.info(f"parsed {n} multi-label classification predictions over {len(labels)} categories")
 
-        labels = sorted(list(predictions_categories_reverse_dict.values()))
-
-        y_true = []
-        y_pred = []
-        y_score = []
-        for classification_prediction in self.predictions["predictions"][
-            "classification"
-        ]:
-            id_sorted_scores = sorted(
-                classification_prediction["scores"],
-                key=lambda d: d["category_id"],
-                reverse=False,
-            )
-            y_score.append([x["score"] for x in id_sorted_scores])
-
-            score_sorted_scores = sorted(
-                classification_prediction["scores"],
-                key=lambda d: d["score"],
-                reverse=True,
-            )
-            predicted_category = score_sorted_scores[0]["category_id"]
-            y_pred.append(predicted_category)
-
-            image_file_name = predictions_images_dict[
-                classification_prediction["image_id"]
-            ]
-            image_true_category_name = gt_annotations_dict[image_file_name]
-            true_category_id_predictions = predictions_categories_reverse_dict[
-                image_true_category_name
-            ]
-            y_true.append(true_category_id_predictions)
-
-        return y_true, y_pred, y_score, labels, img_list
\ No newline at end of file
+        return ParsedMultilabelClassification(y_true, y_score, labels, img_list)
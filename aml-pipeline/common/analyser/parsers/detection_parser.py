@@ -0,0 +1,145 @@
+from operator import itemgetter
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+from loguru import logger as logging
+
+from common.analyser.parsers.parser_base import IdentityCache, Parser
+
+
+class ParsedDetection(NamedTuple):
+    """
+    gt_image, dt_image: index in img_list of the image of each ground truth box and detection
+    gt_category, dt_category: index in labels of the category of each ground truth box and detection
+    gt_boxes, dt_boxes: (boxes x 4) [x, y, width, height] arrays
+    gt_crowd: whether each ground truth box is a crowd annotation
+    dt_scores: confidence of each detection
+    labels: sorted predictions category ids
+    label_names: name of each category of labels
+    img_list: file names of the ground truth images
+    """
+
+    gt_image: np.ndarray
+    gt_category: np.ndarray
+    gt_boxes: np.ndarray
+    gt_crowd: np.ndarray
+    dt_image: np.ndarray
+    dt_category: np.ndarray
+    dt_boxes: np.ndarray
+    dt_scores: np.ndarray
+    labels: List[int]
+    label_names: List[str]
+    img_list: List[str]
+
+
+def _boxes(items: List[Dict[str, Any]]) -> np.ndarray:
+    return np.array(list(map(itemgetter("bbox"), items)), dtype=np.float64).reshape(len(items), 4)
+
+
+def _indices(ids: np.ndarray, index_by_id: Dict[int, int], what: str) -> np.ndarray:
+    try:
+        return np.fromiter((index_by_id[x] for x in ids.tolist()), dtype=np.int64, count=len(ids))
+    except KeyError as e:
+        msg = f"{what} {e.args[0]} not found"
+        logging.error(msg)
+        raise KeyError(msg) from None
+
+
+class _GroundTruthIndex(NamedTuple):
+    img_list: List[str]
+    image_index: np.ndarray
+    # category ids of the boxes, as their distinct values and the index of each box's value in them
+    category_ids: np.ndarray
+    category_inverse: np.ndarray
+    boxes: np.ndarray
+    crowd: np.ndarray
+    category_names: Dict[int, str]
+
+
+class DetectionParser(Parser):
+    """
+    Parses COCO ground truth boxes and detections in the COCO results format, predictions["predictions"]["object_detection"] being a list of
+    {"image_id", "category_id", "bbox": [x, y, width, height], "score"} with the image and category ids of the predictions file. Boxes of the
+    ground truth and the detections must use the same units (both normalized or both in pixels). Crowd annotations ("iscrowd": 1) are ignored
+    in the evaluation, as in COCO.
+    """
+
+    # ground truth index, shared by the parses of all the predictions evaluated against the same ground truth, which must not be mutated
+    _ground_truth_cache = IdentityCache(size=1)
+
+    def __init__(
+        self,
+        ground_truth: Dict[str, Any],
+        predictions: Dict[str, Any],
+        verbose: bool = False,
+        **kwargs,
+    ):
+        super().__init__(verbose)
+        self.ground_truth = ground_truth
+        self.predictions = predictions
+
+    @classmethod
+    def _ground_truth_index(cls, ground_truth: Dict[str, Any]) -> _GroundTruthIndex:
+        """Boxes of the ground truth as read only arrays, built once per ground truth object."""
+
+        def index():
+            gt_images = ground_truth["images"]
+            gt_annotations = [x for x in ground_truth["annotations"] if x.get("bbox") is not None]
+            img_list = [x["file_name"] for x in gt_images]
+            image_index_by_id = {x["id"]: i for i, x in enumerate(gt_images)}
+            image_ids = np.fromiter(map(itemgetter("image_id"), gt_annotations), dtype=np.int64, count=len(gt_annotations))
+            category_ids, category_inverse = np.unique(
+                np.fromiter(map(itemgetter("category_id"), gt_annotations), dtype=np.int64, count=len(gt_annotations)), return_inverse=True
+            )
+            gt = _GroundTruthIndex(
+                img_list=img_list,
+                image_index=_indices(image_ids, image_index_by_id, "ground truth image id"),
+                category_ids=category_ids,
+                category_inverse=category_inverse.reshape(-1),
+                boxes=_boxes(gt_annotations),
+                crowd=np.fromiter((bool(x.get("iscrowd", 0)) for x in gt_annotations), dtype=bool, count=len(gt_annotations)),
+                category_names={x["id"]: x["name"] for x in ground_truth["categories"]},
+            )
+            # shared by every parse, so read only
+            for array in (gt.image_index, gt.category_ids, gt.category_inverse, gt.boxes, gt.crowd):
+                array.setflags(write=False)
+            return gt
+
+        return cls._ground_truth_cache.get((ground_truth,), index)
+
+    def parse(self) -> ParsedDetection:
+
+        gt = self._ground_truth_index(self.ground_truth)
+        detections = self.predictions["predictions"]["object_detection"]
+        image_index_by_name = {name: i for i, name in enumerate(gt.img_list)}
+        predictions_image_index = {x["id"]: image_index_by_name.get(x["name"], -1) for x in self.predictions["images"]}
+
+        # predictions categories are the labels, ground truth categories are matched to them by name
+        predictions_categories = sorted(self.predictions["categories"], key=itemgetter("id"))
+        labels = [x["id"] for x in predictions_categories]
+        label_names = [x["name"] for x in predictions_categories]
+        column_by_name = {name: column for column, name in enumerate(label_names)}
+        predictions_category_index = {category_id: column for column, category_id in enumerate(labels)}
+
+        gt_category_columns = np.array([column_by_name.get(gt.category_names.get(x), -1) for x in gt.category_ids.tolist()], dtype=np.int64)
+        gt_category = gt_category_columns[gt.category_inverse]
+        if (gt_category < 0).any():
+            msg = "ground truth boxes refer to categories missing in predictions categories"
+            logging.error(msg)
+            raise KeyError(msg)
+
+        dt_image = _indices(np.fromiter(map(itemgetter("image_id"), detections), dtype=np.int64, count=len(detections)), predictions_image_index,
+                            "predictions image id")
+        if (dt_image < 0).any():
+            msg = "detections refer to images missing in ground truth"
+            logging.error(msg)
+            raise KeyError(msg)
+        dt_category = _indices(np.fromiter(map(itemgetter("category_id"), detections), dtype=np.int64, count=len(detections)),
+                               predictions_category_index, "predictions category id")
+        dt_scores = np.fromiter(map(itemgetter("score"), detections), dtype=np.float64, count=len(detections))
+
+        if self._verbose:
+            logging.info(f"parsed {len(gt.boxes)} ground truth boxes and {len(detections)} detections over {len(labels)} categories")
+
+        return ParsedDetection(gt.image_index, gt_category, gt.boxes, gt.crowd, dt_image, dt_category, _boxes(detections), dt_scores, labels, label_names,
+                               gt.img_list)
@@ -1,8 +1,41 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
 
 from loguru import logger as logging
 
 
+class IdentityCache:
+    """
+    Least recently used cache of values computed from objects, keyed by the identity of the objects rather than their (possibly large, or
+    unhashable) content. The cache pins the objects, so their ids cannot be reused by other objects while cached, and keeps them alive until
+    they are evicted: keep size small for large objects.
+
+    The objects must not be mutated while cached, a value computed before the mutation would be returned: call clear() after mutating them.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._entries = OrderedDict()
+
+    def get(self, objects: Tuple[Any, ...], create: Callable[[], Any], tag: Hashable = None) -> Any:
+        key = (tag,) + tuple(id(x) for x in objects)
+        entry = self._entries.get(key)
+        if entry is not None and all(a is b for a, b in zip(entry[0], objects)):
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        value = create()
+        self._entries[key] = (objects, value)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
 class Parser(ABC):
     def __init__(self, verbose=False, **kwargs):
         self._verbose = verbose
@@ -2,7 +2,6 @@ import argparse
 import os
 import logging
 import json
-import time
 import pandas as pd
 
 logging.getLogger().setLevel(logging.INFO)
@@ -15,14 +14,115 @@ from cognitive_service_vision_model_customization_python_samples import (
     ModelKind,
     TrainingParameters,
     PredictionClient,
+    PredictionCache,
 )
 from datetime import datetime
-from helper import create_barplot, aml_to_uvs_dataset, get_secret, str2bool, read_img_as_bytes, mlflow_safe_log
+from helper import create_barplot, aml_to_uvs_dataset, get_secret, str2bool, mlflow_safe_log
 
 from common.analyser.metrics.classification_metrics import ClassificationMetrics
 from common.analyser.error_analysis.classification_analysis import ClassificationAnalysis
 
 
+def predict_dataset(
+    prediction_client: PredictionClient,
+    model_name: str,
+    inference_data_path: str,
+    ground_truth: dict,
+    prediction_concurrency: int = 4,
+    prediction_rate_limit: float = 10,
+):
+    """
+    Predict the images of a COCO ground truth. Images whose prediction failed are excluded from the metrics: they are left out of the
+    predictions, and of the returned ground truth, so that the calculators see the same images on both sides.
+
+    Returns:
+        (ground truth of the predicted images, predictions in the analyser format, inference results of each predicted image)
+    """
+    model_predictions_results = {}
+
+    # images and categories in prediction format
+    inference_images = ground_truth["images"]
+    model_predictions_results["images"] = [dict((("id", x["id"]), ("name", x["file_name"]))) for x in inference_images]
+    model_predictions_results["categories"] = ground_truth["categories"]
+    predictions_categories_reverse_dict = dict(
+        [(x["name"], x["id"]) for x in model_predictions_results["categories"]]
+    )
+    predictions_images_reverse_dict = dict(
+        [(x["name"], x["id"]) for x in model_predictions_results["images"]]
+    )
+    ####
+    inference_results = []
+    categories_dict = dict([(x["id"], x["name"]) for x in model_predictions_results["categories"]])
+    inference_annotations = ground_truth["annotations"]
+    annotations_dict = dict([(x["image_id"], categories_dict[x["category_id"]]) for x in inference_annotations])
+    ####
+    model_predictions = []
+    failed_image_ids = set()
+
+    img_paths = [os.path.join(inference_data_path, img["file_name"]) for img in inference_images]
+    batch_results = prediction_client.predict_many(model_name, img_paths, concurrency=prediction_concurrency, rate_limit=prediction_rate_limit, content_type="image/png")
+    for i, (img, batch_result) in enumerate(zip(inference_images, batch_results)):
+        if not batch_result.ok:
+            logging.warning(f"Prediction failed for image {img['file_name']}, it will be excluded from the metrics. Error: {batch_result.error}")
+            failed_image_ids.add(img["id"])
+            continue
+
+        img_file_name = img["file_name"]
+        # getting the predictions and select the one class with the highest confidence
+        prediction_json = batch_result.result
+        predictions = prediction_json['customModelResult']['tagsResult']['values']
+
+        tmp_model_prediction = {}
+        tmp_model_prediction["prediction_id"] = i
+        tmp_model_prediction["image_id"] = predictions_images_reverse_dict[img_file_name]
+        scores = []
+        for cat in predictions:
+            tmp_score = {}
+            tmp_score["category_id"] = predictions_categories_reverse_dict[cat["name"]]
+            tmp_score["score"] = cat["confidence"]
+            scores.append(tmp_score)
+
+        tmp_model_prediction["scores"] = scores
+
+        model_predictions.append(tmp_model_prediction)
+        ######
+        # sort predictions by label to make downstream tasks easier
+        predictions = sorted(
+            predictions,
+            key=lambda d: d['name'], reverse=False)
+        # sort predictions by confidence
+        top_1_prediction = sorted(
+            predictions,
+            key=lambda d: d['confidence'], reverse=True)[0]
+
+        img_inference_results = {
+            "image_id": img["id"],
+            "image_name": img["file_name"],
+            "true_category": annotations_dict[img["id"]],
+            "pred_category": top_1_prediction['name'],
+            "confidence": top_1_prediction['confidence'],
+            "predictions": predictions
+        }
+        inference_results.append(img_inference_results)
+        ######
+
+    model_predictions_results["predictions"] = {"classification": model_predictions}
+
+    if failed_image_ids and len(failed_image_ids) == len(inference_images):
+        raise RuntimeError(f"All {len(inference_images)} predictions failed")
+    if failed_image_ids:
+        logging.warning(f"{len(failed_image_ids)} of {len(inference_images)} predictions failed")
+        # the calculators read the images list of the ground truth alongside the predictions, in the same order
+        ground_truth = dict(
+            ground_truth,
+            images=[x for x in inference_images if x["id"] not in failed_image_ids],
+            annotations=[x for x in inference_annotations if x["image_id"] not in failed_image_ids],
+        )
+        model_predictions_results["images"] = [x for x in model_predictions_results["images"] if x["id"] not in failed_image_ids]
+
+    return ground_truth, model_predictions_results, inference_results
+
+
 def run(
     resource_key: str,
     model_name: str,
@@ -31,7 +131,10 @@ def run(
     time_budget_in_hours: int = 20,  # 20 hours
     inference: bool = False,
     inference_data_path: str = "",
-    coco_json_url: str = ""
+    coco_json_url: str = "",
+    prediction_concurrency: int = 4,
+    prediction_rate_limit: float = 10,
+    prediction_cache_path: str = "",
 ):
     if not os.path.exists("outputs/"):
         os.makedirs("outputs/")
@@ -124,11 +227,11 @@ def run(
     mlflow.log_metrics(model_metrics)
 
     if inference:
-        model_predictions_results = {}
-
         # initialize UVS prediction client
+        # predictions of images already seen by the same model are read from the cache instead of calling the service again
+        prediction_cache = PredictionCache(prediction_cache_path) if prediction_cache_path else None
         prediction_client = PredictionClient(
-            resource_type, resource_name, multi_service_endpoint, resource_key
+            resource_type, resource_name, multi_service_endpoint, resource_key, cache=prediction_cache
         )
         # read annotation json file and check if there are multiple ones
         json_files_list = [file for file in os.listdir(inference_data_path) if file.endswith('.json')]
@@ -138,69 +241,9 @@ def run(
             raise FileNotFoundError('No annotation json file was found in dataset folder')
         inference_coco_annotation_file = json.load(open(os.path.join(inference_data_path, json_files_list[0])))
 
-        # images and categories in prediction format
-        inference_images = inference_coco_annotation_file["images"]
-        model_predictions_results["images"] = [dict((("id", x["id"]), ("name", x["file_name"]))) for x in inference_images]
-        model_predictions_results["categories"] = inference_coco_annotation_file["categories"]
-        predictions_categories_reverse_dict = dict(
-            [(x["name"], x["id"]) for x in model_predictions_results["categories"]]
-        )
-        predictions_images_reverse_dict = dict(
-            [(x["name"], x["id"]) for x in model_predictions_results["images"]]
+        ground_truth, model_predictions_results, inference_results = predict_dataset(
+            prediction_client, model_name, inference_data_path, inference_coco_annotation_file, prediction_concurrency, prediction_rate_limit
         )
-        ####
-        inference_results = []
-        categories_dict = dict([(x["id"], x["name"]) for x in model_predictions_results["categories"]])
-        inference_annotations = inference_coco_annotation_file["annotations"]
-        annotations_dict = dict([(x["image_id"], categories_dict[x["category_id"]]) for x in inference_annotations])
-        ####
-        model_predictions = []
-
-        for i, img in enumerate(inference_images):
-
-            img_file_name = img["file_name"]
-            img_path = os.path.join(inference_data_path, img_file_name)
-            img_bytes = read_img_as_bytes(img_path)
-            # getting the predictions and select the one class with the highest confidence
-            prediction_json = prediction_client.predict(model_name, img_bytes, content_type="image/png")
-            predictions = prediction_json['customModelResult']['tagsResult']['values']
-
-            tmp_model_prediction = {}
-            tmp_model_prediction["prediction_id"] = i
-            tmp_model_prediction["image_id"] = predictions_images_reverse_dict[img_file_name]
-            scores = []
-            for cat in predictions:
-                tmp_score = {}
-                tmp_score["category_id"] = predictions_categories_reverse_dict[cat["name"]]
-                tmp_score["score"] = cat["confidence"]
-                scores.append(tmp_score)
-
-            tmp_model_prediction["scores"] = scores
-
-            model_predictions.append(tmp_model_prediction)
-            ######
-            # sort predictions by label to make downstream tasks easier
-            predictions = sorted(
-                predictions,
-                key=lambda d: d['name'], reverse=False)
-            # sort predictions by confidence
-            top_1_prediction = sorted(
-                predictions,
-                key=lambda d: d['confidence'], reverse=True)[0]
-
-            img_inference_results = {
-                "image_id": img["id"],
-                "image_name": img["file_name"],
-                "true_category": annotations_dict[img["id"]],
-                "pred_category": top_1_prediction['name'],
-                "confidence": top_1_prediction['confidence'],
-                "predictions": predictions
-            }
-            inference_results.append(img_inference_results)
-            time.sleep(10)
-            ######
-
-        model_predictions_results["predictions"] = {"classification": model_predictions}
         print("###############")        
         df_inf_results = pd.DataFrame.from_records(inference_results)
         df_inf_results.to_csv("outputs/test_results.csv", index=False)
@@ -209,14 +252,14 @@ def run(
         # Select the number of top classes you want to calculate
         # Read more here: https://medium.com/nanonets/evaluating-models-using-the-top-n-accuracy-metrics-c0355b36f91b
         top_k_list = [2] # Selected 2 because we only have 2 classes in the dataset
-        classification_metrics = ClassificationMetrics(ground_truth=inference_coco_annotation_file,
+        classification_metrics = ClassificationMetrics(ground_truth=ground_truth,
                                                        predictions=model_predictions_results,
                                                        params={"top_k_list": top_k_list})
         metrics = classification_metrics.calculate()
         mlflow.log_metrics(metrics)
         classification_metrics.mlflow_log(log_path="mlflow_logs")
 
-        classification_analysis = ClassificationAnalysis(ground_truth=inference_coco_annotation_file,
+        classification_analysis = ClassificationAnalysis(ground_truth=ground_truth,
                                                          predictions=model_predictions_results,
                                                          params={"dataset_base_path": inference_data_path})
 
@@ -281,6 +324,24 @@ def parse_args():
         help="Full url to coco json file for training dataset",
         default=""
     )
+    parser.add_argument(
+        "--prediction_concurrency",
+        type=int,
+        help="Number of prediction requests in flight during inference",
+        default=4
+    )
+    parser.add_argument(
+        "--prediction_rate_limit",
+        type=float,
+        help="Max prediction requests per second during inference, set it to the TPS quota of the UVS resource",
+        default=10
+    )
+    parser.add_argument(
+        "--prediction_cache_path",
+        type=str,
+        help="SQLite file caching predictions across runs, empty to disable caching",
+        default=""
+    )
 
     args = parser.parse_args()
     return args
@@ -296,5 +357,8 @@ if __name__ == "__main__":
         time_budget_in_hours=args.time_budget_in_hours,
         inference=args.inference,
         inference_data_path=args.inference_data_path,
-        coco_json_url=args.coco_json_url
+        coco_json_url=args.coco_json_url,
+        prediction_concurrency=args.prediction_concurrency,
+        prediction_rate_limit=args.prediction_rate_limit,
+        prediction_cache_path=args.prediction_cache_path,
     )
@@ -1,15 +1,18 @@
 from .clients import TrainingClient, DatasetClient, PredictionClient, EvaluationClient, ImageCompositionClient, PlanogramComplianceClient, \
-    ProductRecognitionClient, ResourceType
+    ProductRecognitionClient, ResourceType, SessionConfig, create_session, configure_shared_session, BatchResult, TokenBucket, AimdRateLimiter, RetryPolicy, JobWatcher, \
+    ImagePreprocessor, PredictionCache, MetricsSink, HistogramCollector, OpenTelemetrySink
 from .models import Dataset, AnnotationKind, ModelStatus, Model, ModelResponse, ModelKind, TrainingParameters, EvaluationParameters, EvaluationStatus, Evaluation, \
     EvaluationResponse, Authentication, AuthenticationKind, ImageStitchingRequest, ImageRectificationRequest, NormalizedCoordinate, ImageRectificationControlPoints, \
     PlanogramMatchingRequest, PlanogramMatchingResponse, ProductRecognition, ProductRecognitionResponse, ProductRecognitionStatus
-from .data import check_coco_annotation_file, export_data, Purpose
+from .data import check_coco_annotation_file, check_coco_annotation_file_streaming, check_coco_annotation_files, CocoCheckResult, export_data, Purpose
 from .tools import select_four_corners, convert_to_control_points_format, visualize_matching_result, visualize_planogram, visualize_recognition_result
 
 __all__ = ['DatasetClient', 'TrainingClient', 'PredictionClient', 'EvaluationClient', 'ImageCompositionClient', 'PlanogramComplianceClient', 'ProductRecognitionClient',
-           'ResourceType', 'Dataset', 'AnnotationKind', 'Authentication', 'AuthenticationKind',
+           'ResourceType', 'SessionConfig', 'create_session', 'configure_shared_session', 'BatchResult', 'TokenBucket', 'AimdRateLimiter', 'RetryPolicy', 'JobWatcher',
+           'ImagePreprocessor', 'PredictionCache', 'MetricsSink', 'HistogramCollector', 'OpenTelemetrySink',
+           'Dataset', 'AnnotationKind', 'Authentication', 'AuthenticationKind',
            'ModelStatus', 'Model', 'ModelResponse', 'ModelKind', 'TrainingParameters', 'EvaluationParameters', 'EvaluationStatus', 'Evaluation', 'EvaluationResponse',
            'ImageStitchingRequest', 'ImageRectificationRequest', 'NormalizedCoordinate', 'ImageRectificationControlPoints',
            'PlanogramMatchingRequest', 'PlanogramMatchingResponse', 'ProductRecognition', 'ProductRecognitionResponse', 'ProductRecognitionStatus',
-           'check_coco_annotation_file', 'export_data', 'Purpose',
+           'check_coco_annotation_file', 'check_coco_annotation_file_streaming', 'check_coco_annotation_files', 'CocoCheckResult', 'export_data', 'Purpose',
            'select_four_corners', 'convert_to_control_points_format', 'visualize_matching_result', 'visualize_planogram', 'visualize_recognition_result']
@@ -5,6 +5,16 @@ from .evaluation_client import EvaluationClient
 from .image_composition_client import ImageCompositionClient
 from .planogram_compliance_client import PlanogramComplianceClient
 from .product_recognition_client import ProductRecognitionClient
-from .client import ResourceType
+from .common import ResourceType
+from .session import SessionConfig, create_session, configure_shared_session
+from .batch import BatchResult
+from .rate_limit import TokenBucket, AimdRateLimiter
+from .retry import RetryPolicy
+from .job_watcher import JobWatcher
+from .preprocessing import ImagePreprocessor
+from .cache import PredictionCache
+from .metrics import MetricsSink, HistogramCollector, OpenTelemetrySink
 
-__all__ = ['TrainingClient', 'DatasetClient', 'PredictionClient', 'EvaluationClient', 'ImageCompositionClient', 'PlanogramComplianceClient', 'ProductRecognitionClient', 'ResourceType']
+__all__ = ['TrainingClient', 'DatasetClient', 'PredictionClient', 'EvaluationClient', 'ImageCompositionClient', 'PlanogramComplianceClient', 'ProductRecognitionClient', 'ResourceType',
+           'SessionConfig', 'create_session', 'configure_shared_session', 'BatchResult', 'TokenBucket', 'AimdRateLimiter', 'RetryPolicy', 'JobWatcher', 'ImagePreprocessor', 'PredictionCache',
+           'MetricsSink', 'HistogramCollector', 'OpenTelemetrySink']
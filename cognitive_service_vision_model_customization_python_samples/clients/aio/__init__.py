@@ -0,0 +1,11 @@
+from .training_client import TrainingClient
+from .dataset_client import DatasetClient
+from .prediction_client import PredictionClient
+from .evaluation_client import EvaluationClient
+from .image_composition_client import ImageCompositionClient
+from .planogram_compliance_client import PlanogramComplianceClient
+from .product_recognition_client import ProductRecognitionClient
+from .session import create_session, close_shared_session
+
+__all__ = ['TrainingClient', 'DatasetClient', 'PredictionClient', 'EvaluationClient', 'ImageCompositionClient', 'PlanogramComplianceClient', 'ProductRecognitionClient',
+           'create_session', 'close_shared_session']
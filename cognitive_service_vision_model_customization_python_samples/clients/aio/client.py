@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from ..common import construct_endpoint
+from ..image_source import body_length, is_replayable, stream_position
+from ..metrics import MetricsSink
+from ..rate_limit import AimdRateLimiter
+from ..retry import RetryPolicy, endpoint_label, parse_retry_after
+from .session import get_shared_session
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def _iter_chunks(body):
+    if isinstance(body, memoryview):
+        for offset in range(0, body.nbytes, UPLOAD_CHUNK_SIZE):
+            yield bytes(body[offset:offset + UPLOAD_CHUNK_SIZE])
+        return
+
+    # files, streams and blobs block on read, so each chunk is read in the loop's default executor
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, body.read, UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _to_content(body, headers: dict):
+    """httpx request content and headers for a body opened by open_image, streamed in chunks unless it is already in memory as bytes."""
+
+    if body is None or isinstance(body, (bytes, str)):
+        return body, headers
+    if isinstance(body, bytearray):
+        return bytes(body), headers
+
+    length = body_length(body)
+    if length is not None:
+        headers = dict(headers, **{'Content-Length': str(length)})
+    return _iter_chunks(body), headers
+
+
+class _PhaseTrace:
+    """httpx trace extension adding up the durations of the httpcore connection events into the phases of metrics.PHASES."""
+
+    _PHASES = {
+        'connection.connect_tcp': 'connect',
+        'connection.start_tls': 'connect',
+        'http11.send_request_headers': 'send',
+        'http11.send_request_body': 'send',
+        'http11.receive_response_headers': 'wait',
+        'http11.receive_response_body': 'download',
+        'http2.send_request_headers': 'send',
+        'http2.send_request_body': 'send',
+        'http2.receive_response_headers': 'wait',
+        'http2.receive_response_body': 'download',
+    }
+
+    def __init__(self) -> None:
+        self.phases = {}
+        self._started = {}
+
+    async def __call__(self, event_name: str, info: dict) -> None:
+        event, _, stage = event_name.rpartition('.')
+        phase = self._PHASES.get(event)
+        if phase is None:
+            return
+
+        if stage == 'started':
+            self._started[event] = time.perf_counter()
+        elif event in self._started:
+            self.phases[phase] = self.phases.get(phase, 0) + time.perf_counter() - self._started.pop(event)
+
+
+class Client:
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, api_version: str='2023-04-01-preview', session: httpx.AsyncClient = None,
+                 retry_policy: RetryPolicy = None, rate_limiter: AimdRateLimiter = None, metrics: MetricsSink = None) -> None:
+        self._endpoint = construct_endpoint(resource_type, resource_name, multi_service_endpoint)
+        self._headers = {'Ocp-Apim-Subscription-Key': resource_key}
+        self._params = {'api-version': api_version}
+        self._session = session
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._rate_limiter = rate_limiter
+        self._metrics = metrics
+
+    @property
+    def session(self) -> httpx.AsyncClient:
+        # the shared session can only be created inside a running event loop, so it is looked up on first use
+        return self._session or get_shared_session()
+
+    def _construct_url(self, path):
+        return self._endpoint + '/' + path
+
+    def _get_json_response(self, response: httpx.Response, path):
+        if not response.is_success:
+            logger.error(response.content)
+        response.raise_for_status()
+
+        start = time.perf_counter()
+        json_response = response.json()
+        if self._metrics:
+            self._metrics.observe('parse', time.perf_counter() - start, response.request.method, endpoint_label(path), str(response.status_code))
+        logger.debug('Response: %s', json_response)
+        return json_response
+
+    async def _request(self, method: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        if not self._metrics:
+            return await self.session.request(method, url, **kwargs)
+
+        trace = _PhaseTrace()
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            response = await self.session.request(method, url, extensions={'trace': trace}, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            for phase, seconds in trace.phases.items():
+                self._metrics.observe(phase, seconds, method, endpoint, status)
+            self._metrics.observe('total', time.perf_counter() - start, method, endpoint, status)
+
+    async def _send(self, method: str, path: str, idempotent: bool = None, **kwargs) -> httpx.Response:
+        url = self._construct_url(path)
+        endpoint = endpoint_label(path)
+        body = kwargs.pop('data', None)
+        body_position = stream_position(body)
+        max_retries = self._retry_policy.max_retries if is_replayable(body) else 0
+        attempt = 0
+        while True:
+            if self._rate_limiter:
+                delay = self._rate_limiter.reserve(endpoint)
+                await asyncio.sleep(delay)
+                if self._metrics:
+                    self._metrics.observe('rate_limit', delay, method, endpoint, 'none')
+            if attempt and body_position is not None:
+                body.seek(body_position)
+            content, headers = _to_content(body, kwargs.get('headers') or {})
+
+            try:
+                response = await self._request(method, url, endpoint, content=content, **dict(kwargs, headers=headers))
+            except httpx.TransportError as e:
+                if attempt >= max_retries or not self._retry_policy.is_retryable(method, None, idempotent):
+                    raise
+                delay = self._retry_policy.get_backoff(attempt)
+                logger.warning(f'{method} {endpoint} failed with {e!r}, retrying in {delay:.2f} seconds.')
+            else:
+                if self._rate_limiter:
+                    if response.status_code == 429:
+                        self._rate_limiter.on_throttle(endpoint)
+                    elif response.is_success:
+                        self._rate_limiter.on_success(endpoint)
+
+                if response.is_success or attempt >= max_retries or not self._retry_policy.is_retryable(method, response.status_code, idempotent):
+                    return response
+                delay = self._retry_policy.get_backoff(attempt, parse_retry_after(response.headers))
+                logger.warning(f'{method} {endpoint} returned {response.status_code}, retrying in {delay:.2f} seconds.')
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def request_get(self, path):
+        r = await self._send('GET', path, params=self._params, headers=self._headers)
+        return self._get_json_response(r, path)
+
+    async def request_put(self, path, json=None, data=None, content_type=None, idempotent: bool = None):
+        headers = dict(self._headers, **{'Content-Type': content_type}) if content_type else self._headers
+
+        r = await self._send('PUT', path, idempotent=idempotent, json=json, params=self._params, data=data, headers=headers)
+        return self._get_json_response(r, path)
+
+    async def request_post(self, path, params=None, data=None, content_type=None, idempotent: bool = None):
+        assert data is None or content_type
+
+        params = params or {}
+        headers = dict(self._headers, **{'Content-Type': content_type}) if content_type else self._headers
+        r = await self._send('POST', path, idempotent=idempotent, data=data, params=dict(self._params, **params), headers=headers)
+
+        if r.headers.get('Content-Type', None) == 'image/jpeg':
+            return r.content
+
+        return self._get_json_response(r, path)
+
+    async def request_patch(self, path, json):
+        r = await self._send('PATCH', path, json=json, params=self._params, headers=self._headers)
+        return self._get_json_response(r, path)
+
+    async def request_delete(self, path):
+        r = await self._send('DELETE', path, params=self._params, headers=self._headers)
+        if not r.is_success:
+            logger.error(r.content)
+        r.raise_for_status()
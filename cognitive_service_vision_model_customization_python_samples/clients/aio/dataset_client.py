@@ -0,0 +1,20 @@
+from .client import Client
+from ...models import Dataset, DatasetResponse
+
+
+class DatasetClient(Client):
+    async def register_dataset(self, dataset: Dataset) -> Dataset:
+        response_json = await self.request_put(f'datasets/{dataset.name}', json=dataset.params)
+        return DatasetResponse.from_response(response_json)
+
+    async def query_dataset(self, dataset_name: str) -> Dataset:
+        assert dataset_name and isinstance(dataset_name, str)
+        response_json = await self.request_get(f'datasets/{dataset_name}')
+        return DatasetResponse.from_response(response_json)
+
+    async def update_dataset(self, dataset: Dataset) -> Dataset:
+        response_json = await self.request_patch(f'datasets/{dataset.name}', json=dataset.params)
+        return DatasetResponse.from_response(response_json)
+
+    async def delete_dataset(self, dataset_name: str):
+        await self.request_delete(f'datasets/{dataset_name}')
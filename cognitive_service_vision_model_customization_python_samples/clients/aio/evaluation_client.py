@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import time
+
+from .client import Client
+from ...models import EvaluationResponse, Evaluation, EvaluationStatus
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationClient(Client):
+    async def evaluate(self, evaluation: Evaluation) -> EvaluationResponse:
+        json_response = await self.request_put(f'/models/{evaluation.model_name}/evaluations/{evaluation.name}', json=evaluation.params)
+        return EvaluationResponse.from_response(json_response)
+
+    async def query_run(self, name, model_name) -> EvaluationResponse:
+        json_response = await self.request_get(f'/models/{model_name}/evaluations/{name}')
+        return EvaluationResponse.from_response(json_response)
+
+    async def wait_for_completion(self, name: str, model_name: str, check_wait_in_secs: int = 60) -> EvaluationResponse:
+        start_time = time.time()
+        total_elapsed = 0
+        while True:
+            eval_run = await self.query_run(name, model_name)
+            status = eval_run.status
+            if status in [EvaluationStatus.FAILED, EvaluationStatus.SUCCEEDED]:
+                break
+            await asyncio.sleep(check_wait_in_secs)
+            total_elapsed = time.time() - start_time
+            logger.info(f'Evaluation {name} running for {total_elapsed} seconds. Status {status}.')
+
+        logger.info(f'Evaluation finished with state {eval_run.status}.')
+
+        if eval_run.status == EvaluationStatus.FAILED:
+            logger.warning(f'Evaluation failed: {eval_run.error}.')
+        else:
+            logger.info(f'Wall-clock time {total_elapsed / 60} minutes.')
+            logger.info(f'Model performance: {eval_run.model_performance}')
+
+        return eval_run
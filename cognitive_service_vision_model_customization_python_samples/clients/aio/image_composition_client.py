@@ -0,0 +1,15 @@
+import json
+import logging
+
+from .client import Client
+from ...models import ImageStitchingRequest, ImageRectificationRequest
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCompositionClient(Client):
+    async def stitch_images(self, request: ImageStitchingRequest) -> bytes:
+        return await self.request_post('/imagecomposition:stitch', data=json.dumps(request.to_dict()), content_type='application/json', idempotent=True)
+
+    async def rectify_image(self, request: ImageRectificationRequest) -> bytes:
+        return await self.request_post('/imagecomposition:rectify', data=json.dumps(request.to_dict()), content_type='application/json', idempotent=True)
@@ -0,0 +1,13 @@
+import logging
+import json
+
+from .client import Client
+from ...models import PlanogramMatchingRequest, PlanogramMatchingResponse
+
+logger = logging.getLogger(__name__)
+
+
+class PlanogramComplianceClient(Client):
+    async def match_planogram(self, request: PlanogramMatchingRequest) -> PlanogramMatchingResponse:
+        json_response = await self.request_post('/planogramcompliance:match', data=json.dumps(request.to_dict()), content_type='application/json', idempotent=True)
+        return PlanogramMatchingResponse.from_response(json_response)
@@ -0,0 +1,21 @@
+from .client import Client
+from ..image_source import ImageSource, open_image
+from ..preprocessing import ImagePreprocessor
+
+
+class PredictionClient(Client):
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, preprocessor: ImagePreprocessor = None, **kwargs) -> None:
+        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key, **kwargs)
+        self._preprocessor = preprocessor
+
+    async def predict(self, model_name: str, img: ImageSource, content_type='image/jpeg'):
+        if self._preprocessor:
+            shrunk = await self._preprocessor.shrink_async(img)
+            if shrunk.data is not None:
+                json_response = await self.request_post('imageanalysis:analyze', params={'model-name': model_name}, data=shrunk.data, content_type='image/jpeg', idempotent=True)
+                return shrunk.restore_coordinates(json_response)
+            # streams and blobs were read by the preprocessor
+            img = shrunk.source
+
+        with open_image(img) as body:
+            return await self.request_post('imageanalysis:analyze', params={'model-name': model_name}, data=body, content_type=content_type, idempotent=True)
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+
+from .client import Client
+from ..image_source import ImageSource, open_image
+from ..preprocessing import ImagePreprocessor, restore_coordinates
+from ...models import ProductRecognition, ProductRecognitionResponse, ProductRecognitionStatus
+
+logger = logging.getLogger(__name__)
+
+
+class ProductRecognitionClient(Client):
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, preprocessor: ImagePreprocessor = None, **kwargs) -> None:
+        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key, **kwargs)
+        self._preprocessor = preprocessor
+        self._shrunk_runs = {}
+
+    async def create_run(self, run: ProductRecognition, img: ImageSource, content_type='image/jpeg') -> ProductRecognitionResponse:
+        shrunk = await self._preprocessor.shrink_async(img) if self._preprocessor else None
+        if shrunk is not None and shrunk.data is not None:
+            json_response = await self.request_put(f'/productrecognition/{run.model_name}/runs/{run.name}', data=shrunk.data, content_type='image/jpeg')
+            # only the sizes are kept, not the image, once the run is created
+            self._shrunk_runs[(run.model_name, run.name)] = (shrunk.original_size, shrunk.size)
+        else:
+            # streams and blobs were read by the preprocessor
+            img = shrunk.source if shrunk is not None else img
+            with open_image(img) as body:
+                json_response = await self.request_put(f'/productrecognition/{run.model_name}/runs/{run.name}', data=body, content_type=content_type)
+        return self._restore_coordinates(ProductRecognitionResponse.from_response(json_response))
+
+    async def query_run(self, name, model_name) -> ProductRecognitionResponse:
+        json_response = await self.request_get(f'/productrecognition/{model_name}/runs/{name}')
+        return self._restore_coordinates(ProductRecognitionResponse.from_response(json_response))
+
+    async def delete_run(self, name, model_name) -> None:
+        await self.request_delete(f'/productrecognition/{model_name}/runs/{name}')
+        self._shrunk_runs.pop((model_name, name), None)
+
+    def _restore_coordinates(self, run: ProductRecognitionResponse) -> ProductRecognitionResponse:
+        sizes = self._shrunk_runs.get((run.model_name, run.name))
+        if sizes is not None:
+            run.result = restore_coordinates(run.result, *sizes)
+        return run
+
+    async def wait_for_completion(self, name: str, model_name: str, check_wait_in_secs: int = 2) -> ProductRecognitionResponse:
+        start_time = time.time()
+        total_elapsed = 0
+        while True:
+            run = await self.query_run(name, model_name)
+            status = run.status
+            if status in [ProductRecognitionStatus.FAILED, ProductRecognitionStatus.SUCCEEDED]:
+                break
+            await asyncio.sleep(check_wait_in_secs)
+            total_elapsed = time.time() - start_time
+            logger.info(f'Product recognition running {name} for {total_elapsed} seconds. Status {status}.')
+
+        logger.info(f'Product recognition finished with state {run.status}.')
+
+        if run.status == ProductRecognitionStatus.FAILED:
+            logger.warning(f'Product recognition failed: {run.error}.')
+        else:
+            logger.info(f'Wall-clock time {total_elapsed / 60} minutes.')
+            logger.info(f'Product recognition result: {run.result}')
+
+        return run
@@ -0,0 +1,48 @@
+import asyncio
+import weakref
+
+import httpx
+
+from ..session import SessionConfig
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_session(config: SessionConfig = None, transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """
+    Create an async HTTP session with a pooled, keep-alive connection limit. HTTP/2 is negotiated when the h2 package is installed.
+
+    transport: transport to use instead of the default network one, e.g. httpx.MockTransport in tests
+    """
+
+    config = config or SessionConfig()
+    max_connections = config.pool_connections * config.pool_maxsize
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections if config.keep_alive else 0)
+    headers = None if config.keep_alive else {'Connection': 'close'}
+
+    return httpx.AsyncClient(limits=limits, http2=_http2_available(), transport=transport, headers=headers, timeout=None)
+
+
+# async sessions are bound to the event loop they were first used on, so the shared one is kept per loop
+_shared_sessions: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]' = weakref.WeakKeyDictionary()
+
+
+def get_shared_session() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    session = _shared_sessions.get(loop)
+    if session is None or session.is_closed:
+        session = _shared_sessions[loop] = create_session()
+
+    return session
+
+
+async def close_shared_session() -> None:
+    session = _shared_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.aclose()
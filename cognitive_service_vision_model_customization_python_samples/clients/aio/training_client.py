@@ -0,0 +1,82 @@
+import asyncio
+import time
+import logging
+from typing import Tuple, Any
+
+from .client import Client
+from ...models import Model, ModelResponse, ModelStatus, Evaluation, EvaluationStatus, EvaluationResponse
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingClient(Client):
+    async def train_model(self, model: Model) -> ModelResponse:
+        json_response = await self.request_put(f'models/{model.name}', json=model.params)
+        return ModelResponse.from_response(json_response)
+
+    async def query_model(self, name: str) -> ModelResponse:
+        json_response = await self.request_get(f'models/{name}')
+        return ModelResponse.from_response(json_response)
+
+    async def cancel_model_training(self, name: str):
+        await self.request_post(f'models/{name}:cancel')
+
+    async def delete_model(self, name: str):
+        await self.request_delete(f'models/{name}')
+
+    async def evaluate_model(self, evaluation: Evaluation):
+        await self.request_put(f'models/{evaluation.model_name}/evaluations/{evaluation.name}', json=evaluation.params)
+
+    async def query_model_evaluation(self, model_name: str, evaluation_name: str) -> EvaluationResponse:
+        json_response = await self.request_get(f'models/{model_name}/evaluations/{evaluation_name}')
+        return EvaluationResponse.from_response(json_response)
+
+    async def delete_model_evaluation(self, model_name: str, evaluation_name: str):
+        await self.request_delete(f'models/{model_name}/evaluations/{evaluation_name}')
+
+    async def wait_for_training_completion(self, model_name, check_wait_in_secs: int = 60) -> ModelResponse:
+        async def query():
+            model = await self.query_model(model_name)
+            return model, model.status
+
+        model, total_elapsed = await self._wait_for_completion(query, [ModelStatus.FAILED, ModelStatus.SUCCEEDED, ModelStatus.CANCELLED], check_wait_in_secs)
+
+        logger.info(f'Training finished with status {model.status}.')
+
+        if model.status == ModelStatus.FAILED:
+            logger.warning(f'Training failed: {model.error}')
+        else:
+            logger.info(f'Wall-clock time {total_elapsed / 60} minutes, actual training compute time billed {model.training_cost_in_minutes} minutes.')
+            logger.info(f'Model performance: {model.model_performance}')
+
+        return model
+
+    async def wait_for_evaluation_completion(self, model_name, evaluation_name, check_wait_in_secs: int = 60) -> EvaluationResponse:
+        async def query():
+            evaluation = await self.query_model_evaluation(model_name, evaluation_name)
+            return evaluation, evaluation.status
+
+        evaluation, total_elapsed = await self._wait_for_completion(query, [EvaluationStatus.FAILED, EvaluationStatus.SUCCEEDED], check_wait_in_secs)
+
+        logger.info(f'Evaluation finished with status {evaluation.status}.')
+
+        if evaluation.status == EvaluationStatus.FAILED:
+            logger.warning(f'Evaluation failed: {evaluation.error.code}, {evaluation.error.message}')
+        else:
+            logger.info(f'Wall-clock time {total_elapsed} seconds.')
+            logger.info(f'Model performance: {evaluation.model_performance}')
+
+        return evaluation
+
+    async def _wait_for_completion(self, query, ending_states, check_wait_in_secs: int = 60) -> Tuple[Any, float]:
+        start_time = time.time()
+        total_elapsed = 0
+        while True:
+            entity, status = await query()
+            if status in ending_states:
+                break
+            await asyncio.sleep(check_wait_in_secs)
+            total_elapsed = time.time() - start_time
+            logger.info(f'waiting for {total_elapsed} seconds. Status {status}.')
+
+        return entity, total_elapsed
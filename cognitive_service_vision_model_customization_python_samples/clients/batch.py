@@ -0,0 +1,76 @@
+import concurrent.futures
+import dataclasses
+import itertools
+import typing
+
+from .rate_limit import TokenBucket
+
+
+@dataclasses.dataclass
+class BatchResult:
+    """
+    Outcome of one item of a batch call. Exactly one of result and error is set.
+
+    index: position of the item in the input iterable
+    item: the input item, e.g. an image path
+    """
+
+    index: int
+    item: typing.Any
+    result: typing.Any = None
+    error: typing.Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _run_item(func, rate_limiter: typing.Optional[TokenBucket], index: int, item) -> BatchResult:
+    if rate_limiter:
+        rate_limiter.acquire()
+
+    try:
+        return BatchResult(index, item, result=func(item))
+    except Exception as e:
+        return BatchResult(index, item, error=e)
+
+
+def run_batch(func: typing.Callable, items: typing.Iterable, concurrency: int = 8, rate_limiter: TokenBucket = None, ordered: bool = True) -> typing.Iterator[BatchResult]:
+    """
+    Call `func` on every item with a bounded thread pool and yield a BatchResult per item, in input order or as they complete.
+
+    Items are pulled lazily, at most 2 * concurrency items are in flight or waiting to be yielded, so arbitrarily long iterables run in bounded memory.
+    Exceptions raised by `func` are captured in BatchResult.error instead of aborting the batch.
+    """
+
+    assert concurrency > 0
+
+    window = 2 * concurrency
+    items = iter(enumerate(items))
+    pending = set()
+    completed = {}
+    next_index = 0
+
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        try:
+            while True:
+                for index, item in itertools.islice(items, max(0, window - len(pending) - len(completed))):
+                    pending.add(executor.submit(_run_item, func, rate_limiter, index, item))
+
+                if not pending:
+                    break
+
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    batch_result = future.result()
+                    if ordered:
+                        completed[batch_result.index] = batch_result
+                    else:
+                        yield batch_result
+
+                while next_index in completed:
+                    yield completed.pop(next_index)
+                    next_index += 1
+        finally:
+            for future in pending:
+                future.cancel()
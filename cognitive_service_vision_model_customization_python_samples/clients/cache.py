@@ -0,0 +1,147 @@
+import collections
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionCache:
+    """
+    Content addressed cache of prediction and product recognition results, so byte-identical images are not sent to the service twice for the same
+    model and API version.
+
+    Results are kept in an in-memory LRU of `max_memory_entries` entries, and, if `path` is given, in a SQLite database at `path` shared across runs
+    and processes. The database is kept under `max_disk_bytes` by evicting the least recently used entries. Entries older than `ttl` seconds are
+    treated as missing and purged, None to keep them until evicted.
+    """
+
+    def __init__(self, path: str = None, max_memory_entries: int = 1024, max_disk_bytes: int = 1 << 30, ttl: float = None) -> None:
+        assert max_memory_entries >= 0
+        assert max_disk_bytes > 0
+        assert ttl is None or ttl > 0
+
+        self._max_memory_entries = max_memory_entries
+        self._max_disk_bytes = max_disk_bytes
+        self._ttl = ttl
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, '
+                             'accessed REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_created ON entries (created)')
+            self._disk_bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+
+            row = self._db.execute('SELECT value, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self._expired(created, now):
+                self._delete(key)
+                return None
+
+            self._db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self._remember(key, value, created)
+            return json.loads(value)
+
+    def put(self, key: str, value: Any) -> None:
+        """value: json serializable result"""
+
+        serialized = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._remember(key, serialized, now)
+            if self._db is None:
+                return
+
+            size = len(serialized)
+            previous = self._db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)', (key, serialized, size, now, now))
+            self._disk_bytes += size - (previous[0] if previous else 0)
+            if self._ttl is not None:
+                self._purge_expired(now)
+            if self._disk_bytes > self._max_disk_bytes:
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM entries')
+                self._disk_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self._ttl is not None and now - created > self._ttl
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        if self._max_memory_entries == 0:
+            return
+
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _delete(self, key: str) -> None:
+        row = self._db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._disk_bytes -= row[0]
+
+    def _purge_expired(self, now: float) -> None:
+        deleted = self._db.execute('DELETE FROM entries WHERE created < ?', (now - self._ttl,)).rowcount
+        if deleted:
+            self._refresh_disk_bytes()
+
+    def _evict(self) -> None:
+        # other processes may have written to the same database, start from the actual size
+        self._refresh_disk_bytes()
+        evicted = []
+        for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY accessed'):
+            if self._disk_bytes <= self._max_disk_bytes:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._db.executemany('DELETE FROM entries WHERE key = ?', evicted)
+        logger.debug('Evicted %d cached results.', len(evicted))
+
+    def _refresh_disk_bytes(self) -> None:
+        self._disk_bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
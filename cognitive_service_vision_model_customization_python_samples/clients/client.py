@@ -1,66 +1,146 @@
 import logging
-import urllib.parse
+import time
 import requests
-from ..clients.common import ResourceType
+from ..clients.common import construct_endpoint
+from ..clients.image_source import is_replayable, stream_position
+from ..clients.metrics import MetricsSink, track_phases
+from ..clients.rate_limit import AimdRateLimiter
+from ..clients.retry import RetryPolicy, endpoint_label, parse_retry_after
+from ..clients.session import get_shared_session
 
 logger = logging.getLogger(__name__)
 
 
 class Client:
-    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, api_version: str='2023-04-01-preview') -> None:
-        resource_type = ResourceType(resource_type) if isinstance(resource_type, str) else resource_type
-
-        if resource_type == ResourceType.MULTI_SERVICE_RESOURCE:
-            assert multi_service_endpoint
-            self._endpoint = urllib.parse.urljoin(multi_service_endpoint, '/computervision')
-        else:
-            assert resource_name
-            self._endpoint = f'https://{resource_name}.cognitiveservices.azure.com/computervision'
-
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, api_version: str='2023-04-01-preview', session: requests.Session = None,
+                 retry_policy: RetryPolicy = None, rate_limiter: AimdRateLimiter = None, metrics: MetricsSink = None) -> None:
+        """
+        session: session to send requests with, defaults to the pooled session shared by all clients
+        retry_policy: defaults to RetryPolicy()
+        rate_limiter: optional limiter learning the sustainable request rate per endpoint
+        metrics: optional sink receiving the duration of each phase of each request, see metrics.PHASES
+        """
+
+        self._endpoint = construct_endpoint(resource_type, resource_name, multi_service_endpoint)
         self._headers = {'Ocp-Apim-Subscription-Key': resource_key}
         self._params = {'api-version': api_version}
+        self._session = session or get_shared_session()
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._rate_limiter = rate_limiter
+        self._metrics = metrics
+
+    @property
+    def session(self) -> requests.Session:
+        return self._session
 
     def _construct_url(self, path):
         return self._endpoint + '/' + path
 
-    @staticmethod
-    def _get_json_response(response):
+    def _get_json_response(self, response, path):
         if not response.ok:
             logger.error(response.content)
         response.raise_for_status()
 
+        start = time.perf_counter()
         json_response = response.json()
-        logger.debug(f"Response: {json_response}")
+        if self._metrics:
+            self._metrics.observe('parse', time.perf_counter() - start, response.request.method, endpoint_label(path), str(response.status_code))
+        logger.debug('Response: %s', json_response)
         return json_response
 
+    def _request(self, method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+        if not self._metrics:
+            return self._session.request(method, url, **kwargs)
+
+        status = 'error'
+        with track_phases() as phases:
+            start = time.perf_counter()
+            try:
+                response = self._session.request(method, url, **kwargs)
+                status = str(response.status_code)
+                return response
+            finally:
+                total = time.perf_counter() - start
+                for phase, seconds in phases.items():
+                    self._metrics.observe(phase, seconds, method, endpoint, status)
+                if status != 'error':
+                    self._metrics.observe('download', max(0.0, total - sum(phases.values())), method, endpoint, status)
+                self._metrics.observe('total', total, method, endpoint, status)
+
+    def _send(self, method: str, path: str, idempotent: bool = None, **kwargs) -> requests.Response:
+        url = self._construct_url(path)
+        endpoint = endpoint_label(path)
+        body = kwargs.get('data')
+        body_position = stream_position(body)
+        max_retries = self._retry_policy.max_retries if is_replayable(body) else 0
+        attempt = 0
+        while True:
+            if self._rate_limiter:
+                start = time.perf_counter()
+                self._rate_limiter.acquire(endpoint)
+                if self._metrics:
+                    self._metrics.observe('rate_limit', time.perf_counter() - start, method, endpoint, 'none')
+            if attempt and body_position is not None:
+                body.seek(body_position)
+
+            try:
+                response = self._request(method, url, endpoint, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= max_retries or not self._retry_policy.is_retryable(method, None, idempotent):
+                    raise
+                delay = self._retry_policy.get_backoff(attempt)
+                logger.warning(f'{method} {endpoint} failed with {e}, retrying in {delay:.2f} seconds.')
+            else:
+                if self._rate_limiter:
+                    if response.status_code == 429:
+                        self._rate_limiter.on_throttle(endpoint)
+                    elif response.ok:
+                        self._rate_limiter.on_success(endpoint)
+
+                if response.ok or attempt >= max_retries or not self._retry_policy.is_retryable(method, response.status_code, idempotent):
+                    return response
+                delay = self._retry_policy.get_backoff(attempt, parse_retry_after(response.headers))
+                logger.warning(f'{method} {endpoint} returned {response.status_code}, retrying in {delay:.2f} seconds.')
+
+            time.sleep(delay)
+            attempt += 1
+
     def request_get(self, path):
-        r = requests.get(self._construct_url(path), params=self._params, headers=self._headers)
-        return self._get_json_response(r)
+        r = self._send('GET', path, params=self._params, headers=self._headers)
+        return self._get_json_response(r, path)
+
+    def request_put(self, path, json=None, data=None, content_type=None, idempotent: bool = None):
+        """
+        idempotent: set to True for PUT requests that are safe to replay on errors, e.g. updates replacing the whole resource
+        """
 
-    def request_put(self, path, json=None, data=None, content_type=None):
         headers = dict(self._headers, **{'Content-Type': content_type}) if content_type else self._headers
 
-        r = requests.put(self._construct_url(path), json=json, params=self._params, data=data, headers=headers)
-        return self._get_json_response(r)
+        r = self._send('PUT', path, idempotent=idempotent, json=json, params=self._params, data=data, headers=headers)
+        return self._get_json_response(r, path)
+
+    def request_post(self, path, params=None, data=None, content_type=None, idempotent: bool = None):
+        """
+        idempotent: set to True for POST requests that do not change any state on the service, so that they are safe to replay on errors
+        """
 
-    def request_post(self, path, params=None, data=None, content_type=None):
         assert data is None or content_type
 
         params = params or {}
         headers = dict(self._headers, **{'Content-Type': content_type}) if content_type else self._headers
-        r = requests.post(self._construct_url(path), data=data, params=dict(self._params, **params), headers=headers)
+        r = self._send('POST', path, idempotent=idempotent, data=data, params=dict(self._params, **params), headers=headers)
 
         if r.headers.get('Content-Type', None) == 'image/jpeg':
             return r.content
 
-        return self._get_json_response(r)
+        return self._get_json_response(r, path)
 
     def request_patch(self, path, json):
-        r = requests.patch(self._construct_url(path), json=json, params=self._params, headers=self._headers)
-        return self._get_json_response(r)
+        r = self._send('PATCH', path, json=json, params=self._params, headers=self._headers)
+        return self._get_json_response(r, path)
 
     def request_delete(self, path):
-        r = requests.delete(self._construct_url(path), params=self._params, headers=self._headers)
+        r = self._send('DELETE', path, params=self._params, headers=self._headers)
         if not r.ok:
             logger.error(r.content)
         r.raise_for_status()
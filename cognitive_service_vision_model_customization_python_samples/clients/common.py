@@ -1,4 +1,5 @@
 import enum
+import urllib.parse
 
 
 class ResourceType(enum.Enum):
@@ -8,3 +9,14 @@ class ResourceType(enum.Enum):
 
     MULTI_SERVICE_RESOURCE = "multi_service_account"
     SINGLE_SERVICE_RESOURCE = "single_service_account"
+
+
+def construct_endpoint(resource_type, resource_name: str, multi_service_endpoint) -> str:
+    resource_type = ResourceType(resource_type) if isinstance(resource_type, str) else resource_type
+
+    if resource_type == ResourceType.MULTI_SERVICE_RESOURCE:
+        assert multi_service_endpoint
+        return urllib.parse.urljoin(multi_service_endpoint, '/computervision')
+
+    assert resource_name
+    return f'https://{resource_name}.cognitiveservices.azure.com/computervision'
@@ -2,14 +2,15 @@ import logging
 import time
 
 from .client import Client
+from .job_watcher import JobWatcher, default_watcher, wait_for
 from ..models import EvaluationResponse, Evaluation, EvaluationStatus
 
 logger = logging.getLogger(__name__)
 
 
 class EvaluationClient(Client):
-    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str) -> None:
-        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key)
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, **kwargs) -> None:
+        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key, **kwargs)
         self._endpoint_format_str = self._endpoint + '/models/{0}/evaluations/{1}'
 
     def evaluate(self, evaluation: Evaluation) -> EvaluationResponse:
@@ -20,17 +21,12 @@ class EvaluationClient(Client):
         json_response = self.request_get(f'/models/{model_name}/evaluations/{name}')
         return EvaluationResponse.from_response(json_response)
 
-    def wait_for_completion(self, name: str, model_name: str, check_wait_in_secs: int = 60) -> EvaluationResponse:
+    def wait_for_completion(self, name: str, model_name: str, check_wait_in_secs: int = 60, watcher: JobWatcher = None) -> EvaluationResponse:
+        """watcher: JobWatcher polling the evaluation, the shared default watcher if not provided"""
+
         start_time = time.time()
-        total_elapsed = 0
-        while True:
-            eval_run = self.query_run(name, model_name)
-            status = eval_run.status
-            if status in [EvaluationStatus.FAILED, EvaluationStatus.SUCCEEDED]:
-                break
-            time.sleep(check_wait_in_secs)
-            total_elapsed = time.time() - start_time
-            logging.info(f'Training {name} for {total_elapsed} seconds. Status {status}.')
+        eval_run = wait_for((watcher or default_watcher()).watch_evaluation(self, name, model_name, interval=check_wait_in_secs))
+        total_elapsed = time.time() - start_time
 
         logger.info(f'Training finished with state {eval_run.status}.')
 
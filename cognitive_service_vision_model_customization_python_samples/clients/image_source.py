@@ -0,0 +1,119 @@
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+from typing import Any, BinaryIO, Callable, Iterator, Optional, Tuple, Union
+
+_DIGEST_CHUNK_SIZE = 1 << 20
+
+ImageSource = Union[bytes, bytearray, memoryview, mmap.mmap, str, os.PathLike, BinaryIO, Callable[[], Any], Any]
+
+
+class _SizedStream:
+    """Read-only stream with a known length, so that it is uploaded with Content-Length instead of chunked transfer encoding."""
+
+    def __init__(self, stream, size: int) -> None:
+        self._stream = stream
+        self._size = size
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+@contextlib.contextmanager
+def open_image(source: ImageSource) -> Iterator[Union[bytes, bytearray, memoryview, BinaryIO]]:
+    """
+    Open an image as an upload body that the HTTP session streams to the socket without first copying it into a bytes object.
+
+    bytes, bytearray and memoryview are sent as is, mmap objects through a memoryview over the mapping, local file paths and file objects are streamed
+    from the file, azure.storage.blob.BlobClient objects are streamed from the blob download, and callables are called and their result opened.
+    """
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+    elif isinstance(source, mmap.mmap):
+        with memoryview(source) as view:
+            yield view
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+    elif hasattr(source, 'read'):
+        yield source
+    elif hasattr(source, 'download_blob'):
+        downloader = source.download_blob()
+        yield _SizedStream(downloader, downloader.size)
+    elif callable(source):
+        with open_image(source()) as body:
+            yield body
+    else:
+        raise TypeError(f'Unsupported image source type {type(source)}.')
+
+
+def stream_position(body) -> Optional[int]:
+    """Current position of a seekable stream body, None for in-memory or non-seekable bodies."""
+
+    if not hasattr(body, 'read') or not hasattr(body, 'seek'):
+        return None
+
+    try:
+        return body.tell()
+    except (OSError, io.UnsupportedOperation):
+        return None
+
+
+def is_replayable(body) -> bool:
+    """Whether the body can be sent again on retry: in-memory bodies always can, streams only if they can seek back."""
+
+    return not hasattr(body, 'read') or stream_position(body) is not None
+
+
+def body_length(body) -> Optional[int]:
+    if body is None:
+        return 0
+    if isinstance(body, memoryview):
+        return body.nbytes
+    if hasattr(body, '__len__'):
+        return len(body)
+    if hasattr(body, 'fileno'):
+        try:
+            return os.fstat(body.fileno()).st_size - (stream_position(body) or 0)
+        except (OSError, io.UnsupportedOperation):
+            pass
+    return None
+
+
+def content_digest(source: ImageSource) -> Tuple[str, ImageSource]:
+    """
+    sha256 hex digest of the image content, with the source to upload afterwards: the same source, or its content in memory for sources that can only
+    be read once (non-seekable streams, blobs).
+    """
+
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        digest.update(source)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(_DIGEST_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    elif hasattr(source, 'read'):
+        position = stream_position(source)
+        if position is None:
+            source = source.read()
+            digest.update(source)
+        else:
+            for chunk in iter(lambda: source.read(_DIGEST_CHUNK_SIZE), b''):
+                digest.update(chunk)
+            source.seek(position)
+    elif hasattr(source, 'download_blob'):
+        source = source.download_blob().readall()
+        digest.update(source)
+    elif callable(source):
+        return content_digest(source())
+    else:
+        raise TypeError(f'Unsupported image source type {type(source)}.')
+
+    return digest.hexdigest(), source
@@ -0,0 +1,177 @@
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from ..models import ModelStatus, EvaluationStatus, ProductRecognitionStatus
+
+logger = logging.getLogger(__name__)
+
+_default_watcher = None
+_default_watcher_lock = threading.Lock()
+
+
+class _Job:
+    def __init__(self, query: Callable[[], Any], ending_states: Iterable, interval: float, deadline: float, backoff: bool) -> None:
+        self.query = query
+        self.ending_states = frozenset(ending_states)
+        self.interval = interval
+        self.deadline = deadline
+        self.backoff = backoff
+        self.future = concurrent.futures.Future()
+
+
+class JobWatcher:
+    """
+    Tracks many long running jobs (model trainings, evaluations, product recognition runs) at once.
+
+    One scheduler thread keeps all jobs in a queue ordered by their next poll time and hands due polls to a small pool of `max_workers` threads,
+    so watching hundreds of jobs does not need a thread per job. Each job is polled after `initial_interval` seconds first, then the interval grows by
+    `backoff_factor` up to `max_interval`, with +/- `jitter` relative noise so jobs submitted together do not poll in lockstep.
+
+    watch* methods return a concurrent.futures.Future resolving to the final response, use Future.add_done_callback for callbacks,
+    concurrent.futures.as_completed to consume them as they finish, or asyncio.wrap_future to await them.
+    """
+
+    def __init__(self, initial_interval: float = 1, max_interval: float = 60, backoff_factor: float = 1.5, jitter: float = 0.1, max_workers: int = 4) -> None:
+        assert 0 < initial_interval <= max_interval
+        assert backoff_factor >= 1
+        assert 0 <= jitter < 1
+
+        self._initial_interval = initial_interval
+        self._max_interval = max_interval
+        self._backoff_factor = backoff_factor
+        self._jitter = jitter
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix='JobWatcherPoll')
+        self._thread = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def watch(self, query: Callable[[], Any], ending_states: Iterable, timeout: float = None, interval: float = None) -> concurrent.futures.Future:
+        """
+        Args:
+            query (Callable): returns the current state of the job, an object with a `status` attribute
+            ending_states (Iterable): statuses in which the job is finished
+            timeout (float): seconds after which the future fails with TimeoutError, None to wait forever
+            interval (float): poll the job every `interval` seconds rather than backing off from the watcher's initial interval
+        """
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        job = _Job(query, ending_states, self._initial_interval if interval is None else interval, deadline, interval is None)
+        self._schedule(job, 0)
+        return job.future
+
+    def watch_model_training(self, training_client, model_name: str, timeout: float = None, interval: float = None) -> concurrent.futures.Future:
+        return self.watch(lambda: training_client.query_model(model_name), [ModelStatus.FAILED, ModelStatus.SUCCEEDED, ModelStatus.CANCELLED], timeout,
+                          interval)
+
+    def watch_evaluation(self, evaluation_client, name: str, model_name: str, timeout: float = None, interval: float = None) -> concurrent.futures.Future:
+        return self.watch(lambda: evaluation_client.query_run(name, model_name), [EvaluationStatus.FAILED, EvaluationStatus.SUCCEEDED], timeout, interval)
+
+    def watch_product_recognition(self, product_recognition_client, name: str, model_name: str, timeout: float = None,
+                                  interval: float = None) -> concurrent.futures.Future:
+        return self.watch(lambda: product_recognition_client.query_run(name, model_name), [ProductRecognitionStatus.FAILED, ProductRecognitionStatus.SUCCEEDED],
+                          timeout, interval)
+
+    def close(self, wait: bool = True) -> None:
+        """Stop polling. Futures of jobs still being watched are cancelled."""
+
+        with self._condition:
+            self._closed = True
+            pending = [job for _, _, job in self._queue]
+            self._queue = []
+            self._condition.notify()
+
+        for job in pending:
+            job.future.cancel()
+
+        if self._thread and wait:
+            self._thread.join()
+        self._executor.shutdown(wait)
+
+    def _schedule(self, job: _Job, delay: float) -> None:
+        with self._condition:
+            if self._closed:
+                job.future.cancel()
+                return
+
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), job))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='JobWatcher', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+                # submitted under the lock, so that once close() has set _closed no poll is submitted to the executor it shuts down
+                self._executor.submit(self._poll, job)
+
+    def _poll(self, job: _Job) -> None:
+        if job.future.cancelled():
+            return
+
+        try:
+            entity = job.query()
+        except Exception as e:
+            self._resolve(job, exception=e)
+            return
+
+        if entity.status in job.ending_states:
+            self._resolve(job, result=entity)
+        elif job.deadline is not None and time.monotonic() >= job.deadline:
+            self._resolve(job, exception=TimeoutError(f'Job still in status {entity.status} when the timeout was reached.'))
+        else:
+            logger.debug('Job in status %s, polling again in %.1f seconds.', entity.status, job.interval)
+            delay = job.interval * random.uniform(1 - self._jitter, 1 + self._jitter)
+            if job.backoff:
+                job.interval = min(self._max_interval, job.interval * self._backoff_factor)
+            self._schedule(job, delay if job.deadline is None else min(delay, max(0, job.deadline - time.monotonic())))
+
+    @staticmethod
+    def _resolve(job: _Job, result=None, exception: Exception = None) -> None:
+        # False when cancelled by the caller while the poll was in flight, the future cannot be cancelled anymore once it returns True
+        if not job.future.set_running_or_notify_cancel():
+            return
+
+        if exception is not None:
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(result)
+
+
+def default_watcher() -> JobWatcher:
+    """Watcher shared by the wait_for_* methods of the clients, created on first use and never closed."""
+
+    global _default_watcher
+    with _default_watcher_lock:
+        if _default_watcher is None:
+            _default_watcher = JobWatcher()
+        return _default_watcher
+
+
+def wait_for(future: concurrent.futures.Future):
+    """Result of a watched job, the job stops being watched if the wait is interrupted."""
+
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
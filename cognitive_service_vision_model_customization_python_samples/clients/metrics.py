@@ -0,0 +1,159 @@
+import abc
+import bisect
+import contextlib
+import threading
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+# Phases of a request observed by the clients:
+#   rate_limit: waiting for the client side rate limiter
+#   connect: DNS resolution, TCP connect and TLS handshake, only observed when a new connection is opened
+#   send: sending the request line, headers and body
+#   wait: from the end of the upload to the response headers, i.e. server processing time plus one round trip
+#   download: reading the response body
+#   parse: decoding the json response
+#   total: from sending the request to having the response body, one observation per attempt
+PHASES = ('rate_limit', 'connect', 'send', 'wait', 'download', 'parse', 'total')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MetricsSink(abc.ABC):
+    """Receives the duration of each phase of each request sent by a client. Implementations must be thread safe."""
+
+    @abc.abstractmethod
+    def observe(self, phase: str, seconds: float, method: str, endpoint: str, status: str) -> None:
+        """
+        Args:
+            phase (str): one of PHASES
+            seconds (float): duration of the phase
+            method (str): HTTP method
+            endpoint (str): request path with resource names replaced by {name}, e.g. productrecognition/{name}/runs/{name}
+            status (str): HTTP status code, 'error' when no response was received, 'none' for the rate_limit phase
+        """
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate of the q-quantile, interpolated linearly within the bucket it falls into, like Prometheus histogram_quantile."""
+
+        assert 0 <= q <= 1
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+
+        return self.buckets[-1]
+
+
+class HistogramCollector(MetricsSink):
+    """In-process sink keeping one histogram per (phase, method, endpoint, status)."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._buckets = buckets
+        self._histograms: Dict[Tuple[str, str, str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, phase: str, seconds: float, method: str, endpoint: str, status: str) -> None:
+        key = (phase, method, endpoint, status)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._buckets)
+            histogram.observe(seconds)
+
+    def histograms(self) -> Dict[Tuple[str, str, str, str], Histogram]:
+        """Snapshot of the histograms keyed by (phase, method, endpoint, status)."""
+
+        with self._lock:
+            snapshot = {}
+            for key, histogram in self._histograms.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+                snapshot[key] = copy
+            return snapshot
+
+    def to_prometheus(self, name: str = 'vision_client_request_duration_seconds') -> str:
+        """Histograms in the Prometheus text exposition format."""
+
+        lines = [f'# HELP {name} Duration of the phases of requests to the Vision service.', f'# TYPE {name} histogram']
+        for (phase, method, endpoint, status), histogram in sorted(self.histograms().items()):
+            labels = f'phase="{_escape(phase)}",method="{_escape(method)}",endpoint="{_escape(endpoint)}",status="{_escape(status)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+
+
+class OpenTelemetrySink(MetricsSink):
+    """Records the phases in an OpenTelemetry histogram, requires the opentelemetry-api package."""
+
+    def __init__(self, meter=None, name: str = 'vision_client.request.duration') -> None:
+        """
+        meter: OpenTelemetry meter, defaults to the meter of this module from the global meter provider
+        """
+
+        from opentelemetry import metrics
+
+        meter = meter or metrics.get_meter(__name__)
+        self._histogram = meter.create_histogram(name, unit='s', description='Duration of the phases of requests to the Vision service.')
+
+    def observe(self, phase: str, seconds: float, method: str, endpoint: str, status: str) -> None:
+        self._histogram.record(seconds, {'phase': phase, 'http.request.method': method, 'endpoint': endpoint, 'http.response.status_code': status})
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def track_phases() -> Iterator[Dict[str, float]]:
+    """Collect the durations of the connect, send and wait phases observed by the connections used in this thread while the context is active."""
+
+    phases = {}
+    previous = getattr(_local, 'phases', None)
+    _local.phases = phases
+    try:
+        yield phases
+    finally:
+        _local.phases = previous
+
+
+def is_tracking_phases() -> bool:
+    return getattr(_local, 'phases', None) is not None
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    phases = getattr(_local, 'phases', None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0) + seconds
@@ -8,9 +8,9 @@ logger = logging.getLogger(__name__)
 
 
 class PlanogramComplianceClient(Client):
-    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str) -> None:
-        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key)
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, **kwargs) -> None:
+        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key, **kwargs)
 
     def match_planogram(self, request: PlanogramMatchingRequest) -> PlanogramMatchingResponse:
-        json_response = self.request_post('/planogramcompliance:match', data=json.dumps(request.to_dict()), content_type='application/json')
+        json_response = self.request_post('/planogramcompliance:match', data=json.dumps(request.to_dict()), content_type='application/json', idempotent=True)
         return PlanogramMatchingResponse.from_response(json_response)
@@ -1,6 +1,70 @@
+from typing import Iterable, Iterator
+
+from .batch import BatchResult, run_batch
+from .cache import PredictionCache
 from .client import Client
+from .image_source import ImageSource, content_digest, open_image
+from .preprocessing import ImagePreprocessor
+from .rate_limit import TokenBucket
 
 
 class PredictionClient(Client):
-    def predict(self, model_name: str, img: bytes, content_type='image/jpeg'):
-        return self.request_post('imageanalysis:analyze', params={'model-name': model_name}, data=img, content_type=content_type)
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, preprocessor: ImagePreprocessor = None,
+                 cache: PredictionCache = None, **kwargs) -> None:
+        """
+        preprocessor: optional stage shrinking images before upload, bounding boxes of the predictions are mapped back to the original image
+        cache: optional cache of predictions by model name, API version and image content
+        """
+
+        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key, **kwargs)
+        self._preprocessor = preprocessor
+        self._cache = cache
+
+    def predict(self, model_name: str, img: ImageSource, content_type='image/jpeg'):
+        """
+        img: image bytes, memoryview, mmap, file path, file object, blob client or callable returning one of those. Files and blobs are streamed to the
+            service without being loaded in memory
+        """
+
+        if not self._cache:
+            return self._predict(model_name, img, content_type)
+
+        digest, img = content_digest(img)
+        preprocessing = (self._preprocessor.max_long_edge, self._preprocessor.jpeg_quality) if self._preprocessor else None
+        key = PredictionCache.make_key('imageanalysis:analyze', model_name, self._params['api-version'], preprocessing, digest)
+        json_response = self._cache.get(key)
+        if json_response is None:
+            json_response = self._predict(model_name, img, content_type)
+            self._cache.put(key, json_response)
+        return json_response
+
+    def _predict(self, model_name: str, img: ImageSource, content_type):
+        if self._preprocessor:
+            shrunk = self._preprocessor.shrink(img)
+            if shrunk.data is not None:
+                json_response = self.request_post('imageanalysis:analyze', params={'model-name': model_name}, data=shrunk.data, content_type='image/jpeg', idempotent=True)
+                return shrunk.restore_coordinates(json_response)
+            # streams and blobs were read by the preprocessor
+            img = shrunk.source
+
+        with open_image(img) as body:
+            return self.request_post('imageanalysis:analyze', params={'model-name': model_name}, data=body, content_type=content_type, idempotent=True)
+
+    def predict_many(self, model_name: str, images: Iterable[ImageSource], concurrency: int = 8, rate_limit: float = None, content_type='image/jpeg',
+                     ordered: bool = True) -> Iterator[BatchResult]:
+        """
+        Predict a stream of images concurrently.
+
+        Args:
+            model_name (str): model to predict with
+            images (Iterable): images in any form accepted by predict, opened lazily by the workers
+            concurrency (int): number of requests in flight
+            rate_limit (float): max requests per second, set it to the TPS quota of the resource. None for no limit
+            ordered (bool): yield results in input order, otherwise as they complete
+
+        Returns:
+            Iterator of BatchResult, with the prediction json as result, or the exception raised for that image as error
+        """
+
+        rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        return run_batch(lambda img: self.predict(model_name, img, content_type), images, concurrency, rate_limiter, ordered)
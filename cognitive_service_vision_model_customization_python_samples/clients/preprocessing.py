@@ -0,0 +1,164 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import os
+import threading
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .image_source import ImageSource, open_image
+
+
+@dataclasses.dataclass
+class ShrunkImage:
+    """
+    data: re-encoded JPEG, None when the image is already small enough and should be uploaded as is
+    original_size: (width, height) of the original image
+    size: (width, height) of the uploaded image
+    source: the original image to upload when data is None: the bytes already read from a file object, stream or blob, which cannot be read
+        again, or the path of a local file
+    """
+
+    data: Optional[bytes]
+    original_size: Tuple[int, int]
+    size: Tuple[int, int]
+    source: Union[bytes, str, None] = None
+
+    def restore_coordinates(self, response):
+        """Map bounding boxes and image metadata of an analyze or product recognition response back to pixel coordinates of the original image."""
+
+        if self.data is None:
+            return response
+
+        return restore_coordinates(response, self.original_size, self.size)
+
+
+def restore_coordinates(response, original_size: Tuple[int, int], size: Tuple[int, int]):
+    """Map bounding boxes and image metadata of a response to an image shrunk from original_size to size back to the original image."""
+
+    if response is None:
+        return response
+
+    scale_x = original_size[0] / size[0]
+    scale_y = original_size[1] / size[1]
+    return _restore(response, scale_x, scale_y, original_size)
+
+
+def _restore(node, scale_x: float, scale_y: float, original_size: Tuple[int, int]):
+    if isinstance(node, list):
+        return [_restore(item, scale_x, scale_y, original_size) for item in node]
+    if not isinstance(node, dict):
+        return node
+
+    restored = {}
+    for key, value in node.items():
+        if key == 'boundingBox' and isinstance(value, dict) and {'x', 'y', 'w', 'h'} <= value.keys():
+            value = dict(value, x=round(value['x'] * scale_x), y=round(value['y'] * scale_y), w=round(value['w'] * scale_x), h=round(value['h'] * scale_y))
+        elif key in ('imageMetadata', 'metadata') and isinstance(value, dict) and {'width', 'height'} <= value.keys():
+            value = dict(value, width=original_size[0], height=original_size[1])
+        else:
+            value = _restore(value, scale_x, scale_y, original_size)
+        restored[key] = value
+
+    return restored
+
+
+def _shrink(source: Union[bytes, str], max_long_edge: int, jpeg_quality: int) -> ShrunkImage:
+    # runs in a worker process, `source` is the image bytes or a local path so that large files are read by the worker rather than pickled
+    buffer = np.fromfile(source, dtype=np.uint8) if isinstance(source, str) else np.frombuffer(source, dtype=np.uint8)
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('Image could not be decoded.')
+
+    height, width = img.shape[:2]
+    long_edge = max(width, height)
+    if long_edge <= max_long_edge:
+        return ShrunkImage(None, (width, height), (width, height))
+
+    scale = max_long_edge / long_edge
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not ok:
+        raise ValueError('Image could not be encoded as JPEG.')
+
+    return ShrunkImage(encoded.tobytes(), (width, height), size)
+
+
+def _to_picklable(source: ImageSource) -> Union[bytes, str]:
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+
+    with open_image(source) as body:
+        if isinstance(body, bytes):
+            return body
+        if isinstance(body, (bytearray, memoryview)):
+            return bytes(body)
+        return body.read()
+
+
+class ImagePreprocessor:
+    """
+    Downscales images to `max_long_edge` pixels on their long edge and re-encodes them as JPEG with `jpeg_quality` before upload, in a pool of
+    `max_workers` processes. Images already within `max_long_edge` are uploaded unchanged.
+
+    The service caps image dimensions anyway (see data.check_coco_annotations._get_quota_limit), shrinking client side cuts upload bytes on slow links.
+    """
+
+    def __init__(self, max_long_edge: int = 2048, jpeg_quality: int = 90, max_workers: int = None) -> None:
+        assert max_long_edge > 0
+        assert 0 < jpeg_quality <= 100
+
+        self.max_long_edge = max_long_edge
+        self.jpeg_quality = jpeg_quality
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, img: ImageSource) -> concurrent.futures.Future:
+        """Future of the ShrunkImage of `img`. File objects, streams and blobs are read here, upload ShrunkImage.source rather than `img` when no shrinking was needed."""
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(self._max_workers)
+            executor = self._executor
+
+        source = _to_picklable(img)
+        shrunk_future = executor.submit(_shrink, source, self.max_long_edge, self.jpeg_quality)
+
+        # the worker does not send the source back, it is attached in this process, before the result is visible to the caller
+        future = concurrent.futures.Future()
+
+        def attach_source(done: concurrent.futures.Future) -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            if done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(dataclasses.replace(done.result(), source=source))
+
+        shrunk_future.add_done_callback(attach_source)
+        return future
+
+    def shrink(self, img: ImageSource) -> ShrunkImage:
+        return self.submit(img).result()
+
+    async def shrink_async(self, img: ImageSource) -> ShrunkImage:
+        """shrink for coroutines, reading file objects, streams and blobs in the loop's default executor rather than on the event loop."""
+
+        future = await asyncio.get_running_loop().run_in_executor(None, self.submit, img)
+        return await asyncio.wrap_future(future)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -1,38 +1,75 @@
+import concurrent.futures
+import functools
+import itertools
 import logging
+import queue
+import threading
 import time
+import uuid
+from typing import Iterable, Iterator
 
+from .batch import BatchResult
+from .cache import PredictionCache
 from .client import Client
+from .image_source import ImageSource, content_digest, open_image
+from .job_watcher import JobWatcher, default_watcher, wait_for
+from .preprocessing import ImagePreprocessor, restore_coordinates
 from ..models import ProductRecognition, ProductRecognitionResponse, ProductRecognitionStatus
 
 logger = logging.getLogger(__name__)
 
 
 class ProductRecognitionClient(Client):
-    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str) -> None:
-        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key)
+    def __init__(self, resource_type, resource_name: str, multi_service_endpoint, resource_key: str, preprocessor: ImagePreprocessor = None,
+                 cache: PredictionCache = None, **kwargs) -> None:
+        """
+        preprocessor: optional stage shrinking images before upload, bounding boxes of the runs are mapped back to the original image until the run is deleted
+        cache: optional cache of succeeded runs by model name, API version and image content, used by recognize_many
+        """
 
-    def create_run(self, run: ProductRecognition, img: bytes, content_type='image/jpeg') -> ProductRecognitionResponse:
-        json_response = self.request_put(f'/productrecognition/{run.model_name}/runs/{run.name}', data=img, content_type=content_type)
-        return ProductRecognitionResponse.from_response(json_response)
+        super().__init__(resource_type, resource_name, multi_service_endpoint, resource_key, **kwargs)
+        self._preprocessor = preprocessor
+        self._cache = cache
+        self._shrunk_runs = {}
+
+    def create_run(self, run: ProductRecognition, img: ImageSource, content_type='image/jpeg') -> ProductRecognitionResponse:
+        """
+        img: image bytes, memoryview, mmap, file path, file object, blob client or callable returning one of those. Files and blobs are streamed to the
+            service without being loaded in memory
+        """
+
+        shrunk = self._preprocessor.shrink(img) if self._preprocessor else None
+        if shrunk is not None and shrunk.data is not None:
+            json_response = self.request_put(f'/productrecognition/{run.model_name}/runs/{run.name}', data=shrunk.data, content_type='image/jpeg')
+            # only the sizes are kept, not the image, once the run is created
+            self._shrunk_runs[(run.model_name, run.name)] = (shrunk.original_size, shrunk.size)
+        else:
+            # streams and blobs were read by the preprocessor
+            img = shrunk.source if shrunk is not None else img
+            with open_image(img) as body:
+                json_response = self.request_put(f'/productrecognition/{run.model_name}/runs/{run.name}', data=body, content_type=content_type)
+        return self._restore_coordinates(ProductRecognitionResponse.from_response(json_response))
 
     def query_run(self, name, model_name) -> ProductRecognitionResponse:
         json_response = self.request_get(f'/productrecognition/{model_name}/runs/{name}')
-        return ProductRecognitionResponse.from_response(json_response)
+        return self._restore_coordinates(ProductRecognitionResponse.from_response(json_response))
 
     def delete_run(self, name, model_name) -> None:
         self.request_delete(f'/productrecognition/{model_name}/runs/{name}')
+        self._shrunk_runs.pop((model_name, name), None)
+
+    def _restore_coordinates(self, run: ProductRecognitionResponse) -> ProductRecognitionResponse:
+        sizes = self._shrunk_runs.get((run.model_name, run.name))
+        if sizes is not None:
+            run.result = restore_coordinates(run.result, *sizes)
+        return run
+
+    def wait_for_completion(self, name: str, model_name: str, check_wait_in_secs: int = 2, watcher: JobWatcher = None) -> ProductRecognitionResponse:
+        """watcher: JobWatcher polling the run, the shared default watcher if not provided"""
 
-    def wait_for_completion(self, name: str, model_name: str, check_wait_in_secs: int = 2) -> ProductRecognitionResponse:
         start_time = time.time()
-        total_elapsed = 0
-        while True:
-            run = self.query_run(name, model_name)
-            status = run.status
-            if status in [ProductRecognitionStatus.FAILED, ProductRecognitionStatus.SUCCEEDED]:
-                break
-            time.sleep(check_wait_in_secs)
-            total_elapsed = time.time() - start_time
-            logging.info(f'Product recognition running {name} for {total_elapsed} seconds. Status {status}.')
+        run = wait_for((watcher or default_watcher()).watch_product_recognition(self, name, model_name, interval=check_wait_in_secs))
+        total_elapsed = time.time() - start_time
 
         logger.info(f'Product recognition finished with state {run.status}.')
 
@@ -43,3 +80,165 @@ class ProductRecognitionClient(Client):
             logger.info(f'Product recognition result: {run.result}')
 
         return run
+
+    def recognize_many(self, model_name: str, images: Iterable[ImageSource], max_in_flight: int = 16, upload_concurrency: int = 4, content_type='image/jpeg',
+                       run_name_prefix: str = 'run-', delete_runs: bool = True, watcher: JobWatcher = None) -> Iterator[BatchResult]:
+        """
+        Run product recognition on a stream of images, pipelining upload, polling and clean up of the runs.
+
+        Args:
+            model_name (str): model to recognize products with
+            images (Iterable): images in any form accepted by create_run, opened right before their upload and released once the run is created
+            max_in_flight (int): max runs created but not yet yielded
+            upload_concurrency (int): max concurrent image uploads
+            run_name_prefix (str): prefix of the generated run names
+            delete_runs (bool): delete runs in the background once finished
+            watcher (JobWatcher): watcher polling the runs, a private one is created and closed if not provided
+
+        Returns:
+            Iterator of BatchResult in completion order, with the succeeded ProductRecognitionResponse as result, or the upload / polling exception or the
+            failure of the run as error. With a cache, images recognized before are answered from it without creating a run
+        """
+
+        assert max_in_flight > 0
+
+        own_watcher = watcher is None
+        watcher = watcher or JobWatcher(initial_interval=1, max_interval=10)
+        pipeline = _RunPipeline(self, model_name, content_type, delete_runs, watcher, upload_concurrency)
+        items = iter(enumerate(images))
+        in_flight = 0
+
+        try:
+            while True:
+                for index, item in itertools.islice(items, max_in_flight - in_flight):
+                    pipeline.submit(index, item, f'{run_name_prefix}{uuid.uuid4().hex}')
+                    in_flight += 1
+
+                if in_flight == 0:
+                    break
+
+                yield pipeline.results.get()
+                in_flight -= 1
+        finally:
+            # only does work when the caller stops consuming early: stop uploads, stop watching the runs and delete them
+            pipeline.close()
+            if own_watcher:
+                watcher.close()
+
+
+class _RunPipeline:
+    """
+    Runs of one recognize_many call: upload, then watch, then delete each run, the steps chained by callbacks on the upload and watcher threads,
+    results put in a queue for the caller.
+    """
+
+    def __init__(self, client: ProductRecognitionClient, model_name: str, content_type: str, delete_runs: bool, watcher: JobWatcher,
+                 upload_concurrency: int) -> None:
+        self.results = queue.Queue()
+        self._client = client
+        self._model_name = model_name
+        self._content_type = content_type
+        self._delete_runs = delete_runs
+        self._watcher = watcher
+        self._upload_executor = concurrent.futures.ThreadPoolExecutor(upload_concurrency)
+        self._delete_executor = concurrent.futures.ThreadPoolExecutor(2)
+        self._lock = threading.Lock()
+        self._uploads = set()
+        self._watched_runs = set()
+        self._undeleted_runs = set()
+
+    def submit(self, index: int, item: ImageSource, name: str) -> None:
+        future = self._upload_executor.submit(self._upload, name, item)
+        with self._lock:
+            self._uploads.add(future)
+        future.add_done_callback(functools.partial(self._on_uploaded, index, item, name))
+
+    def close(self) -> None:
+        with self._lock:
+            uploads = list(self._uploads)
+        for future in uploads:
+            future.cancel()
+        self._upload_executor.shutdown(wait=True)
+
+        # the remaining runs are deleted here, so watcher callbacks still running after close() find nothing to submit to the delete executor
+        with self._lock:
+            watched_runs = list(self._watched_runs)
+            undeleted_runs = list(self._undeleted_runs)
+            self._undeleted_runs.clear()
+        for watched_run in watched_runs:
+            watched_run.cancel()
+        if self._delete_runs:
+            for name in undeleted_runs:
+                self._delete_executor.submit(self._delete, name)
+        self._delete_executor.shutdown(wait=True)
+
+    def _upload(self, name: str, item: ImageSource):
+        key = None
+        if self._client._cache:
+            digest, item = content_digest(item)
+            preprocessor = self._client._preprocessor
+            preprocessing = (preprocessor.max_long_edge, preprocessor.jpeg_quality) if preprocessor else None
+            key = PredictionCache.make_key('productrecognition', self._model_name, self._client._params['api-version'], preprocessing, digest)
+            cached = self._client._cache.get(key)
+            if cached is not None:
+                return key, ProductRecognitionResponse.from_response(cached)
+
+        self._client.create_run(ProductRecognition(name, self._model_name), item, self._content_type)
+        return key, None
+
+    def _on_uploaded(self, index: int, item: ImageSource, name: str, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._uploads.discard(future)
+        try:
+            key, cached = future.result()
+            if cached is not None:
+                self.results.put(BatchResult(index, item, result=cached))
+                return
+
+            with self._lock:
+                self._undeleted_runs.add(name)
+            watched_run = self._watcher.watch_product_recognition(self._client, name, self._model_name)
+            with self._lock:
+                self._watched_runs.add(watched_run)
+            watched_run.add_done_callback(functools.partial(self._on_finished, index, item, name, key))
+        except Exception as e:
+            self.results.put(BatchResult(index, item, error=e))
+
+    def _on_finished(self, index: int, item: ImageSource, name: str, key, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._watched_runs.discard(future)
+        if self._delete_runs:
+            self._delete_later(name)
+        else:
+            # the coordinates of the finished run were restored by the watcher's last query
+            self._client._shrunk_runs.pop((self._model_name, name), None)
+
+        try:
+            run = future.result()
+        except Exception as e:
+            self.results.put(BatchResult(index, item, error=e))
+            return
+
+        if run.status == ProductRecognitionStatus.FAILED:
+            self.results.put(BatchResult(index, item, error=RuntimeError(f'Product recognition run {name} failed: {run.error}')))
+            return
+
+        if key is not None:
+            try:
+                self._client._cache.put(key, run.to_dict())
+            except Exception as e:
+                logger.warning(f'Failed to cache product recognition run {name}: {e}')
+        self.results.put(BatchResult(index, item, result=run))
+
+    def _delete_later(self, name: str) -> None:
+        # each run is deleted once, by whichever of its watcher callback and close() takes it first
+        with self._lock:
+            if name in self._undeleted_runs:
+                self._undeleted_runs.discard(name)
+                self._delete_executor.submit(self._delete, name)
+
+    def _delete(self, name: str) -> None:
+        try:
+            self._client.delete_run(name, self._model_name)
+        except Exception as e:
+            logger.warning(f'Failed to delete product recognition run {name}: {e}')
@@ -0,0 +1,100 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill at `rate` per second up to `capacity`, which bounds the burst size.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        assert rate > 0
+
+        self._rate = rate
+        self._capacity = capacity or max(1.0, rate)
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float) -> None:
+        assert rate > 0
+        with self._lock:
+            self._refill()
+            self._rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take `tokens` from the bucket and return how many seconds the caller has to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self._rate)
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AimdRateLimiter:
+    """
+    Learns the sustainable request rate of each endpoint with additive increase / multiplicative decrease (AIMD).
+
+    Every endpoint starts at `initial_rate` requests per second. Each successful request raises the rate so that it grows by about `additive_increase`
+    per second of traffic, each throttled (429) request multiplies it by `decrease_factor`. Throttles arriving within `cooldown` seconds of the last
+    decrease are ignored, as they were sent before the rate was lowered.
+    """
+
+    def __init__(self, initial_rate: float = 10, min_rate: float = 0.1, max_rate: float = None, additive_increase: float = 1, decrease_factor: float = 0.5,
+                 cooldown: float = 1) -> None:
+        assert 0 < min_rate <= initial_rate
+        assert max_rate is None or max_rate >= initial_rate
+        assert 0 < decrease_factor < 1
+
+        self._initial_rate = initial_rate
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._additive_increase = additive_increase
+        self._decrease_factor = decrease_factor
+        self._cooldown = cooldown
+        self._buckets = {}
+        self._last_decrease = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        with self._lock:
+            if endpoint not in self._buckets:
+                self._buckets[endpoint] = TokenBucket(self._initial_rate, capacity=1)
+            return self._buckets[endpoint]
+
+    def rate(self, endpoint: str) -> float:
+        return self._bucket(endpoint).rate
+
+    def reserve(self, endpoint: str) -> float:
+        return self._bucket(endpoint).reserve()
+
+    def acquire(self, endpoint: str) -> None:
+        self._bucket(endpoint).acquire()
+
+    def on_success(self, endpoint: str) -> None:
+        bucket = self._bucket(endpoint)
+        rate = bucket.rate + self._additive_increase / bucket.rate
+        bucket.set_rate(min(rate, self._max_rate) if self._max_rate else rate)
+
+    def on_throttle(self, endpoint: str) -> None:
+        bucket = self._bucket(endpoint)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_decrease.get(endpoint, float('-inf')) < self._cooldown:
+                return
+            self._last_decrease[endpoint] = now
+
+        bucket.set_rate(max(self._min_rate, bucket.rate * self._decrease_factor))
@@ -0,0 +1,81 @@
+import dataclasses
+import email.utils
+import random
+import time
+import typing
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """
+    Retry policy of the clients.
+
+    Throttled requests (429) are always replayed, as the service rejected them before doing any work. Other statuses in `retry_statuses` and connection
+    errors are replayed only for idempotent requests. PUT is not in `idempotent_methods`: the PUTs of the service create trainings, evaluations and
+    runs, which the service may have started before the error, so that a replay would conflict with them or start the same work twice. Waits honour the Retry-After header, capped at `max_backoff`, otherwise back off exponentially with full jitter.
+    Use RetryPolicy(max_retries=0) to disable retries.
+    """
+
+    max_retries: int = 5
+    backoff_factor: float = 0.5
+    max_backoff: float = 60
+    retry_statuses: typing.FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+    idempotent_methods: typing.FrozenSet[str] = frozenset({'GET', 'HEAD', 'OPTIONS', 'DELETE'})
+
+    def is_retryable(self, method: str, status_code: int = None, idempotent: bool = None) -> bool:
+        """
+        status_code: None for connection errors
+        idempotent: overrides the default derived from the HTTP method, e.g. for a POST that does not change any state
+        """
+
+        if status_code == 429:
+            return True
+
+        idempotent = method.upper() in self.idempotent_methods if idempotent is None else idempotent
+        return idempotent and (status_code is None or status_code in self.retry_statuses)
+
+    def get_backoff(self, attempt: int, retry_after: float = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+
+def parse_retry_after(headers) -> typing.Optional[float]:
+    """Seconds to wait according to the retry-after-ms or Retry-After (seconds or HTTP date) response headers, None if absent or malformed."""
+
+    retry_after_ms = headers.get('retry-after-ms') or headers.get('x-ms-retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('Retry-After')
+    if not retry_after:
+        return None
+
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def endpoint_label(path: str) -> str:
+    """
+    Path with resource names replaced by placeholders, e.g. 'models/my-model:cancel' -> 'models/{name}:cancel', so that requests to the same
+    API group together regardless of the model, dataset or run they address.
+    """
+
+    segments = path.strip('/').split('/')
+    for i in range(1, len(segments)):
+        if segments[i - 1] in ('models', 'datasets', 'evaluations', 'runs', 'productrecognition'):
+            _, sep, action = segments[i].partition(':')
+            segments[i] = '{name}' + sep + action
+
+    return '/'.join(segments)
@@ -0,0 +1,132 @@
+import dataclasses
+import threading
+import time
+import typing
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .metrics import is_tracking_phases, record_phase, track_phases
+
+
+@dataclasses.dataclass
+class SessionConfig:
+    """
+    Connection pool settings shared by all clients.
+
+    pool_connections: number of per-host pools kept alive
+    pool_maxsize: max connections kept per host, should be >= the number of threads issuing requests
+    keep_alive: reuse connections across requests. When False, every request asks the server to close the connection
+    pool_block: block when pool_maxsize connections are in use instead of opening a throwaway connection
+    """
+
+    pool_connections: int = 10
+    pool_maxsize: int = 32
+    keep_alive: bool = True
+    pool_block: bool = False
+
+
+class _TimedConnectionMixin:
+    """Reports connect, send and wait durations to the phases tracked by metrics.track_phases in the calling thread."""
+
+    def connect(self):
+        if not is_tracking_phases():
+            return super().connect()
+
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            record_phase('connect', time.perf_counter() - start)
+
+    def request(self, *args, **kwargs):
+        if not is_tracking_phases():
+            return super().request(*args, **kwargs)
+
+        # plain http connections connect lazily inside request, that time is already reported as connect
+        with track_phases() as nested:
+            start = time.perf_counter()
+            try:
+                super().request(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+        connect = nested.get('connect', 0)
+        if connect:
+            record_phase('connect', connect)
+        record_phase('send', elapsed - connect)
+
+    def getresponse(self, *args, **kwargs):
+        if not is_tracking_phases():
+            return super().getresponse(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            record_phase('wait', time.perf_counter() - start)
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+def create_session(config: SessionConfig = None, transport: BaseAdapter = None) -> requests.Session:
+    """
+    Create a requests session with a pooled, keep-alive adapter mounted for http and https. Its connections report their timings to clients given a
+    metrics sink.
+
+    transport: adapter to mount instead of the default HTTPAdapter, e.g. a stub adapter in tests
+    """
+
+    config = config or SessionConfig()
+    session = requests.Session()
+    adapter = transport or _TimedHTTPAdapter(pool_connections=config.pool_connections, pool_maxsize=config.pool_maxsize, pool_block=config.pool_block)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not config.keep_alive:
+        session.headers['Connection'] = 'close'
+
+    return session
+
+
+_shared_session: typing.Optional[requests.Session] = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session() -> requests.Session:
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+def configure_shared_session(config: SessionConfig = None, transport: BaseAdapter = None) -> requests.Session:
+    """
+    Replace the session used by clients created without an explicit session. Clients created earlier keep the session they were created with.
+    """
+
+    global _shared_session
+    with _shared_session_lock:
+        _shared_session = create_session(config, transport)
+        return _shared_session
@@ -3,6 +3,7 @@ import logging
 from typing import Tuple, Any
 
 from .client import Client
+from .job_watcher import JobWatcher, default_watcher, wait_for
 from ..models import Model, ModelResponse, ModelStatus, Evaluation, EvaluationStatus, EvaluationResponse
 
 logger = logging.getLogger(__name__)
@@ -33,12 +34,11 @@ class TrainingClient(Client):
     def delete_model_evaluation(self, model_name: str, evaluation_name: str):
         self.request_delete(f'models/{model_name}/evaluations/{evaluation_name}')
 
-    def wait_for_training_completion(self, model_name, check_wait_in_secs: int = 60) -> ModelResponse:
-        def query():
-            evaluation = self.query_model(model_name)
-            return evaluation, evaluation.status
+    def wait_for_training_completion(self, model_name, check_wait_in_secs: int = 60, watcher: JobWatcher = None) -> ModelResponse:
+        """watcher: JobWatcher polling the model, the shared default watcher if not provided"""
 
-        model, total_elapsed = self._wait_for_completion(query, [ModelStatus.FAILED, ModelStatus.SUCCEEDED, ModelStatus.CANCELLED], check_wait_in_secs)
+        model, total_elapsed = self._wait_for_completion(lambda: self.query_model(model_name), [ModelStatus.FAILED, ModelStatus.SUCCEEDED, ModelStatus.CANCELLED],
+                                                         check_wait_in_secs, watcher)
 
         logger.info(f'Training finished with status {model.status}.')
 
@@ -50,12 +50,11 @@ class TrainingClient(Client):
 
         return model
 
-    def wait_for_evaluation_completion(self, model_name, evaluation_name, check_wait_in_secs: int = 60) -> ModelResponse:
-        def query():
-            evaluation = self.query_model_evaluation(model_name, evaluation_name)
-            return evaluation, evaluation.status
+    def wait_for_evaluation_completion(self, model_name, evaluation_name, check_wait_in_secs: int = 60, watcher: JobWatcher = None) -> ModelResponse:
+        """watcher: JobWatcher polling the evaluation, the shared default watcher if not provided"""
 
-        evaluation, total_elapsed = self._wait_for_completion(query, [EvaluationStatus.FAILED, EvaluationStatus.SUCCEEDED], check_wait_in_secs)
+        evaluation, total_elapsed = self._wait_for_completion(lambda: self.query_model_evaluation(model_name, evaluation_name),
+                                                              [EvaluationStatus.FAILED, EvaluationStatus.SUCCEEDED], check_wait_in_secs, watcher)
 
         logger.info(f'Evalaution finished with status {evaluation.status}.')
 
@@ -67,15 +66,7 @@ class TrainingClient(Client):
 
         return evaluation
 
-    def _wait_for_completion(self, query, ending_states, check_wait_in_secs: int = 60) -> Tuple[Any, float]:
+    def _wait_for_completion(self, query, ending_states, check_wait_in_secs: int = 60, watcher: JobWatcher = None) -> Tuple[Any, float]:
         start_time = time.time()
-        total_elapsed = 0
-        while True:
-            entity, status = query()
-            if status in ending_states:
-                break
-            time.sleep(check_wait_in_secs)
-            total_elapsed = time.time() - start_time
-            logger.info(f'waiting for {total_elapsed} seconds. Status {status}.')
-
-        return entity, total_elapsed
+        entity = wait_for((watcher or default_watcher()).watch(query, ending_states, interval=check_wait_in_secs))
+        return entity, time.time() - start_time
@@ -1,4 +1,4 @@
 from .export_cvs_data_to_blob_storage import export_data
-from .check_coco_annotations import check_coco_annotation_file, Purpose
+from .check_coco_annotations import check_coco_annotation_file, check_coco_annotation_file_streaming, check_coco_annotation_files, CocoCheckResult, Purpose
 
-__all__ = ['export_data', 'check_coco_annotation_file', 'Purpose']
+__all__ = ['export_data', 'check_coco_annotation_file', 'check_coco_annotation_file_streaming', 'check_coco_annotation_files', 'CocoCheckResult', 'Purpose']
@@ -1,13 +1,27 @@
 import argparse
+import array
+import concurrent.futures
+import itertools
 import json
 import logging
+import os
 import pathlib
+import sys
 
 from cognitive_service_vision_model_customization_python_samples import AnnotationKind
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from tqdm import tqdm
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List
+
+import numpy as np
+import requests
+
+from ..clients.batch import run_batch
+from ..clients.session import SessionConfig, create_session
+from .coco_columns import BboxColumns, Check, IntColumn, duplicated_values, iter_failures, value_counts
+from .coco_stream import ARRAY_START, COCO_SECTIONS, iter_coco_stream
+from .image_headers import fetch_image_size
 
 
 @dataclass
@@ -65,7 +79,7 @@ def bbox_check(bbox: List, custom_message):
     _check(0 <= left < 1.0, f'left must be in [0, 1). {left} found. {custom_message}')
     _check(0 <= top < 1.0, f'top must be in [0, 1). {top} found. {custom_message}')
     _check(0.0 < width <= 1.0, f'width must be in (0, 1]. {width} found. {custom_message}')
-    _check(0.0 < height <= 1.0, f'height must be in (0, 1]. {width} found. {custom_message}')
+    _check(0.0 < height <= 1.0, f'height must be in (0, 1]. {height} found. {custom_message}')
     _check(left + width <= 1.0, f'left + width must be in (0, 1]. {left + width} found. {custom_message}')
     _check(top + height <= 1.0, f'top + height must be in (0, 1]. {top + height} found. {custom_message}')
 
@@ -76,13 +90,13 @@ def image_check(image: dict, max_id: int, quota_limit: QuotaLimit):
     _check(('coco_url' in image) or ('absolute_url' in image), f'Neither "coco_url" nor "absolute_url" present. {img_msg}.')
     for key in ['width', 'height']:
         dim = image[key]
-        _check(dim >= quota_limit.min_image_dim and dim <= quota_limit.max_image_dim, f'width {dim} must be present and in [{quota_limit.min_image_dim}, {quota_limit.max_image_dim}]. {img_msg}.')
+        _check(dim >= quota_limit.min_image_dim and dim <= quota_limit.max_image_dim, f'{key} {dim} must be present and in [{quota_limit.min_image_dim}, {quota_limit.max_image_dim}]. {img_msg}.')
     _id_value_range_check(image['id'], max_id, 'id', img_msg)
 
 
 def category_check(catetory: dict, max_id: int):
-    category_msg = f'image with id = {catetory.get("id")}'
-    _fields_present_and_has_value_check(catetory, category_check, 'id', 'name')
+    category_msg = f'category with id = {catetory.get("id")}'
+    _fields_present_and_has_value_check(catetory, category_msg, 'id', 'name')
     _id_value_range_check(catetory['id'], max_id, 'id', category_msg)
 
 
@@ -98,14 +112,80 @@ def annotation_check(annotation: dict, data_type: str, max_id: int, max_img_id:
     _id_value_range_check(annotation['id'], max_id, 'id', ann_msg)
 
 
+def _missing_field_check(values: List, name: str, msg: Callable[[int], str]) -> Check:
+    missing = np.fromiter((v is None for v in values), bool, len(values))
+    return missing, lambda row: f'"{name}" field missing or None. {msg(row)}.'
+
+
+def _id_range_check(column: IntColumn, max_id: int, id_name: str, msg: Callable[[int], str]) -> Check:
+    return column.out_of_range(max_id), lambda row: f'{id_name} must be integer in [1, {max_id}], {column.values[row]} found. {msg(row)}.'
+
+
+def _bbox_checks(bboxes: BboxColumns, msg: Callable[[int], str]) -> List[Check]:
+    # same checks and messages as bbox_check, the coordinate checks skip malformed rows which only get the length error
+    left, top, width, height = bboxes.array.T
+    valid = ~bboxes.malformed & ~bboxes.missing
+
+    def raw(row, i):
+        # values as in the json, so that messages match bbox_check
+        return bboxes.values[row][i]
+
+    def length(row):
+        bbox = bboxes.values[row]
+        return f'bbox must be of 4 floats. {len(bbox) if hasattr(bbox, "__len__") else bbox} found. {msg(row)}'
+
+    with np.errstate(invalid='ignore'):
+        return [
+            (bboxes.malformed, length),
+            (valid & ~((0 <= left) & (left < 1.0)), lambda row: f'left must be in [0, 1). {raw(row, 0)} found. {msg(row)}'),
+            (valid & ~((0 <= top) & (top < 1.0)), lambda row: f'top must be in [0, 1). {raw(row, 1)} found. {msg(row)}'),
+            (valid & ~((0.0 < width) & (width <= 1.0)), lambda row: f'width must be in (0, 1]. {raw(row, 2)} found. {msg(row)}'),
+            (valid & ~((0.0 < height) & (height <= 1.0)), lambda row: f'height must be in (0, 1]. {raw(row, 3)} found. {msg(row)}'),
+            (valid & ~(left + width <= 1.0), lambda row: f'left + width must be in (0, 1]. {raw(row, 0) + raw(row, 2)} found. {msg(row)}'),
+            (valid & ~(top + height <= 1.0), lambda row: f'top + height must be in (0, 1]. {raw(row, 1) + raw(row, 3)} found. {msg(row)}'),
+        ]
+
+
+def _raise_first_failure(checks: List[Check]):
+    for _, message in iter_failures(checks, first_per_row=True):
+        raise ValueError(message)
+
+
+def _image_checks(images: List, quota_limit: QuotaLimit) -> List[Check]:
+    ids = IntColumn([img.get('id') for img in images])
+    img_msg = lambda row: f'image with id = {ids.values[row]}'  # noqa: E731
+    checks = [_missing_field_check(ids.values, 'id', img_msg)]
+    dims = {}
+    for name in ['width', 'height', 'file_name']:
+        values = [img.get(name) for img in images]
+        checks.append(_missing_field_check(values, name, img_msg))
+        dims[name] = values
+
+    has_url = np.fromiter((('coco_url' in img) or ('absolute_url' in img) for img in images), bool, len(images))
+    checks.append((~has_url, lambda row: f'Neither "coco_url" nor "absolute_url" present. {img_msg(row)}.'))
+    for name in ['width', 'height']:
+        values = dims[name]
+        try:
+            column = np.asarray(values, dtype=np.float64) if values else np.zeros(0)
+        except (TypeError, ValueError):
+            column = np.array([v if isinstance(v, (int, float)) else np.nan for v in values], np.float64)
+        with np.errstate(invalid='ignore'):
+            out_of_range = ~((quota_limit.min_image_dim <= column) & (column <= quota_limit.max_image_dim))
+        checks.append((np.array([v is not None for v in values], bool) & out_of_range,
+                       lambda row, name=name, values=values: f'{name} {values[row]} must be present and in [{quota_limit.min_image_dim}, {quota_limit.max_image_dim}]. '
+                                                             f'{img_msg(row)}.'))
+
+    checks.append(_id_range_check(ids, len(images), 'id', img_msg))
+    return checks
+
+
 def images_check(images: List, quota_limit: QuotaLimit):
     _check(len(images) >= quota_limit.min_image_cnt_per_tag and len(images) <= quota_limit.max_image_cnt,
            f'Number of images must be in [{quota_limit.min_image_cnt_per_tag}, {quota_limit.max_image_cnt}].')
 
     _check(len(set([img['id'] for img in images])) == len(images), 'Duplicate image ids exist.')
 
-    for image in tqdm(images, 'Checking "images..."'):
-        image_check(image, len(images), quota_limit)
+    _raise_first_failure(_image_checks(images, quota_limit))
 
 
 def categories_check(categories: List, quota_limit: QuotaLimit):
@@ -119,43 +199,448 @@ def categories_check(categories: List, quota_limit: QuotaLimit):
         category_check(category, len(categories))
 
 
+def _annotation_checks(ids: IntColumn, image_ids: IntColumn, category_ids: IntColumn, bboxes: BboxColumns, max_id: int, max_img_id: int,
+                       max_category_id: int) -> List[Check]:
+    # same order as annotation_check, so that the first failing check of a row is the error annotation_check raises
+    ann_msg = lambda row: f'annotation with id = {ids.values[row]}'  # noqa: E731
+    checks = [
+        (ids.missing, lambda row: f'"id" field missing or None. {ann_msg(row)}.'),
+        (image_ids.missing, lambda row: f'"image_id" field missing or None. {ann_msg(row)}.'),
+        (category_ids.missing, lambda row: f'"category_id" field missing or None. {ann_msg(row)}.'),
+    ]
+    if bboxes is not None:
+        checks.append((bboxes.missing, lambda row: f'"bbox" field missing or None. {ann_msg(row)}.'))
+        checks.extend(_bbox_checks(bboxes, ann_msg))
+
+    checks.append(_id_range_check(image_ids, max_img_id, 'image_id', ann_msg))
+    checks.append(_id_range_check(category_ids, max_category_id, 'category_id', ann_msg))
+    checks.append(_id_range_check(ids, max_id, 'id', ann_msg))
+    return checks
+
+
 def annotations_check(annotations: List, data_type: str, max_img_id: int, max_category_id: int, quota_limit: QuotaLimit):
-    _check(len(set([ann['id'] for ann in annotations])) == len(annotations), 'Duplicate annotation ids exist.')
+    ids = IntColumn([ann.get('id') for ann in annotations])
+    if not ids.missing.any() and not ids.invalid.any():
+        _check(not duplicated_values(ids.array, 1), 'Duplicate annotation ids exist.')
+    else:
+        _check(len(set(ids.values)) == len(annotations), 'Duplicate annotation ids exist.')
 
-    category_stats = {}
-    for annotation in tqdm(annotations, 'Checking "annotations"...'):
-        annotation_check(annotation, data_type, len(annotations), max_img_id, max_category_id)
-        ann_cate_id = annotation['category_id']
-        category_stats[ann_cate_id] = category_stats.get(ann_cate_id, 0) + 1
+    image_ids = IntColumn([ann.get('image_id') for ann in annotations])
+    category_ids = IntColumn([ann.get('category_id') for ann in annotations])
+    bboxes = BboxColumns([ann.get('bbox') for ann in annotations]) if data_type == AnnotationKind.OBJECT_DETECTION else None
+    _raise_first_failure(_annotation_checks(ids, image_ids, category_ids, bboxes, len(annotations), max_img_id, max_category_id))
+
+    category_stats = value_counts(category_ids.array)
 
     print(f'Number of images per category: {category_stats}.')
     for cat_id, stat in category_stats.items():
         _check(stat >= quota_limit.min_image_cnt_per_tag, f'Each category must have >= {quota_limit.min_image_cnt_per_tag} images present, only {stat} images found for category {cat_id}.')
 
 
-def check_coco_annotation_file(coco_dict: dict, data_type: str, purpose: Purpose):
+def _redacted(message: str, container_sas_url: str) -> str:
+    sas_token = container_sas_url.partition('?')[2] if container_sas_url else ''
+    return message.replace(sas_token, '<SAS>') if sas_token else message
+
+
+def _image_file_check(image: dict, quota_limit: QuotaLimit, session: requests.Session, root, container_sas_url: str = None) -> List[str]:
+    img_msg = f'image with id = {image.get("id")}'
+    location = image.get('absolute_url') or image.get('coco_url')
+    if not location:
+        # reported by the image checks
+        return []
+
+    try:
+        width, height = fetch_image_size(location, session, root, container_sas_url=container_sas_url)
+    except requests.HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status in (401, 403):
+            return [f'Image {location} access denied ({status}), the container may be private: pass a SAS url of the container with read permission. '
+                    f'{img_msg}.']
+        if status == 404:
+            return [f'Image {location} not found. {img_msg}.']
+        return [f'Image {location} not accessible: {_redacted(str(e), container_sas_url)}. {img_msg}.']
+    except (OSError, requests.RequestException) as e:
+        return [f'Image {location} not accessible: {_redacted(str(e), container_sas_url)}. {img_msg}.']
+    except ValueError as e:
+        return [f'Image {location} could not be read: {e} {img_msg}.']
+
+    if (width, height) == (image.get('width'), image.get('height')):
+        return []
+
+    errors = [f'Declared size {image.get("width")}x{image.get("height")} does not match actual size {width}x{height}. {img_msg}.']
+    for key, dim in [('width', width), ('height', height)]:
+        if not quota_limit.min_image_dim <= dim <= quota_limit.max_image_dim:
+            errors.append(f'Actual {key} {dim} must be in [{quota_limit.min_image_dim}, {quota_limit.max_image_dim}]. {img_msg}.')
+    return errors
+
+
+def image_files_check(images: Iterable[dict], quota_limit: QuotaLimit, concurrency: int = 32, session: requests.Session = None, root=None,
+                      container_sas_url: str = None) -> Iterator[str]:
+    """
+    Yield error messages for images that are not accessible, not supported, or whose actual dimensions differ from the declared ones, in image order.
+
+    Only image headers are read: http(s) images with range requests over a pool of `concurrency` connections, local images from `root`. Images in a
+    private blob container, like the ones exported by export_cvs_data_to_blob_storage, are read with the SAS token of `container_sas_url`
+    (https://account.blob.core.windows.net/container?sv=...&sig=...), images denied access are reported as such.
+    """
+
+    session = session or create_session(SessionConfig(pool_maxsize=concurrency))
+    results = run_batch(lambda image: _image_file_check(image, quota_limit, session, root, container_sas_url), images, concurrency)
+    for result in tqdm(results, 'Checking image files...', total=len(images) if hasattr(images, '__len__') else None):
+        if result.ok:
+            yield from result.result
+        else:
+            yield f'Image could not be checked: {result.error}. image with id = {result.item.get("id")}.'
+
+
+def check_coco_annotation_file(coco_dict: dict, data_type: str, purpose: Purpose, verify_images: bool = False, root=None, concurrency: int = 32,
+                               container_sas_url: str = None):
+    """
+    Raise ValueError with the first problem found in the coco dict.
+
+    verify_images: also check that the images are accessible and of the declared dimensions, by reading their headers, see image_files_check
+    root: folder relative image paths are resolved against, usually the folder of the coco json file
+    container_sas_url: SAS url of the private blob container of the images, see image_files_check
+    """
+
     quota_limit = _get_quota_limit(data_type, purpose)
     _fields_present_and_has_value_check(coco_dict, None, 'images', 'annotations', 'categories')
     images_check(coco_dict['images'], quota_limit)
     categories_check(coco_dict['categories'], quota_limit)
     annotations_check(coco_dict['annotations'], data_type, len(coco_dict['images']), len(coco_dict['categories']), quota_limit)
+    if verify_images:
+        for error in image_files_check(coco_dict['images'], quota_limit, concurrency, root=root, container_sas_url=container_sas_url):
+            raise ValueError(error)
+
+
+_MAX_INT64 = 2 ** 63 - 1
+
+
+@dataclass
+class CocoCheckResult:
+    """
+    errors: error messages, at most max_errors of them
+    error_count: total number of errors found
+    """
+
+    errors: List[str] = field(default_factory=list)
+    error_count: int = 0
+    image_count: int = 0
+    category_count: int = 0
+    annotation_count: int = 0
+    category_stats: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error_count == 0
+
+
+class _CocoSummary:
+    """
+    Compact state of a streamed COCO file or set of shard files: ids in int64 arrays instead of dicts, category names by id, plus the errors found
+    item by item. Summaries of shards are merged into the summary of the whole dataset.
+    """
+
+    def __init__(self, max_errors: int) -> None:
+        self.max_errors = max_errors
+        self.image_ids = array.array('q')
+        self.categories = {}
+        self.duplicate_category_ids = []
+        self.annotation_ids = array.array('q')
+        self.annotation_image_ids = array.array('q')
+        self.annotation_category_ids = array.array('q')
+        self.errors = []
+        self.error_count = 0
+
+    def merge(self, other: '_CocoSummary') -> None:
+        self.image_ids.extend(other.image_ids)
+        self.annotation_ids.extend(other.annotation_ids)
+        self.annotation_image_ids.extend(other.annotation_image_ids)
+        self.annotation_category_ids.extend(other.annotation_category_ids)
+        # shards usually repeat the same categories, an id is only a duplicate within a shard or with a different name
+        for id, name in other.categories.items():
+            if id not in self.categories:
+                self.categories[id] = name
+            elif self.categories[id] != name:
+                self.error(f'Category with id = {id} is named "{self.categories[id]}" and "{name}" in different shards.')
+        self.duplicate_category_ids.extend(other.duplicate_category_ids)
+        self.error_count += other.error_count - len(other.errors)
+        for message in other.errors:
+            self.error(message)
+
+    def error(self, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def failures(self, checks: List[Check]) -> None:
+        """Add the failures of vectorized checks, building messages only for the ones kept."""
+
+        self.error_count += sum(int(mask.sum()) for mask, _ in checks)
+        for _, message in itertools.islice(iter_failures(checks), self.max_errors - len(self.errors)):
+            self.errors.append(message)
+
+
+def _stream_id_check(summary: _CocoSummary, value, id_name: str, msg: str) -> bool:
+    # upper bounds depend on the number of items, only known at the end of the stream, see _finish_check
+    if isinstance(value, int) and 0 < value <= _MAX_INT64:
+        return True
+    summary.error(f'{id_name} must be a positive integer, {value} found. {msg}.')
+    return False
+
+
+def _stream_fields_check(summary: _CocoSummary, item: dict, msg: str, *field_names) -> bool:
+    ok = True
+    for name in field_names:
+        if item.get(name) is None:
+            summary.error(f'"{name}" field missing or None. {msg}.')
+            ok = False
+    return ok
+
+
+def _stream_object_check(summary: _CocoSummary, item, section: str) -> bool:
+    if isinstance(item, dict):
+        return True
+    summary.error(f'Object expected in "{section}", {item!r} found.')
+    return False
+
+
+def _stream_image_check(summary: _CocoSummary, image, quota_limit: QuotaLimit) -> None:
+    if not _stream_object_check(summary, image, 'images'):
+        return
+
+    img_msg = f'image with id = {image.get("id")}'
+    _stream_fields_check(summary, image, img_msg, 'file_name')
+    if 'coco_url' not in image and 'absolute_url' not in image:
+        summary.error(f'Neither "coco_url" nor "absolute_url" present. {img_msg}.')
+    for key in ['width', 'height']:
+        dim = image.get(key)
+        if not (isinstance(dim, (int, float)) and quota_limit.min_image_dim <= dim <= quota_limit.max_image_dim):
+            summary.error(f'{key} {dim} must be present and in [{quota_limit.min_image_dim}, {quota_limit.max_image_dim}]. {img_msg}.')
+    if _stream_fields_check(summary, image, img_msg, 'id') and _stream_id_check(summary, image['id'], 'id', img_msg):
+        summary.image_ids.append(image['id'])
+
+
+def _stream_category_check(summary: _CocoSummary, category) -> None:
+    if not _stream_object_check(summary, category, 'categories'):
+        return
+
+    category_msg = f'category with id = {category.get("id")}'
+    _stream_fields_check(summary, category, category_msg, 'name')
+    if _stream_fields_check(summary, category, category_msg, 'id') and _stream_id_check(summary, category['id'], 'id', category_msg):
+        if category['id'] in summary.categories:
+            summary.duplicate_category_ids.append(category['id'])
+        else:
+            summary.categories[category['id']] = category.get('name')
+
+
+def _stream_annotation_check(summary: _CocoSummary, annotation, data_type: AnnotationKind) -> None:
+    if not _stream_object_check(summary, annotation, 'annotations'):
+        return
+
+    ann_msg = f'annotation with id = {annotation.get("id")}'
+    if not _stream_fields_check(summary, annotation, ann_msg, 'id', 'image_id', 'category_id'):
+        return
+    if data_type == AnnotationKind.OBJECT_DETECTION and _stream_fields_check(summary, annotation, ann_msg, 'bbox'):
+        try:
+            bbox_check(annotation['bbox'], ann_msg)
+        except (ValueError, TypeError) as e:
+            summary.error(str(e) if isinstance(e, ValueError) else f'bbox must be of 4 floats. {annotation["bbox"]} found. {ann_msg}')
+
+    ids_ok = _stream_id_check(summary, annotation['image_id'], 'image_id', ann_msg)
+    ids_ok = _stream_id_check(summary, annotation['category_id'], 'category_id', ann_msg) and ids_ok
+    ids_ok = _stream_id_check(summary, annotation['id'], 'id', ann_msg) and ids_ok
+    if ids_ok:
+        summary.annotation_ids.append(annotation['id'])
+        summary.annotation_image_ids.append(annotation['image_id'])
+        summary.annotation_category_ids.append(annotation['category_id'])
+
+
+def _finish_check(summary: _CocoSummary, quota_limit: QuotaLimit) -> CocoCheckResult:
+    """Checks that need all items: counts, id uniqueness, id upper bounds and images per category."""
+
+    n_images, n_categories, n_annotations = len(summary.image_ids), len(summary.categories), len(summary.annotation_ids)
+    if not quota_limit.min_image_cnt_per_tag <= n_images <= quota_limit.max_image_cnt:
+        summary.error(f'Number of images must be in [{quota_limit.min_image_cnt_per_tag}, {quota_limit.max_image_cnt}].')
+    if not quota_limit.min_categories <= n_categories <= quota_limit.max_categories:
+        summary.error(f'Number of categories must be in [{quota_limit.min_categories}, {quota_limit.max_categories}]')
+    names = [name for name in summary.categories.values() if name is not None]
+    if len(set(names)) != len(names):
+        logging.warning('Duplicate category name exists in "categories". It might harm your model performance.')
+
+    image_ids, annotation_ids = IntColumn(np.frombuffer(summary.image_ids, np.int64)), IntColumn(np.frombuffer(summary.annotation_ids, np.int64))
+    category_ids = IntColumn(np.fromiter(summary.categories, np.int64, len(summary.categories)))
+    for duplicates, name in [(duplicated_values(image_ids.array), 'image'), (sorted(set(summary.duplicate_category_ids))[:10], 'category'),
+                             (duplicated_values(annotation_ids.array), 'annotation')]:
+        if duplicates:
+            summary.error(f'Duplicate {name} ids exist: {duplicates}.')
+
+    summary.failures([_id_range_check(image_ids, n_images, 'id', lambda row: f'image with id = {image_ids.values[row]}')])
+    summary.failures([_id_range_check(category_ids, n_categories, 'id', lambda row: f'category with id = {category_ids.values[row]}')])
+
+    ann_msg = lambda row: f'annotation with id = {annotation_ids.values[row]}'  # noqa: E731
+    annotation_image_ids, annotation_category_ids = IntColumn(np.frombuffer(summary.annotation_image_ids, np.int64)), \
+        IntColumn(np.frombuffer(summary.annotation_category_ids, np.int64))
+    summary.failures([_id_range_check(annotation_image_ids, n_images, 'image_id', ann_msg), _id_range_check(annotation_category_ids, n_categories, 'category_id', ann_msg),
+                      _id_range_check(annotation_ids, n_annotations, 'id', ann_msg)])
+    category_stats = value_counts(annotation_category_ids.array)
+
+    for cat_id, stat in category_stats.items():
+        if stat < quota_limit.min_image_cnt_per_tag:
+            summary.error(f'Each category must have >= {quota_limit.min_image_cnt_per_tag} images present, only {stat} images found for category {cat_id}.')
+
+    return CocoCheckResult(summary.errors, summary.error_count, n_images, n_categories, n_annotations, category_stats)
+
+
+def _summarize_coco_stream(coco_json, data_type: AnnotationKind, quota_limit: QuotaLimit, max_errors: int, verify_images: bool = False, concurrency: int = 32,
+                           container_sas_url: str = None) -> _CocoSummary:
+    summary = _CocoSummary(max_errors)
+    sections = set()
+    for key, value in iter_coco_stream(coco_json):
+        if key not in COCO_SECTIONS:
+            continue
+        if value is ARRAY_START:
+            sections.add(key)
+        elif key == 'images':
+            _stream_image_check(summary, value, quota_limit)
+        elif key == 'categories':
+            _stream_category_check(summary, value)
+        elif key == 'annotations':
+            _stream_annotation_check(summary, value, data_type)
+
+    for section in COCO_SECTIONS:
+        if section not in sections:
+            summary.error(f'"{section}" field missing or None.')
+
+    if verify_images:
+        # second pass over the images only, so that memory stays bounded
+        images = (value for key, value in iter_coco_stream(coco_json) if key == 'images' and isinstance(value, dict))
+        for error in image_files_check(images, quota_limit, concurrency, root=pathlib.Path(coco_json).parent, container_sas_url=container_sas_url):
+            summary.error(error)
+
+    return summary
+
+
+def _summarize_shard(coco_json, data_type: AnnotationKind, quota_limit: QuotaLimit, max_errors: int, verify_images: bool, concurrency: int,
+                     container_sas_url: str) -> _CocoSummary:
+    # runs in a worker process, only the compact summary is sent back
+    try:
+        summary = _summarize_coco_stream(coco_json, data_type, quota_limit, max_errors, verify_images, concurrency, container_sas_url)
+    except (OSError, ValueError) as e:
+        summary = _CocoSummary(max_errors)
+        summary.error(str(e))
+
+    summary.errors = [f'{coco_json}: {message}' for message in summary.errors]
+    return summary
+
+
+def check_coco_annotation_file_streaming(coco_json, data_type: AnnotationKind, purpose: Purpose, max_errors: int = 1000, verify_images: bool = False,
+                                         concurrency: int = 32, container_sas_url: str = None) -> CocoCheckResult:
+    """
+    Same checks as check_coco_annotation_file, on a json file parsed incrementally in a single pass instead of a loaded dict, so that memory grows
+    with a few integers per item rather than with the file. All errors are collected instead of raising on the first one.
+
+    Args:
+        coco_json: path of the coco json file, or a file object
+        data_type (AnnotationKind): kind of annotations
+        purpose (Purpose): training or evaluation
+        max_errors (int): max number of error messages kept, later errors are only counted
+        verify_images (bool): also check the image files with image_files_check, in a second pass over the file, `coco_json` must be a path
+        concurrency (int): number of images checked at once
+        container_sas_url (str): SAS url of the private blob container of the images, see image_files_check
+
+    Returns:
+        CocoCheckResult
+    """
+
+    assert not verify_images or isinstance(coco_json, (str, os.PathLike)), 'Image verification requires the path of the coco json file.'
+
+    quota_limit = _get_quota_limit(data_type, purpose)
+    summary = _summarize_coco_stream(coco_json, data_type, quota_limit, max_errors, verify_images, concurrency, container_sas_url)
+    return _finish_check(summary, quota_limit)
+
+
+def check_coco_annotation_files(coco_jsons: List, data_type: AnnotationKind, purpose: Purpose, max_errors: int = 1000, max_workers: int = None,
+                                verify_images: bool = False, concurrency: int = 32, container_sas_url: str = None) -> CocoCheckResult:
+    """
+    Check a dataset split into several coco json shard files, like the ones listed in Dataset.annotation_file_uris, as if it were a single file.
+
+    Shards are streamed and checked in parallel in `max_workers` processes, each sending back a compact summary (id arrays, category names and
+    errors). The summaries are merged to check the constraints on the whole dataset: id uniqueness across shards, total number of images and
+    categories, id ranges and images per category. Categories may be repeated across shards with the same names.
+
+    Args:
+        coco_jsons (List): paths of the shard files
+        data_type (AnnotationKind): kind of annotations
+        purpose (Purpose): training or evaluation
+        max_errors (int): max number of error messages kept, later errors are only counted
+        max_workers (int): number of processes, defaults to the number of CPUs
+        verify_images (bool): also check the image files with image_files_check
+        concurrency (int): number of images checked at once by each process
+        container_sas_url (str): SAS url of the private blob container of the images, see image_files_check
+
+    Returns:
+        CocoCheckResult, with error messages of individual items prefixed by their shard file
+    """
+
+    assert coco_jsons
+
+    quota_limit = _get_quota_limit(data_type, purpose)
+    summary = _CocoSummary(max_errors)
+    n = len(coco_jsons)
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        shard_summaries = executor.map(_summarize_shard, coco_jsons, [data_type] * n, [quota_limit] * n, [max_errors] * n, [verify_images] * n, [concurrency] * n,
+                                       [container_sas_url] * n)
+        for shard_summary in tqdm(shard_summaries, 'Checking shards...', total=n):
+            summary.merge(shard_summary)
+
+    return _finish_check(summary, quota_limit)
 
 
 def _parse_args():
     parser = argparse.ArgumentParser('Check if coco annotation file is well prepared.')
-    parser.add_argument('--coco_json', '-c', type=pathlib.Path, help='Single coco json file to check.', required=True)
+    parser.add_argument('--coco_json', '-c', type=pathlib.Path, nargs='+', help='Coco json file to check, or shard files of one dataset.', required=True)
     parser.add_argument('--data_type', '-t', help='Type of data.', type=AnnotationKind, choices=list(AnnotationKind), required=True)
-    parser.add_argument('--purpose', '-t', help='Purpose for the data..', type=Purpose, choices=list(Purpose), required=True)
+    parser.add_argument('--purpose', '-p', help='Purpose for the data..', type=Purpose, choices=list(Purpose), required=True)
+    parser.add_argument('--streaming', '-s', action='store_true', help='Parse the file incrementally with bounded memory and report all errors instead of the first one.')
+    parser.add_argument('--max_errors', type=int, default=1000, help='Max number of errors reported in streaming mode.')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Number of processes checking shard files, defaults to the number of CPUs.')
+    parser.add_argument('--verify_images', '-v', action='store_true', help='Also check that images are accessible and of the declared width and height, by reading their headers.')
+    parser.add_argument('--concurrency', type=int, default=32, help='Number of images checked at once with --verify_images.')
+    parser.add_argument('--container_sas_url', type=str, default=os.environ.get('AZURE_STORAGE_CONTAINER_SAS_URL'),
+                        help='SAS url of the private blob container of the images, read with --verify_images. Defaults to the AZURE_STORAGE_CONTAINER_SAS_URL '
+                             'environment variable, so that the token does not show in the shell history.')
     return parser.parse_args()
 
 
 def main():
     args = _parse_args()
-    coco_dict = json.loads(args.coco_json.read_text(encoding='utf-8'))
+    coco_jsons = args.coco_json
+    note = '' if args.verify_images else ' Note that image file accessibility and image size is beyond this check, use --verify_images to check them.'
+    if args.streaming or len(coco_jsons) > 1:
+        if len(coco_jsons) > 1:
+            result = check_coco_annotation_files(coco_jsons, args.data_type, args.purpose, args.max_errors, args.workers, args.verify_images, args.concurrency,
+                                                 args.container_sas_url)
+        else:
+            result = check_coco_annotation_file_streaming(coco_jsons[0], args.data_type, args.purpose, args.max_errors, args.verify_images, args.concurrency,
+                                                          args.container_sas_url)
+        print(f'Number of images per category: {result.category_stats}.')
+        files = ', '.join(str(coco_json) for coco_json in coco_jsons)
+        if not result.ok:
+            for error in result.errors:
+                print(error)
+            if result.error_count > len(result.errors):
+                print(f'... {result.error_count - len(result.errors)} more errors.')
+            sys.exit(f'Annotation files {files} have {result.error_count} errors.')
+        print(f'Annotation files {files} look good as a {args.data_type} dataset for {args.purpose}!{note}')
+        return
+
+    coco_json = coco_jsons[0]
+    coco_dict = json.loads(coco_json.read_text(encoding='utf-8'))
     data_type = args.data_type
     purpose = args.purpose
-    check_coco_annotation_file(coco_dict, data_type, purpose)
-    print(f'Annotation file {args.coco_json} looks good as a {data_type} dataset for {args.purpose}! Note that image file accessibility and image size is beyond this check.')
+    check_coco_annotation_file(coco_dict, data_type, purpose, args.verify_images, coco_json.parent, args.concurrency, args.container_sas_url)
+    print(f'Annotation file {coco_json} looks good as a {data_type} dataset for {args.purpose}!{note}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+# a check is a mask of the failing rows and a function building the error message of a failing row
+Check = Tuple[np.ndarray, Callable[[int], str]]
+
+
+class IntColumn:
+    """
+    int64 column of a field of a list of COCO dicts. Values that are missing (None) or not integers in the int64 range are flagged in `missing` and
+    `invalid` and stored as 0, their original values stay available in `values` for error messages.
+    """
+
+    def __init__(self, values: Sequence) -> None:
+        self.values = values
+        try:
+            column = np.asarray(values) if len(values) else np.zeros(0, np.int64)
+        except (OverflowError, ValueError):
+            column = None
+
+        if column is not None and column.ndim == 1 and column.dtype.kind in 'iub':
+            self.array = column.astype(np.int64, copy=False)
+            self.missing = np.zeros(len(values), bool)
+            self.invalid = self.missing
+            return
+
+        # slow path, only taken when some values are not plain integers
+        valid = np.fromiter((isinstance(v, int) and -2 ** 63 <= v < 2 ** 63 for v in values), bool, len(values))
+        self.missing = np.fromiter((v is None for v in values), bool, len(values))
+        self.invalid = ~valid & ~self.missing
+        self.array = np.array([v if ok else 0 for v, ok in zip(values, valid)], np.int64)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def out_of_range(self, max_value: int) -> np.ndarray:
+        """Rows present but not integers in [1, max_value]."""
+
+        return ~self.missing & (self.invalid | (self.array <= 0) | (self.array > max_value))
+
+
+class BboxColumns:
+    """
+    (n, 4) float64 array of COCO bboxes. Rows that are not lists of 4 numbers are flagged in `malformed` and stored as NaN, missing bboxes (None)
+    are flagged in `missing`.
+    """
+
+    def __init__(self, bboxes: Sequence) -> None:
+        self.values = bboxes
+        try:
+            array = np.asarray(bboxes, dtype=np.float64) if len(bboxes) else np.zeros((0, 4))
+        except (TypeError, ValueError):
+            array = None
+
+        if array is not None and array.shape == (len(bboxes), 4):
+            self.array = array
+            self.missing = np.zeros(len(bboxes), bool)
+            self.malformed = self.missing
+            return
+
+        self.missing = np.fromiter((b is None for b in bboxes), bool, len(bboxes))
+        self.array = np.full((len(bboxes), 4), np.nan)
+        for i, bbox in enumerate(bboxes):
+            try:
+                if len(bbox) == 4:
+                    self.array[i] = bbox
+            except (TypeError, ValueError):
+                pass
+        self.malformed = ~self.missing & np.isnan(self.array).any(axis=1)
+
+
+def duplicated_values(column: np.ndarray, limit: int = 10) -> List[int]:
+    values, counts = np.unique(column, return_counts=True)
+    return values[counts > 1][:limit].tolist()
+
+
+def value_counts(column: np.ndarray) -> Dict[int, int]:
+    values, counts = np.unique(column, return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def iter_failures(checks: List[Check], first_per_row: bool = False) -> Iterator[Tuple[int, str]]:
+    """
+    (row, error message) of the failing checks in row order, and in the order of `checks` within a row. Messages are only built for failing rows.
+
+    first_per_row: only report the first failing check of each row
+    """
+
+    if not checks:
+        return
+
+    failing = np.logical_or.reduce([mask for mask, _ in checks])
+    for row in np.flatnonzero(failing).tolist():
+        for mask, message in checks:
+            if mask[row]:
+                yield row, message(row)
+                if first_per_row:
+                    break
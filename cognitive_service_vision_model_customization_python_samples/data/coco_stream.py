@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import re
+from typing import Any, Iterable, Iterator, Tuple, Union
+
+# yielded as the value of a streamed key when its array starts, so that empty arrays are visible to the consumer
+ARRAY_START = object()
+
+COCO_SECTIONS = ('images', 'categories', 'annotations')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+_decoder = json.JSONDecoder()
+
+
+class _Buffer:
+    def __init__(self, fp, chunk_size: int) -> None:
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._text = ''
+        self._pos = 0
+        self._offset = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        # read at least as much as already buffered, so a value larger than the chunk size is re-decoded a logarithmic number of times
+        chunk = self._fp.read(max(self._chunk_size, len(self._text) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._offset += self._pos
+        self._text = self._text[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f'Invalid json at character {self._offset + self._pos}: expected one of {chars!r}, found {char!r}.')
+        self._pos += 1
+        return char
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._text, self._pos)
+                # a number at the end of the buffer may continue in the next chunk, even when followed by a partial fraction or exponent, e.g. '0.'
+                # decodes as 0
+                if self._eof or _NUMBER_TAIL.match(self._text, end).end() < len(self._text):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self._eof:
+                    raise ValueError(f'Invalid json at character {self._offset + e.pos}: {e.msg}.') from None
+
+            self._fill()
+
+
+def iter_coco_stream(source: Union[str, os.PathLike, io.IOBase], streamed_keys: Iterable[str] = COCO_SECTIONS, chunk_size: int = 1 << 20) -> Iterator[Tuple[str, Any]]:
+    """
+    Parse a json object incrementally, yielding (key, value) for its top-level fields, except for the arrays under `streamed_keys`, for which
+    (key, ARRAY_START) is yielded and then (key, element) for each element. Memory use is bounded by the largest single element rather than the file.
+
+    Args:
+        source: path of the json file, or a text or binary file object
+        streamed_keys: top-level keys whose arrays are streamed element by element
+        chunk_size: number of characters read at once
+    """
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r', encoding='utf-8') as f:
+            yield from iter_coco_stream(f, streamed_keys, chunk_size)
+        return
+    if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+        source = io.TextIOWrapper(source, encoding='utf-8')
+
+    streamed_keys = frozenset(streamed_keys)
+    buffer = _Buffer(source, chunk_size)
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+
+    while True:
+        key = buffer.decode()
+        if not isinstance(key, str):
+            raise ValueError(f'Invalid json: object key expected, {key!r} found.')
+        buffer.expect(':')
+
+        if key in streamed_keys and buffer.peek() == '[':
+            buffer.expect('[')
+            yield key, ARRAY_START
+            if buffer.peek() == ']':
+                buffer.expect(']')
+            else:
+                while True:
+                    yield key, buffer.decode()
+                    if buffer.expect(',]') == ']':
+                        break
+        else:
+            yield key, buffer.decode()
+
+        if buffer.expect(',}') == '}':
+            return
@@ -1,31 +1,74 @@
-from typing import List, Union
+from typing import Dict, Iterable, Iterator, List, TextIO, Union
 from azure.cognitiveservices.vision.customvision.training import CustomVisionTrainingClient
 from azure.cognitiveservices.vision.customvision.training.models import Image, ImageTag, ImageRegion, Project
 from msrest.authentication import ApiKeyCredentials
 import argparse
+import array
+import collections
+import concurrent.futures
+import hashlib
+import os
+import queue
+import threading
 import time
 import json
 import pathlib
 import logging
-from azure.storage.blob import ContainerClient, BlobClient
-from azure.core.exceptions import ClientAuthenticationError
-import multiprocessing
+import urllib.parse
+from azure.storage.blob import BlobBlock, BlobClient, ContainerClient, ContentSettings
+from azure.core.exceptions import ClientAuthenticationError, ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
 
+from ..clients.session import SessionConfig, create_session
 
-N_PROCESS = 8
+
+N_COPY_THREADS = 64
+# max page size of get_images
+PAGE_SIZE = 256
+N_STATUS_THREADS = 16
+PREFETCH_PAGES = 4
+N_BATCHES_IN_FLIGHT = 4
+BLOCK_SIZE = 4 * 1024 * 1024
+MANIFEST_FILE_NAME = 'export_manifest.json'
+MIN_POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 2
 
 
 def get_file_name(sub_folder, image_id):
     return f'{sub_folder}/images/{image_id}'
 
 
-def blob_copy(params):
-    container_client, sub_folder, image = params
+def _strip_query(url):
+    return urllib.parse.urlsplit(url)._replace(query='', fragment='').geturl()
+
+
+def blob_copied(blob_client: BlobClient, source_url) -> bool:
+    """Whether the blob was already copied from `source_url`: copy succeeded and the blob size matches the copied size."""
+
+    try:
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return False
+
+    copy = properties.copy
+    # source urls carry a SAS token that changes every time images are listed
+    if copy.status != 'success' or not copy.source or _strip_query(copy.source) != _strip_query(source_url):
+        return False
+
+    return bool(copy.progress) and copy.progress.split('/')[-1] == str(properties.size)
+
+
+def blob_copy(container_client: ContainerClient, sub_folder, image: Image, skip_copied=False):
+    """Start copying an image to its blob, returns (blob client, copy status reported by the service) or None on error."""
+
     blob_client: BlobClient = container_client.get_blob_client(get_file_name(sub_folder, image.id))
 
     try:
-        blob_client.start_copy_from_url(image.original_image_uri)
-        return blob_client
+        if skip_copied and blob_copied(blob_client, image.original_image_uri):
+            return blob_client, 'success'
+        # small copies often complete synchronously, their status needs no polling
+        copy = blob_client.start_copy_from_url(image.original_image_uri)
+        return blob_client, copy.get('copy_status', 'pending')
     except ClientAuthenticationError as e:
         logging.error(f'Error copying image {image.id} from {image.original_image_uri} to {blob_client.url}. Error: {e.reason}')
     except Exception as e:
@@ -34,33 +77,68 @@ def blob_copy(params):
     return None
 
 
-def wait_for_completion(blobs, time_out=5):
-    pendings = blobs
-    time_break = 0.5
-    while pendings and time_out > 0:
-        pendings = [b for b in pendings if b.get_blob_properties().copy.status == 'pending']
-        if pendings:
-            logging.info(f'{len(pendings)} pending copies. wait for {time_break} seconds.')
-            time.sleep(time_break)
-            time_out -= time_break
+def _copy_status(blob_client: BlobClient):
+    try:
+        return blob_client.get_blob_properties().copy.status
+    except ResourceNotFoundError:
+        return 'failed'
+
+
+def wait_for_completion(blobs, time_out=5, statuses=None, executor: concurrent.futures.Executor = None):
+    """
+    Poll the copy status of the blobs still pending, concurrently, with intervals growing from MIN_POLL_INTERVAL to MAX_POLL_INTERVAL seconds, for at
+    most `time_out` seconds.
+
+    statuses: copy status of each blob when the copies were started, only the pending ones are polled. All are polled when None.
+    executor: thread pool for the status requests, a temporary one of N_STATUS_THREADS threads when None
+
+    Returns the last known copy status of each blob.
+    """
+
+    statuses = list(statuses) if statuses is not None else ['pending'] * len(blobs)
+    if executor is None:
+        with concurrent.futures.ThreadPoolExecutor(N_STATUS_THREADS) as executor:
+            return wait_for_completion(blobs, time_out, statuses, executor)
 
+    deadline = time.monotonic() + time_out
+    interval = MIN_POLL_INTERVAL
+    while True:
+        pendings = [i for i, status in enumerate(statuses) if status == 'pending']
+        if not pendings:
+            break
+        for i, status in zip(pendings, executor.map(_copy_status, [blobs[i] for i in pendings])):
+            statuses[i] = status
+
+        n_pendings = statuses.count('pending')
+        remaining = deadline - time.monotonic()
+        if not n_pendings or remaining <= 0:
+            break
+        logging.info(f'{n_pendings} pending copies. wait for {min(interval, remaining):.1f} seconds.')
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    return statuses
+
+
+def copy_images_with_retry(pool: concurrent.futures.Executor, container_client, sub_folder, images: List, batch_id, n_retries=5, skip_copied=False):
+    """
+    pool: thread pool sending the copy and copy status requests
+    skip_copied: do not copy again images whose blob was already copied from the same source, e.g. when resuming an export
+    """
 
-def copy_images_with_retry(pool, container_client, sub_folder, images: List, batch_id, n_retries=5):
     retry_limit = n_retries
     urls = []
     while images and n_retries > 0:
-        params = [(container_client, sub_folder, image) for image in images]
-        blobs = pool.map(blob_copy, params)
-        if any(b is None for b in blobs):
+        copies = list(pool.map(lambda image: blob_copy(container_client, sub_folder, image, skip_copied), images))
+        if any(c is None for c in copies):
             raise RuntimeError(f'Copy failed for some images in batch {batch_id}. Check your provided Azure Storage information.')
 
-        img_and_blobs = zip(images, blobs)
-
+        blobs = [blob for blob, _ in copies]
         logging.info(f'Batch {batch_id}: Copied {len(images)} images.')
-        urls = urls or [b.url for _, b in img_and_blobs]
+        urls = urls or [b.url for b in blobs]
 
-        wait_for_completion([b for _, b in img_and_blobs])
-        images = [image for image, b in img_and_blobs if b.get_blob_properties().copy.status in ['failed', 'aborted']]
+        statuses = wait_for_completion(blobs, statuses=[status for _, status in copies], executor=pool)
+        images = [image for image, status in zip(images, statuses) if status in ['failed', 'aborted']]
         n_retries -= 1
         if images:
             time.sleep(0.5 * (retry_limit - n_retries))
@@ -71,16 +149,57 @@ def copy_images_with_retry(pool, container_client, sub_folder, images: List, bat
     return urls
 
 
+class _StringColumn:
+    """Strings stored as an interned prefix, up to the last '/', plus their utf-8 encoded rest in one buffer, e.g. blob urls sharing their folder."""
+
+    def __init__(self):
+        self._prefix_ids = {}
+        self._prefixes = []
+        self._rows_prefix = array.array('l')
+        self._data = bytearray()
+        self._offsets = array.array('q', [0])
+
+    def __len__(self):
+        return len(self._rows_prefix)
+
+    def __getitem__(self, i):
+        return self._prefixes[self._rows_prefix[i]] + self._data[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+
+    def append(self, value: str):
+        split = value.rfind('/') + 1
+        prefix = value[:split]
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = self._prefix_ids[prefix] = len(self._prefixes)
+            self._prefixes.append(prefix)
+
+        self._rows_prefix.append(prefix_id)
+        self._data += value[split:].encode('utf-8')
+        self._offsets.append(len(self._data))
+
+
 class CocoOperator:
+    """
+    COCO dataset built image by image. Images and annotations are stored column-wise in arrays rather than as dicts, ids being their positions, so
+    that projects with millions of regions fit in memory. They are turned into COCO dicts only when serialized.
+    """
+
     def __init__(self):
-        self._images = []
-        self._annotations = []
+        self._widths = array.array('l')
+        self._heights = array.array('l')
+        self._coco_urls = _StringColumn()
+        self._file_names = _StringColumn()
+        self._annotation_image_ids = array.array('q')
+        self._annotation_category_ids = array.array('q')
+        # left, top, width, height per annotation, zeros when it has no bbox. float64 since float32 rounding may push left + width above 1
+        self._bboxes = array.array('d')
+        self._has_bbox = array.array('b')
         self._categories = []
         self._category_name_to_id = {}
 
     @property
     def num_imges(self):
-        return len(self._images)
+        return len(self._widths)
 
     @property
     def num_categories(self):
@@ -88,26 +207,19 @@ class CocoOperator:
 
     @property
     def num_annotations(self):
-        return len(self._annotations)
+        return len(self._annotation_image_ids)
 
     def add_image(self, width, height, coco_url, file_name):
-        self._images.append(
-            {
-                'id': len(self._images) + 1,
-                'width': width,
-                'height': height,
-                'coco_url': coco_url,
-                'file_name': file_name,
-            })
+        self._widths.append(width)
+        self._heights.append(height)
+        self._coco_urls.append(coco_url)
+        self._file_names.append(file_name)
 
     def add_annotation(self, image_id, category_id_or_name: Union[int, str], bbox: List[float] = None):
-        self._annotations.append({
-            'id': len(self._annotations) + 1,
-            'image_id': image_id,
-            'category_id': category_id_or_name if isinstance(category_id_or_name, int) else self._category_name_to_id[category_id_or_name]})
-
-        if bbox:
-            self._annotations[-1]['bbox'] = bbox
+        self._annotation_image_ids.append(image_id)
+        self._annotation_category_ids.append(category_id_or_name if isinstance(category_id_or_name, int) else self._category_name_to_id[category_id_or_name])
+        self._has_bbox.append(bool(bbox))
+        self._bboxes.extend(bbox if bbox else (0, 0, 0, 0))
 
     def add_category(self, name):
         self._categories.append({
@@ -117,14 +229,285 @@ class CocoOperator:
 
         self._category_name_to_id[name] = len(self._categories)
 
+    def _image(self, i) -> dict:
+        return {'id': i + 1, 'width': self._widths[i], 'height': self._heights[i], 'coco_url': self._coco_urls[i], 'file_name': self._file_names[i]}
+
+    def _annotation(self, i) -> dict:
+        annotation = {'id': i + 1, 'image_id': self._annotation_image_ids[i], 'category_id': self._annotation_category_ids[i]}
+        if self._has_bbox[i]:
+            annotation['bbox'] = self._bboxes[4 * i:4 * i + 4].tolist()
+        return annotation
+
+    def add_entries(self, entries: List[dict]):
+        """Add images with their annotations, as {'width', 'height', 'coco_url', 'file_name', 'annotations': [[category name, bbox or None], ...]}."""
+
+        for entry in entries:
+            self.add_image(entry['width'], entry['height'], entry['coco_url'], entry['file_name'])
+            for category_name, bbox in entry['annotations']:
+                self.add_annotation(self.num_imges, category_name, bbox)
+
+    def iter_json(self, items_per_chunk=1024) -> Iterator[str]:
+        """The coco json, compact, in pieces of `items_per_chunk` items, to be written or uploaded without building the whole string."""
+
+        sections = [('images', self.num_imges, self._image), ('categories', self.num_categories, self._categories.__getitem__),
+                    ('annotations', self.num_annotations, self._annotation)]
+        yield '{'
+        for i, (key, n_items, item) in enumerate(sections):
+            yield f'{"," if i else ""}"{key}":['
+            for start in range(0, n_items, items_per_chunk):
+                chunk = ','.join(json.dumps(item(j), ensure_ascii=False, separators=(',', ':')) for j in range(start, min(start + items_per_chunk, n_items)))
+                yield f',{chunk}' if start else chunk
+            yield ']'
+        yield '}'
+
+    def write(self, fp: TextIO):
+        for piece in self.iter_json():
+            fp.write(piece)
+
     def to_json(self) -> str:
-        coco_dict = {
-            'images': self._images,
-            'categories': self._categories,
-            'annotations': self._annotations,
-        }
+        return ''.join(self.iter_json())
+
+
+def upload_blocks(blob_client: BlobClient, chunks: Iterable[bytes], block_size=BLOCK_SIZE, content_type='application/json'):
+    """Upload the concatenation of `chunks` as a block blob, staging a block every `block_size` bytes, so that memory use is bounded by the block size."""
+
+    block_ids = []
+    buffer = bytearray()
+
+    def stage():
+        block_id = f'{len(block_ids):08d}'
+        blob_client.stage_block(block_id, bytes(buffer))
+        block_ids.append(BlobBlock(block_id))
+        buffer.clear()
+
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= block_size:
+            stage()
+    if buffer:
+        stage()
+
+    blob_client.commit_block_list(block_ids, content_settings=ContentSettings(content_type=content_type))
+
+
+class ExportJournal:
+    """
+    Append-only JSON lines checkpoint of an export: a header line identifying the project, then one line per exported batch with the page cursor
+    after the batch and the COCO entries of its images. Lines are flushed to disk once the batch images are copied, so that an interrupted
+    export resumes after the last completed batch instead of starting over. A partially written last line is discarded on resume.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = pathlib.Path(path)
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self, project_id, sub_folder):
+        self.close()
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._write({'project_id': project_id, 'sub_folder': sub_folder})
+
+    def resume(self, project_id, sub_folder) -> List[dict]:
+        """Batch records of the journal, starting a new journal if there is none."""
+
+        if not self.path.exists():
+            logging.warning(f'No checkpoint found at {self.path}, starting the export from scratch.')
+            self.start(project_id, sub_folder)
+            return []
+
+        records = []
+        valid_length = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                records.append(record)
+                valid_length += len(line)
+
+        if not records or records[0].get('project_id') != project_id:
+            raise ValueError(f'Checkpoint {self.path} is not an export of project {project_id}.')
+
+        self.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(valid_length)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        return records[1:]
+
+    def append(self, batch_id, skip, entries: List[dict]):
+        self._write({'batch_id': batch_id, 'skip': skip, 'entries': entries})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def _coco_entries(images: List[Image], urls, sub_folder) -> List[dict]:
+    entries = []
+    for image, url in zip(images, urls):
+        image_regions: List[ImageRegion] = image.regions
+        image_tags: List[ImageTag] = image.tags
+        if image_regions:
+            annotations = [[img_region.tag_name, [img_region.left, img_region.top, img_region.width, img_region.height]] for img_region in image_regions]
+        elif image_tags:
+            annotations = [[img_tag.tag_name, None] for img_tag in image_tags]
+        else:
+            annotations = []
+        entries.append({'image_id': image.id, 'width': image.width, 'height': image.height, 'coco_url': url, 'file_name': get_file_name(sub_folder, image.id),
+                        'annotations': annotations})
+
+    return entries
+
+
+def _iter_pages(trainer: CustomVisionTrainingClient, project_id, skip):
+    while True:
+        images: List[Image] = trainer.get_images(project_id=project_id, take=PAGE_SIZE, skip=skip)
+        if not images:
+            return
+        skip += len(images)
+        yield images, skip
+
+
+def _put(items: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _prefetch(iterable, n):
+    """Iterate `iterable` in a background thread running up to `n` items ahead of the consumer. Exceptions are raised in the consumer."""
+
+    items = queue.Queue(n)
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(items, (item, None), stop):
+                    return
+            _put(items, (end, None), stop)
+        except Exception as e:
+            _put(items, (end, e), stop)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def copy_new_images(pool, container_client: ContainerClient, sub_folder, images: List[Image], batch_id, skip_copied=False, exported=frozenset()):
+    """Copy the images whose ids are not in `exported`, returns the blob urls of all images."""
+
+    new_images = [image for image in images if image.id not in exported]
+    copied = iter(copy_images_with_retry(pool, container_client, sub_folder, new_images, batch_id, skip_copied=skip_copied))
+    return [container_client.get_blob_client(get_file_name(sub_folder, image.id)).url if image.id in exported else next(copied) for image in images]
+
+
+def export_batches(trainer: CustomVisionTrainingClient, project_id, pool, container_client, sub_folder, skip=0, batch_id=0, skip_copied=False, exported=frozenset(),
+                   prefetch_pages=PREFETCH_PAGES, n_batches_in_flight=N_BATCHES_IN_FLIGHT):
+    """
+    Copy the images of the project from `skip` on, page by page, and yield (batch id, page cursor after the batch, COCO entries) in page order as the
+    copies of each batch complete. Images whose ids are in `exported` are not copied again, see copy_new_images.
+
+    Pages are fetched up to `prefetch_pages` ahead in a background thread, and the copies of up to `n_batches_in_flight` batches run at the same time,
+    so that listing, copying and waiting for copies overlap instead of adding up.
+    """
 
-        return json.dumps(coco_dict, ensure_ascii=False, indent=2)
+    in_flight = collections.deque()
+
+    def complete_oldest():
+        done_batch_id, done_skip, done_images, copy = in_flight.popleft()
+        return done_batch_id, done_skip, _coco_entries(done_images, copy.result(), sub_folder)
+
+    with concurrent.futures.ThreadPoolExecutor(n_batches_in_flight) as copier:
+        pages = _prefetch(_iter_pages(trainer, project_id, skip), prefetch_pages)
+        try:
+            for images, next_skip in pages:
+                copy = copier.submit(copy_new_images, pool, container_client, sub_folder, images, batch_id, skip_copied=skip_copied, exported=exported)
+                in_flight.append((batch_id, next_skip, images, copy))
+                batch_id += 1
+                while in_flight and (len(in_flight) >= n_batches_in_flight or in_flight[0][3].done()):
+                    yield complete_oldest()
+
+            while in_flight:
+                yield complete_oldest()
+        finally:
+            pages.close()
+            for *_, copy in in_flight:
+                copy.cancel()
+
+
+def annotations_fingerprint(annotations: List) -> str:
+    """Short digest of the COCO entry annotations of an image, to tell images whose tags or regions changed since the last export."""
+
+    return hashlib.sha1(json.dumps(annotations, separators=(',', ':')).encode('utf-8')).hexdigest()[:16]
+
+
+def load_manifest(container_client: ContainerClient, sub_folder) -> Dict[str, str]:
+    """Annotation fingerprints by image id of the last export to `sub_folder`, empty if there is none."""
+
+    try:
+        return json.loads(container_client.get_blob_client(f'{sub_folder}/{MANIFEST_FILE_NAME}').download_blob().readall())['images']
+    except ResourceNotFoundError:
+        return {}
+
+
+def upload_manifest(container_client: ContainerClient, sub_folder, manifest: Dict[str, str]):
+    def pieces():
+        yield '{"images":{'
+        for i, (image_id, fingerprint) in enumerate(manifest.items()):
+            yield f'{"," if i else ""}{json.dumps(image_id)}:{json.dumps(fingerprint)}'
+        yield '}}'
+
+    upload_blocks(container_client.get_blob_client(f'{sub_folder}/{MANIFEST_FILE_NAME}'), (piece.encode('utf-8') for piece in pieces()))
+
+
+def upload_coco_json(container_client: ContainerClient, sub_folder, coco_operator: CocoOperator, manifest: Dict[str, str], overwrite: bool) -> bool:
+    """
+    Upload the coco json of an export to `sub_folder`, then its manifest, unless a coco json exists there already and `overwrite` is False. The
+    manifest is only replaced along with the coco json, so that the two always describe the same export.
+
+    Returns: whether the coco json and the manifest were uploaded
+    """
+
+    coco_json_blob_client: BlobClient = container_client.get_blob_client(f'{sub_folder}/train.json')
+    if coco_json_blob_client.exists() and not overwrite:
+        logging.warning(f'coco json file exists in blob. Skipped uploading it and the export manifest. If existing one is outdated, please manually upload your new '
+                        f'coco json from ./train.json to {coco_json_blob_client.url}, or export again with --delta')
+        return False
+
+    upload_blocks(coco_json_blob_client, (piece.encode('utf-8') for piece in coco_operator.iter_json()))
+    logging.info(f'coco file train.json uploaded to {coco_json_blob_client.url}.')
+    upload_manifest(container_client, sub_folder, manifest)
+    return True
 
 
 def log_project_info(training_client: CustomVisionTrainingClient, project_id):
@@ -138,9 +521,23 @@ def log_project_info(training_client: CustomVisionTrainingClient, project_id):
                  f' untagged: {training_client.get_untagged_image_count(project_id)})')
 
 
-def export_data(azure_storage_account_name, azure_storage_key, azure_storage_container_name, custom_vision_endpoint, custom_vision_training_key, custom_vision_project_id, n_process):
+def export_data(azure_storage_account_name, azure_storage_key, azure_storage_container_name, custom_vision_endpoint, custom_vision_training_key, custom_vision_project_id,
+                n_process=N_COPY_THREADS, checkpoint_path='export_checkpoint.jsonl', resume=False, delta=False):
+    """
+    n_process: number of concurrent copy requests, sent from threads sharing one connection pool
+    checkpoint_path: journal of the exported batches, see ExportJournal, None to disable checkpointing
+    resume: continue an interrupted export from `checkpoint_path`, skipping images already copied
+    delta: only copy images added since the last export, according to its manifest, and replace the coco json in blob with the current annotations
+        of all images. Image files never change in Custom Vision, changes to their tags or regions only update the coco json
+
+    Every export uploading its coco json records the exported image ids and the fingerprints of their annotations in a manifest blob next to it.
+    """
+
     azure_storage_account_url = f"https://{azure_storage_account_name}.blob.core.windows.net"
-    container_client = ContainerClient(azure_storage_account_url, azure_storage_container_name, credential=azure_storage_key)
+    # copy and status requests of all batches in flight share the connections of one session
+    session = create_session(SessionConfig(pool_maxsize=n_process))
+    transport = RequestsTransport(session=session, session_owner=False)
+    container_client = ContainerClient(azure_storage_account_url, azure_storage_container_name, credential=azure_storage_key, transport=transport)
     credentials = ApiKeyCredentials(in_headers={"Training-key": custom_vision_training_key})
     trainer = CustomVisionTrainingClient(custom_vision_endpoint, credentials)
 
@@ -153,35 +550,46 @@ def export_data(azure_storage_account_name, azure_storage_key, azure_storage_con
     project_name = trainer.get_project(custom_vision_project_id).name
     log_project_info(trainer, custom_vision_project_id)
     sub_folder = f'{project_name}_{custom_vision_project_id}'
-    with multiprocessing.Pool(n_process) as pool:
-        while True:
-            images: List[Image] = trainer.get_images(project_id=custom_vision_project_id, skip=skip)
-            if not images:
-                break
-            urls = copy_images_with_retry(pool, container_client, sub_folder, images, batch_id)
-            for i, image in enumerate(images):
-                coco_operator.add_image(image.width, image.height, urls[i], get_file_name(sub_folder, image.id))
-                image_tags: List[ImageTag] = image.tags
-                image_regions: List[ImageRegion] = image.regions
-                if image_regions:
-                    for img_region in image_regions:
-                        coco_operator.add_annotation(coco_operator.num_imges, img_region.tag_name, [img_region.left, img_region.top, img_region.width, img_region.height])
-                elif image_tags:
-                    for img_tag in image_tags:
-                        coco_operator.add_annotation(coco_operator.num_imges, img_tag.tag_name)
-
-            skip += len(images)
-            batch_id += 1
+    previous_manifest = load_manifest(container_client, sub_folder) if delta else {}
+    if delta:
+        logging.info(f'Delta export, {len(previous_manifest)} images exported before.')
+    manifest = {}
+
+    def add_entries(entries):
+        coco_operator.add_entries(entries)
+        for entry in entries:
+            manifest[entry['image_id']] = annotations_fingerprint(entry['annotations'])
+
+    journal = ExportJournal(checkpoint_path) if checkpoint_path else None
+    if journal and resume:
+        for record in journal.resume(custom_vision_project_id, sub_folder):
+            add_entries(record['entries'])
+            skip, batch_id = record['skip'], record['batch_id'] + 1
+        logging.info(f'Resuming export after {skip} images ({batch_id} batches) from {checkpoint_path}.')
+    elif journal:
+        journal.start(custom_vision_project_id, sub_folder)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(n_process) as pool:
+            batches = export_batches(trainer, custom_vision_project_id, pool, container_client, sub_folder, skip, batch_id, skip_copied=resume, exported=previous_manifest.keys())
+            for batch_id, skip, entries in batches:
+                add_entries(entries)
+                if journal:
+                    journal.append(batch_id, skip, entries)
+    finally:
+        if journal:
+            journal.close()
 
     coco_json_file_name = 'train.json'
     local_json = pathlib.Path(coco_json_file_name)
-    local_json.write_text(coco_operator.to_json(), encoding='utf-8')
-    coco_json_blob_client: BlobClient = container_client.get_blob_client(f'{sub_folder}/{coco_json_file_name}')
-    if coco_json_blob_client.exists():
-        logging.warning(f'coco json file exists in blob. Skipped uploading. If existing one is outdated, please manually upload your new coco json from ./train.json to {coco_json_blob_client.url}')
-    else:
-        coco_json_blob_client.upload_blob(local_json.read_bytes())
-        logging.info(f'coco file train.json uploaded to {coco_json_blob_client.url}.')
+    with open(local_json, 'w', encoding='utf-8') as f:
+        coco_operator.write(f)
+    if delta:
+        n_new = sum(image_id not in previous_manifest for image_id in manifest)
+        n_changed = sum(previous_manifest.get(image_id, fingerprint) != fingerprint for image_id, fingerprint in manifest.items())
+        n_removed = sum(image_id not in manifest for image_id in previous_manifest)
+        logging.info(f'Delta export: {n_new} new images, {n_changed} images with changed annotations, {n_removed} images removed.')
+    upload_coco_json(container_client, sub_folder, coco_operator, manifest, overwrite=delta)
 
 
 def parse_args():
@@ -195,7 +603,10 @@ def parse_args():
     parser.add_argument('--azure_storage_account_key', '-t', type=str, required=True, help='Azure storage account key.')
     parser.add_argument('--azure_storage_container_name', '-c', type=str, required=True, help='Azure storage container name.')
 
-    parser.add_argument('--n_process', '-n', type=int, required=False, default=8, help='Number of processes used in exporting data.')
+    parser.add_argument('--concurrency', '--n_process', '-n', dest='n_process', type=int, required=False, default=N_COPY_THREADS, help='Number of concurrent copy requests.')
+    parser.add_argument('--checkpoint', type=str, required=False, default='export_checkpoint.jsonl', help='Checkpoint file recording exported batches.')
+    parser.add_argument('--resume', '-r', action='store_true', help='Resume an interrupted export from the checkpoint file, without copying images again.')
+    parser.add_argument('--delta', '-d', action='store_true', help='Only copy images added since the last export and update its coco json.')
 
     return parser.parse_args()
 
@@ -204,7 +615,7 @@ def main():
     args = parse_args()
 
     export_data(args.azure_storage_account_name, args.azure_storage_account_key, args.azure_storage_container_name,
-                args.custom_vision_endpoint, args.custom_vision_training_key, args.custom_vision_project_id, args.n_process)
+                args.custom_vision_endpoint, args.custom_vision_training_key, args.custom_vision_project_id, args.n_process, args.checkpoint, args.resume, args.delta)
 
 
 if __name__ == '__main__':
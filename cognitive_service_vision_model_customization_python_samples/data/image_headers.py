@@ -0,0 +1,194 @@
+import os
+import pathlib
+import struct
+import urllib.parse
+import urllib.request
+from typing import Iterator, Optional, Tuple
+
+import requests
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# start of frame markers, the others (DHT C4, JPG C8, DAC CC) share the range but carry no dimensions
+_JPEG_SOF_MARKERS = frozenset([0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF])
+# markers without a length field
+_JPEG_STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xDA)))
+
+
+def image_size_from_header(header: bytes) -> Optional[Tuple[int, int]]:
+    """
+    (width, height) read from the first bytes of a JPEG, PNG, GIF, BMP or WebP file without decoding the pixels.
+
+    Returns None when `header` is too short to tell, raises ValueError when the format is not supported or the header is corrupted.
+    """
+
+    if len(header) < 12:
+        return None
+
+    if header.startswith(b'\xff\xd8\xff'):
+        return _jpeg_size(header)
+    if header.startswith(_PNG_SIGNATURE):
+        if len(header) < 24:
+            return None
+        if header[12:16] != b'IHDR':
+            raise ValueError('Corrupted PNG header.')
+        return struct.unpack('>II', header[16:24])
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', header[6:10])
+    if header.startswith(b'BM'):
+        return _bmp_size(header)
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return _webp_size(header)
+
+    raise ValueError('Unsupported image format, expected JPEG, PNG, GIF, BMP or WebP.')
+
+
+def _jpeg_size(header: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    while i + 4 <= len(header):
+        if header[i] != 0xFF:
+            raise ValueError('Corrupted JPEG header.')
+        marker = header[i + 1]
+        if marker == 0xFF:
+            # fill byte
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker == 0xDA:
+            raise ValueError('Corrupted JPEG header, no frame header before the image data.')
+
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > len(header):
+                return None
+            height, width = struct.unpack('>HH', header[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack('>H', header[i + 2:i + 4])[0]
+
+    return None
+
+
+def _bmp_size(header: bytes) -> Optional[Tuple[int, int]]:
+    if len(header) < 26:
+        return None
+
+    dib_header_size = struct.unpack('<I', header[14:18])[0]
+    if dib_header_size == 12:
+        return struct.unpack('<HH', header[18:22])
+    width, height = struct.unpack('<ii', header[18:26])
+    # negative heights are top-down bitmaps
+    return width, abs(height)
+
+
+def _webp_size(header: bytes) -> Optional[Tuple[int, int]]:
+    if len(header) < 30:
+        return None
+
+    chunk = header[12:16]
+    if chunk == b'VP8 ':
+        if header[23:26] != b'\x9d\x01\x2a':
+            raise ValueError('Corrupted WebP header.')
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        if header[20] != 0x2F:
+            raise ValueError('Corrupted WebP header.')
+        bits = int.from_bytes(header[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+
+    raise ValueError('Corrupted WebP header.')
+
+
+def _http_chunks(session: requests.Session, url: str, chunk_size: int, timeout: float) -> Iterator[bytes]:
+    start = 0
+    while True:
+        response = session.get(url, headers={'Range': f'bytes={start}-{start + chunk_size - 1}'}, stream=True, timeout=timeout)
+        try:
+            if response.status_code == 416:
+                # range past the end of the file
+                return
+            response.raise_for_status()
+            if response.status_code != 206:
+                # ranges not supported, read the beginning of the full body and drop the connection
+                yield from response.iter_content(chunk_size)
+                return
+
+            chunk = response.content
+        finally:
+            response.close()
+
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        start += len(chunk)
+        chunk_size *= 2
+
+
+def _file_chunks(path: pathlib.Path, chunk_size: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+            chunk_size *= 2
+
+
+def with_container_sas(url: str, container_sas_url: str = None) -> str:
+    """
+    `url` with the SAS token of `container_sas_url` appended when `url` is a blob of that container, else `url` unchanged, so that the token is
+    never sent to another container or host.
+
+    container_sas_url: container url followed by a SAS token as query string, e.g. https://account.blob.core.windows.net/container?sv=...&sig=...
+    """
+
+    if not container_sas_url:
+        return url
+
+    container_url, _, sas_token = container_sas_url.partition('?')
+    if not sas_token or not url.startswith(container_url.rstrip('/') + '/'):
+        return url
+
+    return f'{url}{"&" if "?" in url else "?"}{sas_token}'
+
+
+def fetch_image_size(location: str, session: requests.Session = None, root: os.PathLike = None, chunk_size: int = 4096, max_header_bytes: int = 1 << 20,
+                     timeout: float = 30, container_sas_url: str = None) -> Tuple[int, int]:
+    """
+    (width, height) of the image at `location`, reading only as much of its header as needed: ranges of `chunk_size` bytes, doubling each time,
+    up to `max_header_bytes` (JPEG frame headers may follow large EXIF thumbnails).
+
+    Args:
+        location: http(s) url, file url, or local path, relative paths are resolved against `root`
+        session: requests session for http(s) urls, e.g. clients.create_session(SessionConfig(pool_maxsize=concurrency)) when called from threads
+        container_sas_url: SAS url of a private blob container, whose token authorizes the requests to the blobs of that container, see
+            with_container_sas
+
+    Raises:
+        OSError, requests.RequestException: the image is not accessible
+        ValueError: the image format is not supported, or its dimensions were not found
+    """
+
+    scheme = urllib.parse.urlsplit(location).scheme.lower()
+    if scheme in ('http', 'https'):
+        chunks = _http_chunks(session or requests.Session(), with_container_sas(location, container_sas_url), chunk_size, timeout)
+    elif scheme == 'file':
+        chunks = _file_chunks(pathlib.Path(urllib.request.url2pathname(urllib.parse.urlsplit(location).path)), chunk_size)
+    else:
+        chunks = _file_chunks(pathlib.Path(root or '.') / location, chunk_size)
+
+    header = b''
+    try:
+        for chunk in chunks:
+            header += chunk
+            size = image_size_from_header(header)
+            if size is not None:
+                return size
+            if len(header) >= max_header_bytes:
+                break
+    finally:
+        chunks.close()
+
+    raise ValueError(f'Image dimensions not found in the first {len(header)} bytes.')
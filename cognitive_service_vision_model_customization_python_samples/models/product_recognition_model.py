@@ -39,3 +39,18 @@ class ProductRecognitionResponse(ProductRecognition):
             json['updatedDateTime'],
             json.get('result'),
             Error(json.get('error')))
+
+    def to_dict(self) -> dict:
+        json = {
+            'runName': self.name,
+            'modelName': self.model_name,
+            'status': self.status.value,
+            'createdDateTime': self.created_date_time,
+            'updatedDateTime': self.updated_date_time,
+            'result': self.result
+        }
+        if self.error and self.error.code:
+            # from_response keeps the error json of the service as is in Error.code
+            json['error'] = self.error.code
+
+        return json
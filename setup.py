@@ -27,8 +27,13 @@ setuptools.setup(name='cognitive-service-vision-model-customization-python-sampl
                      'azure-storage-blob',
                      'azure-cognitiveservices-vision-customvision',
                      'cffi',
+                     'numpy',
                      'opencv-python-headless'
                  ],
+                 extras_require={
+                     'aio': ['httpx[http2]'],
+                     'otel': ['opentelemetry-api'],
+                 },
                  classifiers=[
                      'Development Status :: 4 - Beta',
                      'Intended Audience :: Developers',
@@ -0,0 +1,54 @@
+import http.server
+import json
+import threading
+
+
+class StubServer:
+    """Local HTTP/1.1 server answering requests through a responder callable, recording every request it sees."""
+
+    def __init__(self, responder=None, with_headers=False):
+        """with_headers: also pass the request headers to the responder, as a fourth argument"""
+
+        self.requests = []
+        self.client_ports = set()
+        self._responder = responder or (lambda method, path, body: (200, {}, {}))
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                stub.requests.append((self.command, self.path, dict(self.headers), body))
+                stub.client_ports.add(self.client_address[1])
+                args = (self.command, self.path, body, dict(self.headers)) if with_headers else (self.command, self.path, body)
+                status, headers, payload = stub._responder(*args)
+                content = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                headers = dict({'Content-Type': 'application/json'}, **headers)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_PUT = do_POST = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,184 @@
+import asyncio
+import io
+import json
+import pathlib
+import tempfile
+import threading
+import unittest
+
+import cv2
+import numpy as np
+import pytest
+
+httpx = pytest.importorskip('httpx')
+
+from cognitive_service_vision_model_customization_python_samples import ResourceType, ProductRecognition, ProductRecognitionStatus, HistogramCollector, \
+    ImagePreprocessor  # noqa: E402
+from cognitive_service_vision_model_customization_python_samples.clients.aio import PredictionClient, ProductRecognitionClient, create_session  # noqa: E402
+from .stub_server import StubServer  # noqa: E402
+
+
+def _run_response(name, status):
+    return {'runName': name, 'modelName': 'ms-pretrained-product-detection', 'status': status, 'createdDateTime': '', 'updatedDateTime': '', 'result': {'products': []}}
+
+
+class GatedStream(io.RawIOBase):
+    """Non-seekable stream whose first read waits until the event loop opens the gate, which it cannot do while the read blocks it."""
+
+    def __init__(self, data, gate: threading.Event):
+        self._data = io.BytesIO(data)
+        self._gate = gate
+        self.gate_opened = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.gate_opened is None:
+            self.gate_opened = self._gate.wait(2)
+        return self._data.readinto(b)
+
+
+class TestAioClients(unittest.TestCase):
+    def test_predict_returns_json(self):
+        requests_seen = []
+
+        def handler(request: httpx.Request):
+            requests_seen.append(request)
+            return httpx.Response(200, json={'modelVersion': '1'})
+
+        async def run():
+            async with create_session(transport=httpx.MockTransport(handler)) as session:
+                client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=session)
+                return await client.predict('model', b'image')
+
+        self.assertEqual(asyncio.run(run()), {'modelVersion': '1'})
+        self.assertEqual(requests_seen[0].url.params['model-name'], 'model')
+        self.assertEqual(requests_seen[0].headers['Ocp-Apim-Subscription-Key'], 'test_key')
+        self.assertEqual(requests_seen[0].content, b'image')
+
+    def test_product_recognition_runs_concurrently(self):
+        statuses = {}
+
+        def handler(request: httpx.Request):
+            name = request.url.path.split('/')[-1]
+            if request.method == 'PUT':
+                statuses[name] = 'notStarted'
+            elif request.method == 'GET':
+                statuses[name] = 'succeeded' if statuses[name] == 'running' else 'running'
+            return httpx.Response(200, content=json.dumps(_run_response(name, statuses[name])))
+
+        async def run():
+            async with create_session(transport=httpx.MockTransport(handler)) as session:
+                client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=session)
+                runs = [ProductRecognition(f'run{i}', 'ms-pretrained-product-detection') for i in range(20)]
+                await asyncio.gather(*[client.create_run(run, b'image') for run in runs])
+                return await asyncio.gather(*[client.wait_for_completion(run.name, run.model_name, check_wait_in_secs=0) for run in runs])
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(r.status == ProductRecognitionStatus.SUCCEEDED for r in results))
+
+    def test_error_status_raises(self):
+        async def run():
+            async with create_session(transport=httpx.MockTransport(lambda request: httpx.Response(404, json={}))) as session:
+                client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=session)
+                await client.predict('model', b'image')
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            asyncio.run(run())
+
+    def test_throttled_request_is_retried(self):
+        statuses = [429, 200]
+
+        async def run():
+            transport = httpx.MockTransport(lambda request: httpx.Response(statuses.pop(0), headers={'Retry-After': '0'}, json={'modelVersion': '1'}))
+            async with create_session(transport=transport) as session:
+                client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=session)
+                return await client.predict('model', b'image')
+
+        self.assertEqual(asyncio.run(run()), {'modelVersion': '1'})
+        self.assertEqual(statuses, [])
+
+    def test_predict_streams_file_with_content_length(self):
+        requests_seen = []
+
+        async def handler(request: httpx.Request):
+            requests_seen.append((request.headers.get('Content-Length'), await request.aread()))
+            return httpx.Response(200, json={})
+
+        async def run():
+            with tempfile.TemporaryDirectory() as folder:
+                path = pathlib.Path(folder) / 'image.jpg'
+                path.write_bytes(b'x' * 3000000)
+                async with create_session(transport=httpx.MockTransport(handler)) as session:
+                    client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=session)
+                    await client.predict('model', path)
+                    await client.predict('model', memoryview(b'12345'))
+
+        asyncio.run(run())
+        self.assertEqual(requests_seen, [('3000000', b'x' * 3000000), ('5', b'12345')])
+
+    def test_preprocessor_uploads_small_file_object_as_read(self):
+        small = cv2.imencode('.jpg', np.full((100, 200, 3), 128, np.uint8))[1].tobytes()
+        bodies = []
+
+        async def handler(request: httpx.Request):
+            bodies.append(await request.aread())
+            return httpx.Response(200, json={})
+
+        async def run():
+            async with create_session(transport=httpx.MockTransport(handler)) as session:
+                with ImagePreprocessor(max_long_edge=1000, max_workers=1) as preprocessor:
+                    client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=session, preprocessor=preprocessor)
+                    await client.predict('model', io.BytesIO(small))
+
+        asyncio.run(run())
+        self.assertEqual(bodies, [small])
+
+    def test_file_objects_are_read_off_the_event_loop(self):
+        small = cv2.imencode('.jpg', np.full((100, 200, 3), 128, np.uint8))[1].tobytes()
+        bodies = []
+
+        async def handler(request: httpx.Request):
+            bodies.append(await request.aread())
+            return httpx.Response(200, json={})
+
+        async def open_gate(gate):
+            await asyncio.sleep(0.05)
+            gate.set()
+
+        async def run():
+            streams = []
+            async with create_session(transport=httpx.MockTransport(handler)) as session:
+                with ImagePreprocessor(max_long_edge=1000, max_workers=1) as preprocessor:
+                    # streamed in chunks by the client, and read whole by the preprocessor
+                    for client_preprocessor in (None, preprocessor):
+                        client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=session,
+                                                  preprocessor=client_preprocessor)
+                        gate = threading.Event()
+                        streams.append(GatedStream(small, gate))
+                        await asyncio.gather(client.predict('model', streams[-1]), open_gate(gate))
+            return streams
+
+        streams = asyncio.run(run())
+        self.assertEqual([stream.gate_opened for stream in streams], [True, True])
+        self.assertEqual(bodies, [small, small])
+
+    def test_metrics_break_down_request_phases(self):
+        metrics = HistogramCollector()
+
+        async def run():
+            async with create_session() as session:
+                client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=session, metrics=metrics)
+                for _ in range(2):
+                    await client.predict('model', b'image')
+
+        with StubServer(lambda method, path, body: (200, {}, {'modelVersion': '1'})) as server:
+            asyncio.run(run())
+
+        histograms = metrics.histograms()
+        labels = ('POST', 'imageanalysis:analyze', '200')
+        self.assertEqual(histograms[('connect',) + labels].count, 1)
+        for phase in ['send', 'wait', 'download', 'parse', 'total']:
+            self.assertEqual(histograms[(phase,) + labels].count, 2)
@@ -0,0 +1,376 @@
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / 'aml-pipeline'))
+
+from common.analyser.metrics.confusion_metrics import ConfusionMetrics, MultilabelConfusionMetrics  # noqa: E402
+from common.analyser.metrics.detection_evaluation import DetectionEvaluation, box_iou  # noqa: E402
+
+# average precision of a category whose precision is p up to recall 0.5 and which never reaches a higher recall: 51 of the 101 recall points
+HALF_RECALL_AP = 51 / 101
+
+
+def _evaluate(gts, dts, n_categories=1, **kwargs):
+    # gts: (image, category, box[, crowd]), dts: (image, category, box, score)
+    return DetectionEvaluation(
+        gt_image=np.array([g[0] for g in gts], dtype=np.int64),
+        gt_category=np.array([g[1] for g in gts], dtype=np.int64),
+        gt_boxes=np.array([g[2] for g in gts], dtype=np.float64).reshape(-1, 4),
+        dt_image=np.array([d[0] for d in dts], dtype=np.int64),
+        dt_category=np.array([d[1] for d in dts], dtype=np.int64),
+        dt_boxes=np.array([d[2] for d in dts], dtype=np.float64).reshape(-1, 4),
+        dt_scores=np.array([d[3] for d in dts], dtype=np.float64),
+        n_categories=n_categories,
+        gt_crowd=np.array([len(g) > 3 and g[3] for g in gts], dtype=bool),
+        **kwargs
+    )
+
+
+def test_box_iou():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5], [0, 0, 0, 0]])
+    iou = box_iou(boxes[:, None], boxes[None])
+    assert iou.shape == (4, 4)
+    # half overlapping: 50 / (100 + 100 - 50)
+    assert iou[0, 1] == pytest.approx(1 / 3)
+    assert iou[1, 0] == pytest.approx(1 / 3)
+    assert iou[0, 2] == 0
+    np.testing.assert_allclose(np.diag(iou), [1, 1, 1, 0])
+    np.testing.assert_allclose(box_iou(boxes[:2], boxes[1:3]), [1 / 3, 0])
+
+
+def test_box_iou_crowd_divides_by_detection_area():
+    detection = np.array([0, 0, 10, 10])
+    crowd = np.array([0, 0, 100, 100])
+    assert box_iou(detection, crowd) == pytest.approx(0.01)
+    assert box_iou(detection, crowd, crowd=True) == pytest.approx(1)
+
+
+def test_ties_in_iou_match_the_last_box():
+    # the first detection overlaps both boxes equally and, as in pycocotools, takes the last one, leaving the first box to the second detection
+    gts = [(0, 0, [0, 0, 10, 10]), (0, 0, [10, 0, 10, 10])]
+    dts = [(0, 0, [5, 0, 10, 10], 0.9), (0, 0, [0, 0, 10, 10], 0.8)]
+    evaluation = _evaluate(gts, dts, iou_thresholds=[0.3])
+    assert evaluation.mean_recall(0.3) == 1
+    assert evaluation.mean_average_precision(0.3) == pytest.approx(1)
+
+
+def test_ties_in_score_are_accumulated_in_image_order():
+    # a false positive in image 0 and a true positive in image 1 with the same score: image 0 ranks first whatever the input order
+    gts = [(0, 0, [0, 0, 10, 10]), (1, 0, [0, 0, 10, 10])]
+    dts = [(1, 0, [0, 0, 10, 10], 0.5), (0, 0, [50, 50, 10, 10], 0.5)]
+    evaluation = _evaluate(gts, dts, iou_thresholds=[0.5])
+    assert evaluation.mean_recall(0.5) == 0.5
+    assert evaluation.mean_average_precision(0.5) == pytest.approx(0.5 * HALF_RECALL_AP)
+
+
+def test_ties_in_score_within_an_image_match_in_input_order():
+    gts = [(0, 0, [0, 0, 10, 10])]
+    dts = [(0, 0, [0, 0, 10, 10], 0.9), (0, 0, [1, 0, 10, 10], 0.9)]
+    evaluation = _evaluate(gts, dts, iou_thresholds=[0.5])
+    # the exact box matches first, the duplicate is a false positive
+    assert evaluation.mean_recall(0.5) == 1
+    assert evaluation.mean_average_precision(0.5) == pytest.approx(1)
+
+    # at 0.85 the duplicate (IoU 90 / 110) does not match, so the exact box must still be matched after it
+    evaluation = _evaluate(gts, dts[::-1], iou_thresholds=[0.5, 0.85])
+    np.testing.assert_allclose(evaluation.recall()[:, 0], [1, 1])
+    np.testing.assert_allclose(evaluation.average_precision()[:, 0], [1, 0.5])
+
+
+def test_crowd_boxes_are_ignored():
+    gts = [(0, 0, [0, 0, 10, 10]), (0, 0, [0, 0, 100, 100], True)]
+    dts = [
+        (0, 0, [50, 50, 10, 10], 0.95),  # inside the crowd region only: ignored
+        (0, 0, [0, 0, 10, 10], 0.9),  # matches the regular box rather than the crowd region
+        (0, 0, [0, 0, 10, 10], 0.8),  # duplicate, absorbed by the crowd region rather than a false positive
+    ]
+    evaluation = _evaluate(gts, dts, iou_thresholds=[0.5])
+    assert evaluation.n_gt.tolist() == [1]
+    assert evaluation.mean_recall(0.5) == 1
+    assert evaluation.mean_average_precision(0.5) == pytest.approx(1)
+
+    # the same boxes without the crowd flag: two false positives and a box that is never found
+    evaluation = _evaluate([g[:3] for g in gts], dts, iou_thresholds=[0.5])
+    assert evaluation.n_gt.tolist() == [2]
+    assert evaluation.mean_recall(0.5) == 0.5
+    assert evaluation.mean_average_precision(0.5) == pytest.approx(0.5 * HALF_RECALL_AP)
+
+
+def test_crowd_only_category_has_no_metrics():
+    evaluation = _evaluate([(0, 0, [0, 0, 10, 10], True)], [(0, 0, [0, 0, 10, 10], 0.9)], iou_thresholds=[0.5])
+    assert np.isnan(evaluation.average_precision()).all()
+    assert evaluation.per_class([0.5])[0] == {'ap': None, 'ap_50': None, 'recall_50': None, 'n_gt': 0}
+
+
+def test_average_precision_and_recall():
+    gts = [
+        (0, 0, [0, 0, 10, 10]),
+        (0, 2, [0, 0, 10, 10]),
+        (0, 2, [50, 50, 10, 10]),
+    ]
+    dts = [
+        (0, 0, [0, 0, 10, 8], 0.9),  # IoU 0.8
+        (0, 1, [0, 0, 10, 10], 0.9),  # category without ground truth
+        (0, 2, [50, 50, 10, 10], 0.7),
+        (0, 2, [0, 0, 3, 3], 0.6),  # IoU 0.09
+    ]
+    evaluation = _evaluate(gts, dts, n_categories=3, iou_thresholds=[0.5, 0.75, 0.85])
+
+    expected_ap = np.array([
+        [1, np.nan, HALF_RECALL_AP],
+        [1, np.nan, HALF_RECALL_AP],
+        [0, np.nan, HALF_RECALL_AP],
+    ])
+    np.testing.assert_allclose(evaluation.average_precision(), expected_ap)
+    np.testing.assert_allclose(evaluation.recall(), [[1, np.nan, 0.5], [1, np.nan, 0.5], [0, np.nan, 0.5]])
+    assert evaluation.mean_average_precision() == pytest.approx((2 + 3 * HALF_RECALL_AP) / 6)
+    assert evaluation.mean_average_precision(0.85) == pytest.approx(HALF_RECALL_AP / 2)
+    assert evaluation.mean_recall(0.5) == pytest.approx(0.75)
+
+    per_class = evaluation.per_class([0.5])
+    assert per_class[0] == pytest.approx({'ap': 2 / 3, 'ap_50': 1, 'recall_50': 1, 'n_gt': 1})
+    assert per_class[1] == {'ap': None, 'ap_50': None, 'recall_50': None, 'n_gt': 0}
+    assert per_class[2]['recall_50'] == 0.5
+
+    with pytest.raises(ValueError):
+        evaluation.mean_recall(0.6)
+
+
+def test_max_detections_per_image_and_category():
+    gts = [(0, 0, [0, 0, 10, 10]), (1, 0, [0, 0, 10, 10])]
+    dts = [(0, 0, [50, 50, 10, 10], 0.9), (0, 0, [0, 0, 10, 10], 0.8), (1, 0, [0, 0, 10, 10], 0.1)]
+    assert _evaluate(gts, dts, iou_thresholds=[0.5], max_detections=2).mean_recall(0.5) == 1
+    # only the false positive is kept in image 0
+    evaluation = _evaluate(gts, dts, iou_thresholds=[0.5], max_detections=1)
+    assert evaluation.mean_recall(0.5) == 0.5
+    assert evaluation.mean_average_precision(0.5) == pytest.approx(0.5 * HALF_RECALL_AP)
+
+
+def test_no_detections():
+    evaluation = _evaluate([(0, 0, [0, 0, 10, 10])], [], iou_thresholds=[0.5])
+    assert evaluation.mean_recall(0.5) == 0
+    assert evaluation.mean_average_precision() == 0
+
+
+def test_confusion_metrics():
+    # label 2 is never predicted, label 3 never true and label 4 appears in neither
+    metrics = ConfusionMetrics(y_true=[1, 1, 1, 2, 2], y_pred=[1, 1, 3, 1, 3], labels=[1, 2, 3, 4])
+
+    np.testing.assert_array_equal(metrics.confusion_matrix, [[2, 0, 1, 0], [1, 0, 1, 0], [0, 0, 0, 0], [0, 0, 0, 0]])
+    # divisions by zero count as 0
+    np.testing.assert_allclose(metrics.precision_per_class, [2 / 3, 0, 0, 0])
+    np.testing.assert_allclose(metrics.recall_per_class, [2 / 3, 0, 0, 0])
+    np.testing.assert_allclose(metrics.f1_per_class, [2 / 3, 0, 0, 0])
+    assert metrics.accuracy() == pytest.approx(2 / 5)
+
+    # as sklearn, macro averages over the labels present in y_true or y_pred, leaving label 4 out
+    assert metrics.precision() == pytest.approx(2 / 9)
+    assert metrics.recall() == pytest.approx(2 / 9)
+    assert metrics.f1() == pytest.approx(2 / 9)
+    for average in ('micro', 'weighted'):
+        assert metrics.precision(average) == pytest.approx(2 / 5)
+        assert metrics.recall(average) == pytest.approx(2 / 5)
+        assert metrics.f1(average) == pytest.approx(2 / 5)
+    with pytest.raises(ValueError):
+        metrics.precision('samples')
+
+    assert metrics.per_class()[1] == pytest.approx({'precision': 2 / 3, 'recall': 2 / 3, 'f1': 2 / 3, 'support': 3})
+    assert metrics.per_class()[4] == {'precision': 0, 'recall': 0, 'f1': 0, 'support': 0}
+
+
+def test_confusion_metrics_f1_is_not_the_mean_of_precision_and_recall():
+    metrics = ConfusionMetrics(y_true=[0, 0, 0, 1], y_pred=[0, 1, 1, 1], labels=[0, 1])
+    np.testing.assert_allclose(metrics.precision_per_class, [1, 1 / 3])
+    np.testing.assert_allclose(metrics.recall_per_class, [1 / 3, 1])
+    np.testing.assert_allclose(metrics.f1_per_class, [0.5, 0.5])
+    assert metrics.f1('weighted') == pytest.approx(0.5)
+    assert metrics.precision('weighted') == pytest.approx((3 * 1 + 1 / 3) / 4)
+
+
+def test_confusion_metrics_top_k_accuracy():
+    y_score = np.array([
+        [0.5, 0.5, 0.0],  # tied with a higher label, which ranks first
+        [0.1, 0.7, 0.2],
+        [0.2, 0.3, 0.5],
+    ])
+    metrics = ConfusionMetrics(y_true=[10, 30, 30], y_pred=[10, 20, 30], labels=[10, 20, 30], y_score=y_score)
+    assert metrics.top_k_accuracies([1, 2, 3]) == pytest.approx({1: 1 / 3, 2: 1, 3: 1})
+    assert metrics.top_k_accuracy(1) == pytest.approx(1 / 3)
+
+    with pytest.raises(ValueError):
+        ConfusionMetrics(y_true=[10], y_pred=[10], labels=[10, 20]).top_k_accuracy(1)
+
+
+def test_confusion_metrics_without_samples():
+    metrics = ConfusionMetrics(y_true=[], y_pred=[], labels=[1, 2], y_score=np.zeros((0, 2)))
+    assert metrics.accuracy() == 0
+    assert metrics.precision() == 0
+    assert metrics.recall('weighted') == 0
+    assert metrics.f1('micro') == 0
+    assert metrics.top_k_accuracies([1, 2]) == {1: 0, 2: 0}
+
+
+def test_confusion_metrics_unknown_label():
+    with pytest.raises(ValueError):
+        ConfusionMetrics(y_true=[1, 5], y_pred=[1, 2], labels=[1, 2])
+
+
+def test_multilabel_average_precision():
+    y_true = np.array([[1, 0, 0], [0, 1, 0], [1, 1, 0], [0, 0, 0]])
+    y_score = np.array([
+        [0.9, 0.6, 0.1],
+        [0.8, 0.6, 0.1],
+        [0.3, 0.3, 0.1],
+        [0.1, 0.4, 0.1],
+    ])
+    metrics = MultilabelConfusionMetrics(y_true, y_score, threshold=0.5)
+
+    # category 0: positives ranked 1st and 3rd, (1 + 2 / 3) / 2
+    # category 1: the tie at 0.6 counts as one point of precision 1 / 2 at recall 1 / 2, then recall 1 at precision 2 / 4
+    # category 2: no positive sample
+    average_precision = metrics.average_precision()
+    np.testing.assert_allclose(average_precision[:2], [5 / 6, 0.5])
+    assert np.isnan(average_precision[2])
+    assert metrics.mean_average_precision() == pytest.approx(2 / 3)
+
+
+def test_multilabel_thresholded_metrics():
+    y_true = np.array([[1, 0, 0], [0, 1, 0], [1, 1, 0], [0, 0, 0]])
+    y_score = np.array([[0.9, 0.6, 0.1], [0.8, 0.6, 0.1], [0.3, 0.3, 0.1], [0.1, 0.4, 0.1]])
+    metrics = MultilabelConfusionMetrics(y_true, y_score, threshold=0.5)
+
+    np.testing.assert_array_equal(metrics.confusion_matrix, [[[1, 1], [1, 1]], [[1, 1], [1, 1]], [[4, 0], [0, 0]]])
+    assert metrics.subset_accuracy() == 0.25
+    # the category never predicted nor true scores 0 in the macro average
+    assert metrics.precision() == pytest.approx(1 / 3)
+    assert metrics.recall() == pytest.approx(1 / 3)
+    assert metrics.precision('micro') == 0.5
+    assert metrics.recall('micro') == 0.5
+    assert metrics.f1('micro') == 0.5
+    assert metrics.f1('weighted') == 0.5
+
+
+def test_detection_parser():
+    pytest.importorskip('loguru')
+    from common.analyser.parsers.detection_parser import DetectionParser
+
+    ground_truth = {
+        'images': [{'id': 10, 'file_name': 'a.jpg'}, {'id': 20, 'file_name': 'b.jpg'}],
+        'categories': [{'id': 1, 'name': 'cat'}, {'id': 2, 'name': 'dog'}],
+        'annotations': [
+            {'id': 1, 'image_id': 20, 'category_id': 2, 'bbox': [0, 0, 10, 10]},
+            {'id': 2, 'image_id': 10, 'category_id': 1, 'bbox': [5, 5, 10, 10], 'iscrowd': 1},
+            {'id': 3, 'image_id': 10, 'category_id': 1},
+        ],
+    }
+    # predictions number images and categories differently, they are matched by name
+    predictions = {
+        'images': [{'id': 1, 'name': 'b.jpg'}, {'id': 2, 'name': 'a.jpg'}],
+        'categories': [{'id': 7, 'name': 'dog'}, {'id': 5, 'name': 'cat'}],
+        'predictions': {'object_detection': [
+            {'image_id': 1, 'category_id': 7, 'bbox': [0, 0, 10, 10], 'score': 0.9},
+            {'image_id': 2, 'category_id': 5, 'bbox': [1, 2, 3, 4], 'score': 0.4},
+        ]},
+    }
+    parsed = DetectionParser(ground_truth, predictions).parse()
+
+    assert parsed.labels == [5, 7]
+    assert parsed.label_names == ['cat', 'dog']
+    assert parsed.img_list == ['a.jpg', 'b.jpg']
+    assert parsed.gt_image.tolist() == [1, 0]
+    assert parsed.gt_category.tolist() == [1, 0]
+    assert parsed.gt_crowd.tolist() == [False, True]
+    np.testing.assert_array_equal(parsed.gt_boxes, [[0, 0, 10, 10], [5, 5, 10, 10]])
+    assert parsed.dt_image.tolist() == [1, 0]
+    assert parsed.dt_category.tolist() == [1, 0]
+    np.testing.assert_array_equal(parsed.dt_boxes, [[0, 0, 10, 10], [1, 2, 3, 4]])
+    assert parsed.dt_scores.tolist() == [0.9, 0.4]
+
+    predictions['predictions']['object_detection'][0]['category_id'] = 3
+    with pytest.raises(KeyError):
+        DetectionParser(ground_truth, predictions).parse()
+
+
+def _per_item_classification_parse(ground_truth, predictions):
+    # the classification parser before the dense score matrix, one sorted score list per prediction
+    gt_categories_dict = {x['id']: x['name'] for x in ground_truth['categories']}
+    gt_images_dict = {x['id']: x['file_name'] for x in ground_truth['images']}
+    gt_annotations_dict = {gt_images_dict[x['image_id']]: gt_categories_dict[x['category_id']] for x in ground_truth['annotations']}
+    predictions_images_dict = {x['id']: x['name'] for x in predictions['images']}
+    predictions_categories_reverse_dict = {x['name']: x['id'] for x in predictions['categories']}
+    labels = sorted(predictions_categories_reverse_dict.values())
+
+    y_true, y_pred, y_score = [], [], []
+    for prediction in predictions['predictions']['classification']:
+        y_score.append([x['score'] for x in sorted(prediction['scores'], key=lambda d: d['category_id'])])
+        y_pred.append(sorted(prediction['scores'], key=lambda d: d['score'], reverse=True)[0]['category_id'])
+        y_true.append(predictions_categories_reverse_dict[gt_annotations_dict[predictions_images_dict[prediction['image_id']]]])
+
+    return y_true, y_pred, y_score, labels, [x['file_name'] for x in ground_truth['images']]
+
+
+def _classification_inputs(seed, n_images=50, n_categories=6):
+    rng = np.random.default_rng(seed)
+    names = [f'category {c}' for c in range(n_categories)]
+    ground_truth = {
+        'images': [{'id': i, 'file_name': f'{i}.jpg'} for i in range(n_images)],
+        'categories': [{'id': c + 1, 'name': name} for c, name in enumerate(names)],
+        'annotations': [{'id': i, 'image_id': i, 'category_id': int(rng.integers(1, n_categories + 1))} for i in range(n_images)],
+    }
+    # predictions number images and categories differently, in another order, and list the scores unsorted
+    category_ids = rng.permutation(n_categories) * 10 + 3
+    predictions = {
+        'images': [{'id': 100 + i, 'name': f'{i}.jpg'} for i in range(n_images)],
+        'categories': [{'id': int(category_id), 'name': name} for category_id, name in zip(category_ids, names)],
+        'predictions': {'classification': [
+            {'image_id': 100 + int(i), 'scores': [{'category_id': int(c), 'score': float(rng.random())} for c in rng.permutation(category_ids)]}
+            for i in rng.permutation(n_images)
+        ]},
+    }
+    return ground_truth, predictions
+
+
+def test_classification_score_matrix_matches_per_item_parse():
+    pytest.importorskip('loguru')
+    from common.analyser.parsers.classification_parser import ClassificationParser
+
+    for seed in range(5):
+        ground_truth, predictions = _classification_inputs(seed)
+        y_true, y_pred, y_score, labels, img_list = ClassificationParser(ground_truth, predictions).parse()
+        expected_true, expected_pred, expected_score, expected_labels, expected_img_list = _per_item_classification_parse(ground_truth, predictions)
+
+        assert y_true.tolist() == expected_true
+        assert y_pred.tolist() == expected_pred
+        np.testing.assert_array_equal(y_score, expected_score)
+        assert labels == expected_labels
+        assert img_list == expected_img_list
+
+
+def test_classification_parse_cached():
+    pytest.importorskip('loguru')
+    from common.analyser.parsers.classification_parser import ClassificationParser, MultilabelClassificationParser
+
+    ground_truth, predictions = _classification_inputs(0)
+    parsed = ClassificationParser.parse_cached(ground_truth, predictions)
+    assert ClassificationParser.parse_cached(ground_truth, predictions) is parsed
+    assert not parsed.y_score.flags.writeable
+    # each parser class has its own entry
+    multilabel = MultilabelClassificationParser.parse_cached(ground_truth, predictions)
+    assert multilabel.y_true.shape == parsed.y_score.shape
+    assert ClassificationParser.parse_cached(ground_truth, predictions) is parsed
+
+    # equal but distinct inputs are parsed again, and evict the previous ones
+    other_ground_truth, other_predictions = _classification_inputs(0)
+    assert ClassificationParser.parse_cached(other_ground_truth, other_predictions) is not parsed
+    MultilabelClassificationParser.parse_cached(other_ground_truth, other_predictions)
+    assert ClassificationParser.parse_cached(ground_truth, predictions) is not parsed
+
+    # mutated inputs are only seen once the caches are cleared
+    predictions['predictions']['classification'].pop()
+    assert len(ClassificationParser.parse_cached(ground_truth, predictions).y_true) == 50
+    ClassificationParser._cache.clear()
+    ClassificationParser._ground_truth_cache.clear()
+    assert len(ClassificationParser.parse_cached(ground_truth, predictions).y_true) == 49
@@ -0,0 +1,129 @@
+import json
+import os
+import pathlib
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / 'aml-pipeline'))
+
+pytest.importorskip('azure.identity')
+pytest.importorskip('azure.storage.blob')
+pytest.importorskip('loguru')
+
+from common.analyser import benchmarking  # noqa: E402
+
+GROUND_TRUTH = {'images': [{'id': 1}, {'id': 2}, {'id': 3}]}
+
+
+class PredictionsCountCalculator:
+    """Calculator run by the benchmarking workers: counts the predictions of a file and the images of the ground truth."""
+
+    def __init__(self, ground_truth, predictions, params):
+        self.ground_truth = ground_truth
+        self.predictions = predictions
+
+    def calculate(self):
+        return {'n_predictions': len(self.predictions['predictions']), 'n_images': len(self.ground_truth['images'])}
+
+
+class FakeContainerClient:
+    def __init__(self, blobs):
+        # {name: (etag, content)}, blobs without content are listed but deleted before they are downloaded
+        self.blobs = blobs
+        self.downloads = []
+        self._lock = threading.Lock()
+
+    def get_container_properties(self):
+        return {}
+
+    def list_blobs(self, name_starts_with):
+        return [SimpleNamespace(name=name, etag=etag, content_settings={'content_type': 'application/json'})
+                for name, (etag, _) in sorted(self.blobs.items()) if name.startswith(name_starts_with)]
+
+    def get_blob_client(self, name):
+        return SimpleNamespace(download_blob=lambda: self._download(name))
+
+    def _download(self, name):
+        with self._lock:
+            self.downloads.append(name)
+        if self.blobs[name][1] is None:
+            raise ResourceNotFoundError(f'{name} not found')
+        return SimpleNamespace(readall=lambda: json.dumps(self.blobs[name][1]).encode())
+
+
+@pytest.fixture
+def container(monkeypatch):
+    container = FakeContainerClient({
+        'gt/ds/annotations.json': ('"0x1"', GROUND_TRUTH),
+        'results/m1/v1/predictions.json': ('"0x2"', {'dataset_name': 'ds', 'predictions': [1, 2]}),
+        'results/m1/v2/predictions.json': ('"0x3"', {'dataset_name': 'ds', 'predictions': [1, 2, 3]}),
+        'results/m2/v1/predictions.json': ('"0x4"', {'dataset_name': 'other', 'predictions': [1]}),
+    })
+    monkeypatch.setattr(benchmarking, 'ClientSecretCredential', lambda **kwargs: None)
+    monkeypatch.setattr(benchmarking, 'ContainerClient', lambda **kwargs: container)
+    return container
+
+
+def _benchmarking(tmp_path, **configs):
+    config_path = tmp_path / 'config.json'
+    config_path.write_text(json.dumps(dict({
+        'predictions_storage': {
+            'tenant_id': 'tenant', 'sp_client_id': 'client', 'sp_client_secret': 'secret', 'blob_account_url': 'https://account.blob.core.windows.net',
+            'container_name': 'container', 'gt_base_dir': 'gt', 'model_results_base_dir': 'results',
+        },
+        'metrics_types': {'metrics_type': ['PredictionsCountCalculator', __name__], 'params': {}},
+        'predictions_results': {
+            'dataset_name': 'ds',
+            'models_predictions': [{'model_name': 'm1', 'model_versions': ['v1', 'v2']}, {'model_name': 'm2', 'model_versions': ['v1']}],
+        },
+        'cache_dir': str(tmp_path / 'cache'),
+        'download_concurrency': 4,
+    }, **configs)))
+    return benchmarking.BenchmarkingCalculator(str(config_path))
+
+
+EXPECTED_RESULTS = {'PredictionsCountCalculator': [
+    {'results/m1/v1/predictions.json': {'n_predictions': 2, 'n_images': 3}},
+    {'results/m1/v2/predictions.json': {'n_predictions': 3, 'n_images': 3}},
+]}
+
+
+def test_blobs_are_downloaded_once_per_etag(tmp_path, container):
+    assert _benchmarking(tmp_path).calculate(mlflow_logging=False) == EXPECTED_RESULTS
+    assert sorted(container.downloads) == sorted(container.blobs)
+
+    # a second run reads every blob from the cache
+    assert _benchmarking(tmp_path).calculate(mlflow_logging=False) == EXPECTED_RESULTS
+    assert len(container.downloads) == 4
+
+    # a new version of a blob is downloaded again, and replaces the previous one in the cache
+    container.blobs['results/m1/v2/predictions.json'] = ('"0x5"', {'dataset_name': 'ds', 'predictions': [1]})
+    results = _benchmarking(tmp_path).calculate(mlflow_logging=False)
+    assert results['PredictionsCountCalculator'][1] == {'results/m1/v2/predictions.json': {'n_predictions': 1, 'n_images': 3}}
+    assert container.downloads[4:] == ['results/m1/v2/predictions.json']
+    assert len(os.listdir(tmp_path / 'cache')) == 4
+
+
+def test_blob_deleted_after_listing(tmp_path, container):
+    container.blobs['results/m1/v2/predictions.json'] = ('"0x6"', None)
+    with pytest.raises(FileNotFoundError):
+        _benchmarking(tmp_path).calculate(mlflow_logging=False)
+    # nothing cached for the deleted blob
+    assert len(os.listdir(tmp_path / 'cache')) <= 3
+
+
+def test_worker_processes(tmp_path, container):
+    # the calculators run in the main process unless more workers are configured
+    with _benchmarking(tmp_path)._worker_pool(GROUND_TRUTH) as workers:
+        assert isinstance(workers, ThreadPoolExecutor)
+    with _benchmarking(tmp_path, n_workers=2)._worker_pool(GROUND_TRUTH) as workers:
+        assert isinstance(workers, ProcessPoolExecutor)
+
+    # in spawned processes the results come back in the order of the model versions
+    assert _benchmarking(tmp_path, n_workers=2).calculate(mlflow_logging=False) == EXPECTED_RESULTS
+    assert _benchmarking(tmp_path).calculate(mlflow_logging=False) == EXPECTED_RESULTS
@@ -1,5 +1,21 @@
+import io
+import mmap
+import pathlib
+import tempfile
+import time
 import unittest
-from cognitive_service_vision_model_customization_python_samples import TrainingClient, ResourceType
+
+import cv2
+import numpy as np
+import requests
+from requests.adapters import BaseAdapter
+
+from cognitive_service_vision_model_customization_python_samples import TrainingClient, PredictionClient, ProductRecognitionClient, ResourceType, SessionConfig, create_session, \
+    TokenBucket, AimdRateLimiter, RetryPolicy, ImagePreprocessor, PredictionCache, HistogramCollector, ProductRecognition
+from cognitive_service_vision_model_customization_python_samples.clients.batch import run_batch
+from cognitive_service_vision_model_customization_python_samples.clients.metrics import Histogram
+from cognitive_service_vision_model_customization_python_samples.clients.retry import endpoint_label, parse_retry_after
+from .stub_server import StubServer
 
 
 class TestClients(unittest.TestCase):
@@ -13,3 +29,297 @@ class TestClients(unittest.TestCase):
     def test_create_single_service_client_fails_when_resource_name_missing(self):
         with self.assertRaises(AssertionError):
             TrainingClient(ResourceType.MULTI_SERVICE_RESOURCE, None, None, 'test_key')
+
+    def test_requests_reuse_pooled_connection(self):
+        with StubServer(lambda method, path, body: (200, {}, {'name': 'dataset'})) as server:
+            session = create_session(SessionConfig(pool_maxsize=2))
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=session)
+            for _ in range(5):
+                client.request_get('datasets/dataset')
+
+            self.assertEqual(len(server.requests), 5)
+            self.assertEqual(len(server.client_ports), 1)
+            self.assertEqual(server.requests[0][1], '/computervision/datasets/dataset?api-version=2023-04-01-preview')
+            self.assertEqual(server.requests[0][2]['Ocp-Apim-Subscription-Key'], 'test_key')
+
+    def test_clients_share_session_by_default(self):
+        training_client = TrainingClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key')
+        product_recognition_client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key')
+        self.assertIs(training_client.session, product_recognition_client.session)
+
+    def test_injected_transport_serves_requests(self):
+        class StubAdapter(BaseAdapter):
+            def send(self, request, **kwargs):
+                response = requests.Response()
+                response.status_code = 200
+                response.headers['Content-Type'] = 'application/json'
+                response._content = b'{"modelName": "model"}'
+                response.request = request
+                response.url = request.url
+                return response
+
+            def close(self):
+                pass
+
+        client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=create_session(transport=StubAdapter()))
+        self.assertEqual(client.predict('model', b'image'), {'modelName': 'model'})
+
+    def test_predict_many_yields_in_order_and_captures_errors(self):
+        def responder(method, path, body):
+            if body == b'bad':
+                return 400, {}, {'error': {'code': 'InvalidImage'}}
+            time.sleep(0.05 if body == b'0' else 0)
+            return 200, {}, {'image': body.decode()}
+
+        with StubServer(responder) as server:
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session())
+            images = [b'0', b'1', b'bad', b'3']
+            results = list(client.predict_many('model', images, concurrency=4))
+
+        self.assertEqual([r.index for r in results], [0, 1, 2, 3])
+        self.assertEqual([r.result for r in results], [{'image': '0'}, {'image': '1'}, None, {'image': '3'}])
+        self.assertIsInstance(results[2].error, requests.HTTPError)
+
+    def test_predict_many_reads_image_paths(self):
+        with tempfile.TemporaryDirectory() as folder, StubServer(lambda method, path, body: (200, {}, {'size': len(body)})) as server:
+            path = pathlib.Path(folder) / 'image.jpg'
+            path.write_bytes(b'12345')
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session())
+            results = list(client.predict_many('model', [path, str(path)], ordered=False))
+
+        self.assertEqual([r.result for r in results], [{'size': 5}, {'size': 5}])
+
+    def test_run_batch_respects_rate_limit(self):
+        start = time.monotonic()
+        results = list(run_batch(lambda x: x, range(10), concurrency=4, rate_limiter=TokenBucket(rate=20, capacity=1)))
+        self.assertGreaterEqual(time.monotonic() - start, 9 / 20 * 0.9)
+        self.assertEqual([r.result for r in results], list(range(10)))
+
+    def test_run_batch_pulls_items_lazily(self):
+        pulled = []
+
+        def items():
+            for i in range(100):
+                pulled.append(i)
+                yield i
+
+        batch = run_batch(lambda x: x, items(), concurrency=2)
+        next(batch)
+        self.assertLessEqual(len(pulled), 6)
+        batch.close()
+
+    def test_throttled_request_is_retried_after_retry_after(self):
+        statuses = [429, 429, 200]
+
+        with StubServer(lambda method, path, body: (statuses.pop(0), {'Retry-After': '0'}, {'name': 'model'})) as server:
+            client = TrainingClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session())
+            self.assertEqual(client.request_post('models/model:cancel'), {'name': 'model'})
+            self.assertEqual(len(server.requests), 3)
+
+    def test_server_error_is_not_replayed_for_non_idempotent_post(self):
+        with StubServer(lambda method, path, body: (503, {}, {})) as server:
+            client = TrainingClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), retry_policy=RetryPolicy(backoff_factor=0))
+            with self.assertRaises(requests.HTTPError):
+                client.request_post('models/model:cancel')
+            self.assertEqual(len(server.requests), 1)
+
+            with self.assertRaises(requests.HTTPError):
+                client.request_get('models/model')
+            self.assertEqual(len(server.requests), 1 + 1 + 5)
+
+    def test_put_is_not_replayed_after_connection_error(self):
+        class DroppingAdapter(BaseAdapter):
+            """Drops the connection of the first request to each resource, after the service got it."""
+
+            def __init__(self):
+                super().__init__()
+                self.requests = []
+
+            def send(self, request, **kwargs):
+                self.requests.append((request.method, request.path_url.split('?')[0]))
+                if self.requests.count(self.requests[-1]) == 1:
+                    raise requests.ConnectionError('connection reset')
+                response = requests.Response()
+                response.status_code = 200
+                response.headers['Content-Type'] = 'application/json'
+                response._content = b'{"name": "model"}'
+                response.request = request
+                response.url = request.url
+                return response
+
+            def close(self):
+                pass
+
+        adapter = DroppingAdapter()
+        client = TrainingClient(ResourceType.MULTI_SERVICE_RESOURCE, None, 'https://example.com', 'test_key', session=create_session(transport=adapter),
+                                retry_policy=RetryPolicy(backoff_factor=0))
+        # the training may have started, it is not created a second time
+        with self.assertRaises(requests.ConnectionError):
+            client.request_put('models/model', json={})
+        self.assertEqual(len(adapter.requests), 1)
+
+        self.assertEqual(client.request_put('datasets/dataset', json={}, idempotent=True), {'name': 'model'})
+        self.assertEqual(client.request_get('models/model'), {'name': 'model'})
+        self.assertEqual([method for method, _ in adapter.requests], ['PUT', 'PUT', 'PUT', 'GET', 'GET'])
+
+    def test_prediction_is_replayed_on_server_error(self):
+        statuses = [503, 200]
+
+        with StubServer(lambda method, path, body: (statuses.pop(0), {}, {'modelVersion': '1'})) as server:
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), retry_policy=RetryPolicy(backoff_factor=0))
+            self.assertEqual(client.predict('model', b'image'), {'modelVersion': '1'})
+            self.assertEqual([r[3] for r in server.requests], [b'image', b'image'])
+
+    def test_aimd_rate_limiter_adapts_per_endpoint(self):
+        limiter = AimdRateLimiter(initial_rate=10, min_rate=1, cooldown=60)
+        limiter.on_throttle('imageanalysis:analyze')
+        limiter.on_throttle('imageanalysis:analyze')
+        self.assertEqual(limiter.rate('imageanalysis:analyze'), 5)
+        for _ in range(10):
+            limiter.on_success('models/{name}')
+        self.assertGreater(limiter.rate('models/{name}'), 10)
+
+    def test_endpoint_label_and_retry_after(self):
+        self.assertEqual(endpoint_label('/productrecognition/model/runs/run1'), 'productrecognition/{name}/runs/{name}')
+        self.assertEqual(endpoint_label('models/model:cancel'), 'models/{name}:cancel')
+        self.assertEqual(endpoint_label('imageanalysis:analyze'), 'imageanalysis:analyze')
+        self.assertEqual(parse_retry_after({'Retry-After': '3'}), 3)
+        self.assertEqual(parse_retry_after({'retry-after-ms': '500', 'Retry-After': '1'}), 0.5)
+        self.assertIsNone(parse_retry_after({}))
+
+    def test_retry_after_is_capped_at_max_backoff(self):
+        policy = RetryPolicy(max_backoff=10)
+        self.assertEqual(policy.get_backoff(0, retry_after=2), 2)
+        self.assertEqual(policy.get_backoff(0, retry_after=3600), 10)
+        self.assertLessEqual(policy.get_backoff(10), 10)
+
+    def test_predict_streams_files_buffers_and_mmaps(self):
+        statuses = [503, 200, 200, 200, 200]
+
+        with tempfile.TemporaryDirectory() as folder, StubServer(lambda method, path, body: (statuses.pop(0), {}, {'size': len(body)})) as server:
+            path = pathlib.Path(folder) / 'image.jpg'
+            path.write_bytes(b'x' * 100000)
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), retry_policy=RetryPolicy(backoff_factor=0))
+            self.assertEqual(client.predict('model', path), {'size': 100000})
+            with open(path, 'rb') as f:
+                self.assertEqual(client.predict('model', f), {'size': 100000})
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    self.assertEqual(client.predict('model', mapped), {'size': 100000})
+            self.assertEqual(client.predict('model', memoryview(b'12345')[1:]), {'size': 4})
+
+        self.assertEqual([r[3] for r in server.requests[:2]], [b'x' * 100000] * 2)
+        self.assertEqual(server.requests[0][2]['Content-Length'], '100000')
+
+    def test_non_seekable_stream_is_not_replayed(self):
+        class Pipe:
+            def __init__(self):
+                self._stream = io.BytesIO(b'12345')
+
+            def read(self, size=-1):
+                return self._stream.read(size)
+
+        with StubServer(lambda method, path, body: (503, {}, {})) as server:
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), retry_policy=RetryPolicy(backoff_factor=0))
+            with self.assertRaises(requests.HTTPError):
+                client.predict('model', Pipe())
+            self.assertEqual(len(server.requests), 1)
+
+    def test_preprocessor_shrinks_upload_and_restores_boxes(self):
+        def respond(method, path, body):
+            img = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+            box = {'x': 10, 'y': 20, 'w': 30, 'h': 40}
+            return 200, {}, {'metadata': {'width': img.shape[1], 'height': img.shape[0]}, 'customModelResult': {'objectsResult': {'values': [{'boundingBox': box}]}}}
+
+        large = cv2.imencode('.png', np.full((600, 800, 3), 128, np.uint8))[1].tobytes()
+        small = cv2.imencode('.png', np.full((60, 80, 3), 128, np.uint8))[1].tobytes()
+        with StubServer(respond) as server, ImagePreprocessor(max_long_edge=400, max_workers=1) as preprocessor:
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), preprocessor=preprocessor)
+            result = client.predict('model', large, content_type='image/png')
+            self.assertEqual(result['metadata'], {'width': 800, 'height': 600})
+            self.assertEqual(result['customModelResult']['objectsResult']['values'][0]['boundingBox'], {'x': 20, 'y': 40, 'w': 60, 'h': 80})
+            self.assertEqual(server.requests[0][2]['Content-Type'], 'image/jpeg')
+            self.assertLess(len(server.requests[0][3]), len(large))
+
+            result = client.predict('model', small, content_type='image/png')
+            self.assertEqual(result['metadata'], {'width': 80, 'height': 60})
+            self.assertEqual(server.requests[1][2]['Content-Type'], 'image/png')
+            self.assertEqual(server.requests[1][3], small)
+
+    def test_preprocessor_uploads_small_streams_as_read(self):
+        small = cv2.imencode('.jpg', np.full((100, 200, 3), 128, np.uint8))[1].tobytes()
+        run = {'runName': 'run', 'modelName': 'model', 'status': 'succeeded', 'createdDateTime': '', 'updatedDateTime': '', 'result': {'products': []}}
+
+        class Pipe(io.RawIOBase):
+            def __init__(self, data):
+                self._stream = io.BytesIO(data)
+
+            def readable(self):
+                return True
+
+            def readinto(self, b):
+                return self._stream.readinto(b)
+
+        with StubServer(lambda method, path, body: (200, {}, run)) as server, ImagePreprocessor(max_long_edge=1000, max_workers=1) as preprocessor:
+            client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), preprocessor=preprocessor)
+            client.predict('model', io.BytesIO(small))
+            client.predict('model', Pipe(small))
+            client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), preprocessor=preprocessor)
+            client.create_run(ProductRecognition('run', 'model'), io.BytesIO(small))
+
+        self.assertEqual([body for _, _, _, body in server.requests], [small] * 3)
+
+    def test_cache_answers_repeated_predictions(self):
+        with tempfile.TemporaryDirectory() as folder, StubServer(lambda method, path, body: (200, {}, {'size': len(body)})) as server:
+            path = pathlib.Path(folder) / 'image.jpg'
+            path.write_bytes(b'x' * 1000)
+            for _ in range(2):
+                with PredictionCache(str(pathlib.Path(folder) / 'cache.db'), max_memory_entries=1) as cache:
+                    client = PredictionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), cache=cache)
+                    self.assertEqual(client.predict('model', path), {'size': 1000})
+                    self.assertEqual(client.predict('model', b'x' * 1000), {'size': 1000})
+                    self.assertEqual(client.predict('model', io.BytesIO(b'y')), {'size': 1})
+                    self.assertEqual(client.predict('other_model', b'x' * 1000), {'size': 1000})
+
+            self.assertEqual(len(server.requests), 3)
+
+    def test_cache_evicts_by_size_and_ttl(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with PredictionCache(str(pathlib.Path(folder) / 'cache.db'), max_memory_entries=0, max_disk_bytes=100) as cache:
+                for i in range(10):
+                    cache.put(str(i), {'value': 'x' * 20})
+                    cache.get('0')
+                self.assertEqual(cache.get('0'), {'value': 'x' * 20})
+                self.assertIsNone(cache.get('1'))
+                self.assertEqual(cache.get('9'), {'value': 'x' * 20})
+
+            with PredictionCache(str(pathlib.Path(folder) / 'ttl.db'), ttl=0.05) as cache:
+                cache.put('key', [1])
+                self.assertEqual(cache.get('key'), [1])
+                time.sleep(0.1)
+                self.assertIsNone(cache.get('key'))
+
+    def test_metrics_break_down_request_phases(self):
+        metrics = HistogramCollector()
+        with StubServer(lambda method, path, body: (200, {}, {'name': 'dataset'})) as server:
+            client = TrainingClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), metrics=metrics)
+            for _ in range(3):
+                client.request_get('datasets/dataset')
+
+        histograms = metrics.histograms()
+        labels = ('GET', 'datasets/{name}', '200')
+        self.assertEqual(histograms[('connect',) + labels].count, 1)
+        for phase in ['send', 'wait', 'download', 'parse', 'total']:
+            self.assertEqual(histograms[(phase,) + labels].count, 3)
+        self.assertLessEqual(histograms[('wait',) + labels].sum, histograms[('total',) + labels].sum)
+
+        text = metrics.to_prometheus()
+        self.assertIn('vision_client_request_duration_seconds_count{phase="total",method="GET",endpoint="datasets/{name}",status="200"} 3', text)
+        self.assertIn('vision_client_request_duration_seconds_bucket{phase="total",method="GET",endpoint="datasets/{name}",status="200",le="+Inf"} 3', text)
+
+    def test_histogram_quantile(self):
+        histogram = Histogram(buckets=(1, 2, 4))
+        for value in [0.5, 1.5, 1.5, 3]:
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1), 4)
+        self.assertIsNone(Histogram().quantile(0.5))
@@ -1,8 +1,21 @@
+import io
 import json
 import os
 import pathlib
+import random
+import re
+import struct
+
+import cv2
+import numpy as np
 import pytest
-from cognitive_service_vision_model_customization_python_samples import check_coco_annotation_file, AnnotationKind, Purpose
+from cognitive_service_vision_model_customization_python_samples import check_coco_annotation_file, check_coco_annotation_file_streaming, check_coco_annotation_files, AnnotationKind, Purpose
+from cognitive_service_vision_model_customization_python_samples.data.check_coco_annotations import annotation_check, annotations_check, image_check, images_check, \
+    image_files_check, _get_quota_limit
+from cognitive_service_vision_model_customization_python_samples.data.coco_stream import ARRAY_START, iter_coco_stream
+from cognitive_service_vision_model_customization_python_samples.data.image_headers import fetch_image_size, image_size_from_header
+
+from .stub_server import StubServer
 
 
 BASE_PATH = pathlib.Path(os.path.dirname(__file__)) / 'resources' / "sample_jsons"
@@ -17,7 +30,7 @@ PURPOSE_MAPPING = {
 }
 
 
-@pytest.mark.parametrize("file_name, error_message", [
+TEST_CASES = [
     ('ic_eval_image_size_too_small.json', "width 10 must be present and in [50, 16000]. image with id = 1."),
     ('ic_eval_valid.json', None),
     ('ic_train_too_few_images.json', "Each category must have >= 2 images present, only 1 images found for category 2."),
@@ -25,7 +38,10 @@ PURPOSE_MAPPING = {
     ('od_eval_valid.json', None),
     ('od_train_invalid_bbox.json', "left + width must be in (0, 1]. 1.1 found. annotation with id = 1"),
     ('od_train_valid.json', None),
-])
+]
+
+
+@pytest.mark.parametrize("file_name, error_message", TEST_CASES)
 def test_ic_train_invalid(file_name: str, error_message: str):
     ann_kind, purpose = file_name.split('_')[:2]
     ann_kind = ANNOTATION_KIND_MAPPING[ann_kind]
@@ -38,3 +54,255 @@ def test_ic_train_invalid(file_name: str, error_message: str):
             assert exinfo.value.message == error_message
     else:
         check_coco_annotation_file(json.loads(file_name.read_text()), ann_kind, purpose)
+
+
+@pytest.mark.parametrize("file_name, error_message", TEST_CASES)
+def test_streaming_check(file_name: str, error_message: str):
+    ann_kind, purpose = file_name.split('_')[:2]
+    result = check_coco_annotation_file_streaming(BASE_PATH / file_name, ANNOTATION_KIND_MAPPING[ann_kind], PURPOSE_MAPPING[purpose])
+
+    if error_message:
+        assert any(error.startswith(error_message) for error in result.errors), result.errors
+    else:
+        assert result.ok, result.errors
+
+
+def test_streaming_check_reports_all_errors():
+    coco = json.loads((BASE_PATH / 'od_train_valid.json').read_text())
+    coco['images'][0]['height'] = 100000
+    coco['images'][1]['id'] = 1
+    coco['annotations'][0]['bbox'] = [0.5, 0.5, 0.7, 0.2]
+    coco['annotations'][0]['category_id'] = 7
+    del coco['categories'][0]['name']
+
+    result = check_coco_annotation_file_streaming(io.StringIO(json.dumps(coco)), AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING, max_errors=2)
+    assert result.error_count == 5
+    assert len(result.errors) == 2
+
+
+def _write_shards(tmp_path, coco):
+    paths = []
+    for i, (image, annotation) in enumerate(zip(coco['images'], coco['annotations'])):
+        path = tmp_path / f'shard_{i}.json'
+        path.write_text(json.dumps({'images': [image], 'annotations': [annotation], 'categories': coco['categories']}))
+        paths.append(path)
+    return paths
+
+
+def test_shards_checked_as_one_dataset(tmp_path):
+    coco = json.loads((BASE_PATH / 'od_train_valid.json').read_text())
+    paths = _write_shards(tmp_path, coco)
+
+    result = check_coco_annotation_files(paths, AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING, max_workers=2)
+    assert result.ok, result.errors
+    assert (result.image_count, result.category_count, result.annotation_count) == (2, 1, 2)
+    assert result.category_stats == {1: 2}
+
+
+def test_shards_global_constraints(tmp_path):
+    coco = json.loads((BASE_PATH / 'od_train_valid.json').read_text())
+    coco['images'][1]['id'] = 1
+    coco['annotations'][1].update(id=1, image_id=1)
+    paths = _write_shards(tmp_path, coco)
+    conflicting = tmp_path / 'shard_2.json'
+    conflicting.write_text(json.dumps({'images': [], 'annotations': [], 'categories': [{'id': 1, 'name': 'dog'}]}))
+
+    result = check_coco_annotation_files(paths + [conflicting], AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING, max_workers=2)
+    assert 'Category with id = 1 is named "cat" and "dog" in different shards.' in result.errors
+    assert 'Duplicate image ids exist: [1].' in result.errors
+    assert 'Duplicate annotation ids exist: [1].' in result.errors
+
+
+def test_shard_errors_name_their_file(tmp_path):
+    coco = json.loads((BASE_PATH / 'od_train_valid.json').read_text())
+    coco['annotations'][1]['bbox'] = [0.5, 0.5, 0.7, 0.2]
+    paths = _write_shards(tmp_path, coco)
+    paths[0].write_text('{"images": [')
+
+    result = check_coco_annotation_files(paths, AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING, max_workers=2)
+    assert any(error.startswith(f'{paths[0]}: Invalid json') for error in result.errors), result.errors
+    assert any(error.startswith(f'{paths[1]}: left + width must be in (0, 1]') for error in result.errors), result.errors
+
+
+def test_coco_stream_matches_json_across_chunk_boundaries():
+    coco = {'info': {'year': 2023}, 'images': [{'id': i, 'width': 12345678, 'file_name': f'{i} "é".jpg'} for i in range(50)], 'categories': [],
+            'annotations': [{'id': 1, 'bbox': [0.123456789, 1e-05, 0.5, 0.25]}], 'licenses': None, 'x': 0.125, 'y': -2.5e-07, 'z': 12}
+    text = json.dumps(coco, indent=1, ensure_ascii=False)
+
+    # every split of the top-level numbers, e.g. 0. | 125
+    for chunk_size in list(range(1, 65)) + [1 << 20]:
+        parsed = {}
+        for key, value in iter_coco_stream(io.BytesIO(text.encode('utf-8')), chunk_size=chunk_size):
+            if value is ARRAY_START:
+                parsed[key] = []
+            elif key in ('images', 'categories', 'annotations'):
+                parsed[key].append(value)
+            else:
+                parsed[key] = value
+        assert parsed == coco
+
+    with pytest.raises(ValueError):
+        list(iter_coco_stream(io.StringIO('{"images": [{"id": 1}')))
+
+
+ANNOTATION_CORRUPTIONS = [
+    lambda a: a.pop('image_id'),
+    lambda a: a.update(bbox=None),
+    lambda a: a.update(bbox=[0.1, 0.1]),
+    lambda a: a.update(bbox=[-0.1, 0.1, 0.2, 0.2]),
+    lambda a: a.update(bbox=[0.1, 1.0, 0.2, 0.2]),
+    lambda a: a.update(bbox=[0.1, 0.1, 0, 0.2]),
+    lambda a: a.update(bbox=[0.1, 0.1, 0.2, 1.5]),
+    lambda a: a.update(bbox=[0.5, 0.1, 0.7, 0.2]),
+    lambda a: a.update(bbox=[0.1, 0.6, 0.2, 0.7]),
+    lambda a: a.update(image_id=100),
+    lambda a: a.update(category_id=0),
+    lambda a: a.update(category_id=1.0),
+    lambda a: a.update(id='x'),
+    lambda a: a.update(id=2 ** 70),
+]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_vectorized_checks_raise_first_per_item_error(seed: int):
+    rng = random.Random(seed)
+    quota_limit = _get_quota_limit(AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING)
+    annotations = [{'id': i + 1, 'image_id': i % 10 + 1, 'category_id': i % 3 + 1, 'bbox': [0.1, 0.2, 0.3, 0.4]} for i in range(30)]
+    for row, corruption in zip(rng.sample(range(30), 3), rng.sample(ANNOTATION_CORRUPTIONS, 3)):
+        corruption(annotations[row])
+
+    expected = None
+    for annotation in annotations:
+        try:
+            annotation_check(annotation, AnnotationKind.OBJECT_DETECTION, len(annotations), 10, 3)
+        except (ValueError, TypeError) as e:
+            expected = str(e)
+            break
+
+    with pytest.raises(ValueError) as e:
+        annotations_check(annotations, AnnotationKind.OBJECT_DETECTION, 10, 3, quota_limit)
+    assert str(e.value) == expected
+
+    images = [{'id': i + 1, 'width': 100, 'height': 100, 'file_name': f'{i}.jpg', 'coco_url': ''} for i in range(10)]
+    rng.choice([lambda i: i.update(height=5), lambda i: i.pop('coco_url'), lambda i: i.update(id=11), lambda i: i.pop('file_name')])(images[rng.randrange(10)])
+    with pytest.raises(ValueError) as expected:
+        for image in images:
+            image_check(image, len(images), quota_limit)
+    with pytest.raises(ValueError) as e:
+        images_check(images, quota_limit)
+    assert str(e.value) == str(expected.value)
+
+
+def _encode(extension, width, height, *params):
+    return cv2.imencode(extension, np.zeros((height, width, 3), np.uint8), list(params))[1].tobytes()
+
+
+def _jpeg_with_large_exif(width, height):
+    jpeg = _encode('.jpg', width, height)
+    app1 = b'\xff\xe1' + struct.pack('>H', 60002) + b'Exif\x00\x00' + bytes(59994)
+    return jpeg[:2] + app1 + jpeg[2:]
+
+
+@pytest.mark.parametrize("image", [
+    _encode('.jpg', 123, 45), _encode('.jpg', 123, 45, cv2.IMWRITE_JPEG_PROGRESSIVE, 1), _encode('.png', 123, 45), _encode('.bmp', 123, 45),
+    _encode('.webp', 123, 45), _encode('.webp', 123, 45, cv2.IMWRITE_WEBP_QUALITY, 101), _jpeg_with_large_exif(123, 45),
+    b'GIF89a' + struct.pack('<HH', 123, 45) + bytes(20),
+    b'RIFF' + bytes(4) + b'WEBPVP8X' + bytes(8) + (122).to_bytes(3, 'little') + (44).to_bytes(3, 'little'),
+])
+def test_image_size_from_header(image: bytes):
+    assert image_size_from_header(image) == (123, 45)
+    assert image_size_from_header(image[:11]) is None
+
+
+def test_image_size_from_header_invalid():
+    assert image_size_from_header(_jpeg_with_large_exif(10, 10)[:4096]) is None
+    with pytest.raises(ValueError):
+        image_size_from_header(b'not an image at all')
+
+
+def _range_responder(images, supports_ranges=True):
+    def respond(method, path, body, headers):
+        if path not in images:
+            return 404, {}, b''
+        data = images[path]
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', headers.get('Range', ''))
+        if not supports_ranges or not match:
+            return 200, {'Content-Type': 'image/jpeg'}, data
+        start, end = int(match.group(1)), int(match.group(2))
+        if start >= len(data):
+            return 416, {}, b''
+        return 206, {'Content-Range': f'bytes {start}-{min(end, len(data) - 1)}/{len(data)}'}, data[start:end + 1]
+
+    return respond
+
+
+@pytest.mark.parametrize("supports_ranges", [True, False])
+def test_fetch_image_size_reads_headers_only(supports_ranges: bool):
+    image = _jpeg_with_large_exif(300, 200)
+    with StubServer(_range_responder({'/a.jpg': image}, supports_ranges), with_headers=True) as server:
+        assert fetch_image_size(f'{server.url}/a.jpg') == (300, 200)
+
+    if supports_ranges:
+        # doubling ranges until the frame header past the 60k EXIF segment
+        assert [r[2]['Range'] for r in server.requests] == ['bytes=0-4095', 'bytes=4096-12287', 'bytes=12288-28671', 'bytes=28672-61439']
+
+
+def _coco_with_image_files(tmp_path, server_url):
+    coco = json.loads((BASE_PATH / 'od_train_valid.json').read_text())
+    (tmp_path / 'images').mkdir()
+    (tmp_path / 'images' / 'local.png').write_bytes(_encode('.png', 640, 480))
+    coco['images'][0].update(width=640, height=480, coco_url='images/local.png')
+    coco['images'][1].update(width=640, height=480, coco_url=f'{server_url}/remote.jpg')
+    coco['images'].extend([
+        dict(coco['images'][1], id=3, coco_url=f'{server_url}/missing.jpg'),
+        dict(coco['images'][1], id=4, coco_url=f'{server_url}/small.jpg'),
+        dict(coco['images'][1], id=5, coco_url='images/not_there.png'),
+    ])
+    coco['annotations'].extend(dict(coco['annotations'][1], id=i, image_id=i) for i in range(3, 6))
+    path = tmp_path / 'coco.json'
+    path.write_text(json.dumps(coco))
+    return coco, path
+
+
+def test_image_files_check_private_container(tmp_path):
+    image = _encode('.jpg', 640, 480)
+    images = {'/container/a.jpg': image, '/other/b.jpg': image}
+
+    def respond(method, path, body, headers):
+        # the SAS token authorizes the blobs of its container only
+        path, _, query = path.partition('?')
+        if not (path.startswith('/container/') and 'sig=secret' in query):
+            return 403, {}, b'AuthorizationFailure'
+        return _range_responder(images)(method, path, body, headers)
+
+    with StubServer(respond, with_headers=True) as server:
+        coco, _ = _coco_with_image_files(tmp_path, server.url)
+        coco['images'] = [dict(coco['images'][1], id=1, coco_url=f'{server.url}/container/a.jpg'),
+                          dict(coco['images'][1], id=2, coco_url=f'{server.url}/other/b.jpg')]
+        quota_limit = _get_quota_limit(AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING)
+        without_sas = list(image_files_check(coco['images'], quota_limit, concurrency=2))
+        with_sas = list(image_files_check(coco['images'], quota_limit, concurrency=2, container_sas_url=f'{server.url}/container?sv=1&sig=secret'))
+
+    assert without_sas == [
+        f'Image {server.url}/container/a.jpg access denied (403), the container may be private: pass a SAS url of the container with read permission. '
+        'image with id = 1.',
+        f'Image {server.url}/other/b.jpg access denied (403), the container may be private: pass a SAS url of the container with read permission. '
+        'image with id = 2.',
+    ]
+    assert with_sas == [without_sas[1]]
+    assert not any('sig=secret' in path for _, path, _, _ in server.requests if path.startswith('/other/'))
+
+
+def test_image_files_check(tmp_path):
+    images = {'/remote.jpg': _encode('.jpg', 640, 480), '/small.jpg': _encode('.jpg', 8, 480)}
+    with StubServer(_range_responder(images), with_headers=True) as server:
+        coco, path = _coco_with_image_files(tmp_path, server.url)
+        result = check_coco_annotation_file_streaming(path, AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING, verify_images=True, concurrency=4)
+        with pytest.raises(ValueError) as exinfo:
+            check_coco_annotation_file(coco, AnnotationKind.OBJECT_DETECTION, Purpose.TRAINING, verify_images=True, root=tmp_path, concurrency=4)
+
+    assert result.errors[0] == f'Image {server.url}/missing.jpg not found. image with id = 3.'
+    assert result.errors[1:3] == ['Declared size 640x480 does not match actual size 8x480. image with id = 4.', 'Actual width 8 must be in [10, 10240]. image with id = 4.']
+    assert result.errors[3].startswith('Image images/not_there.png not accessible: [Errno 2]')
+    assert result.error_count == 4
+    assert str(exinfo.value) == result.errors[0]
@@ -0,0 +1,273 @@
+import io
+import json
+import tempfile
+import pathlib
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from azure.core.exceptions import ResourceNotFoundError
+
+from cognitive_service_vision_model_customization_python_samples.data.export_cvs_data_to_blob_storage import blob_copied, CocoOperator, annotations_fingerprint, \
+    copy_images_with_retry, export_batches, ExportJournal, load_manifest, upload_blocks, upload_coco_json, upload_manifest, wait_for_completion, _coco_entries
+
+
+def _image(id, tags=(), regions=()):
+    return SimpleNamespace(id=id, width=640, height=480, original_image_uri=f'https://cvs.blob.core.windows.net/images/{id}?sig=a',
+                           tags=[SimpleNamespace(tag_name=t) for t in tags], regions=[SimpleNamespace(tag_name=t, left=0.1, top=0.2, width=0.3, height=0.4) for t in regions])
+
+
+class FakeBlobClient:
+    def __init__(self, properties=None, copy_statuses=(), url=None):
+        self._properties = properties
+        self._copy_statuses = list(copy_statuses)
+        self.url = url
+        self.n_copies = 0
+        self.n_polls = 0
+
+    def get_blob_properties(self):
+        self.n_polls += 1
+        if self._copy_statuses:
+            return SimpleNamespace(copy=SimpleNamespace(status=self._copy_statuses.pop(0)))
+        if self._properties is None:
+            raise ResourceNotFoundError('not found')
+        return self._properties
+
+    def start_copy_from_url(self, url):
+        self.n_copies += 1
+        return {'copy_status': self._copy_statuses.pop(0)}
+
+
+class FakeContainerClient:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def get_blob_client(self, name):
+        return self.blobs[name]
+
+
+def _properties(status='success', source='https://cvs.blob.core.windows.net/images/1?sig=b', progress='100/100', size=100):
+    return SimpleNamespace(size=size, copy=SimpleNamespace(status=status, source=source, progress=progress))
+
+
+class TestExportJournal(unittest.TestCase):
+    def test_resume_replays_completed_batches(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = pathlib.Path(folder) / 'checkpoint.jsonl'
+            entries = [_coco_entries([_image(1, regions=['cat', 'dog']), _image(2, tags=['cat'])], ['url1', 'url2'], 'proj'), _coco_entries([_image(3)], ['url3'], 'proj')]
+            with ExportJournal(path) as journal:
+                journal.start('project', 'proj')
+                journal.append(0, 2, entries[0])
+                journal.append(1, 3, entries[1])
+            # crash in the middle of writing the next batch
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write('{"batch_id": 2, "skip"')
+
+            with ExportJournal(path) as journal:
+                records = journal.resume('project', 'proj')
+                journal.append(2, 4, [])
+
+            self.assertEqual([(r['batch_id'], r['skip']) for r in records], [(0, 2), (1, 3)])
+            self.assertEqual([json.loads(line)['skip'] for line in path.read_text(encoding='utf-8').splitlines()[1:]], [2, 3, 4])
+
+            with self.assertRaises(ValueError):
+                ExportJournal(path).resume('other project', 'proj')
+
+        coco = CocoOperator()
+        coco.add_category('cat')
+        coco.add_category('dog')
+        for record in records:
+            coco.add_entries(record['entries'])
+        coco_dict = json.loads(coco.to_json())
+        self.assertEqual([img['coco_url'] for img in coco_dict['images']], ['url1', 'url2', 'url3'])
+        self.assertEqual(coco_dict['images'][2], {'id': 3, 'width': 640, 'height': 480, 'coco_url': 'url3', 'file_name': 'proj/images/3'})
+        self.assertEqual([(ann['image_id'], ann['category_id'], ann.get('bbox')) for ann in coco_dict['annotations']],
+                         [(1, 1, [0.1, 0.2, 0.3, 0.4]), (1, 2, [0.1, 0.2, 0.3, 0.4]), (2, 1, None)])
+
+    def test_resume_without_checkpoint_starts_over(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = pathlib.Path(folder) / 'checkpoint.jsonl'
+            with ExportJournal(path) as journal:
+                self.assertEqual(journal.resume('project', 'proj'), [])
+            self.assertEqual(json.loads(path.read_text(encoding='utf-8')), {'project_id': 'project', 'sub_folder': 'proj'})
+
+    def test_blob_copied(self):
+        source = 'https://cvs.blob.core.windows.net/images/1?sig=a'
+        self.assertTrue(blob_copied(FakeBlobClient(_properties()), source))
+        self.assertFalse(blob_copied(FakeBlobClient(None), source))
+        self.assertFalse(blob_copied(FakeBlobClient(_properties(status='pending')), source))
+        self.assertFalse(blob_copied(FakeBlobClient(_properties(size=50)), source))
+        self.assertFalse(blob_copied(FakeBlobClient(_properties(source='https://cvs.blob.core.windows.net/images/2?sig=a')), source))
+
+
+class TestCopyStatus(unittest.TestCase):
+    def test_only_pending_copies_are_polled(self):
+        blobs = [FakeBlobClient(copy_statuses=['success']), FakeBlobClient(copy_statuses=['pending', 'success']), FakeBlobClient(copy_statuses=['failed'])]
+        statuses = wait_for_completion(blobs, statuses=['success', 'pending', 'pending'])
+
+        self.assertEqual(statuses, ['success', 'success', 'failed'])
+        self.assertEqual([b.n_polls for b in blobs], [0, 2, 1])
+
+    def test_timeout_keeps_pending_status(self):
+        blob = FakeBlobClient(copy_statuses=['pending'] * 100)
+        self.assertEqual(wait_for_completion([blob], time_out=0.3), ['pending'])
+        self.assertLess(blob.n_polls, 5)
+
+    def test_failed_copies_are_retried(self):
+        blobs = {
+            'proj/images/1': FakeBlobClient(copy_statuses=['success'], url='url1'),
+            'proj/images/2': FakeBlobClient(copy_statuses=['pending', 'failed', 'pending', 'success'], url='url2'),
+            'proj/images/3': FakeBlobClient(copy_statuses=['pending', 'success'], url='url3'),
+        }
+        pool = SimpleNamespace(map=lambda func, items: [func(item) for item in items])
+        urls = copy_images_with_retry(pool, FakeContainerClient(blobs), 'proj', [_image(1), _image(2), _image(3)], 0)
+
+        self.assertEqual(urls, ['url1', 'url2', 'url3'])
+        self.assertEqual([b.n_copies for b in blobs.values()], [1, 2, 1])
+
+
+class FakeBlockBlobClient:
+    def __init__(self, url=None):
+        self.url = url
+        self.staged = {}
+        self.committed = None
+
+    def exists(self):
+        return self.committed is not None
+
+    def download_blob(self):
+        if self.committed is None:
+            raise ResourceNotFoundError('not found')
+        return SimpleNamespace(readall=lambda: self.committed)
+
+    def stage_block(self, block_id, data):
+        self.staged[block_id] = data
+
+    def commit_block_list(self, block_list, content_settings=None):
+        self.committed = b''.join(self.staged[block.id] for block in block_list)
+        self.content_type = content_settings.content_type
+
+
+class TestCocoOutput(unittest.TestCase):
+    def test_streamed_json_matches_coco_dict(self):
+        coco = CocoOperator()
+        coco.add_category('猫')
+        coco.add_category('dog')
+        for i in range(1, 8):
+            coco.add_entries(_coco_entries([_image(i, regions=['猫'] * (i % 3))], [f'url{i}'], 'proj'))
+
+        pieces = list(coco.iter_json(items_per_chunk=3))
+        coco_dict = json.loads(''.join(pieces))
+        self.assertEqual(coco_dict, json.loads(coco.to_json()))
+        self.assertEqual((len(coco_dict['images']), len(coco_dict['categories']), len(coco_dict['annotations'])), (7, 2, 7))
+        self.assertEqual(coco_dict['categories'][0]['name'], '猫')
+        self.assertTrue(all(len(piece) < 1000 for piece in pieces))
+
+        fp = io.StringIO()
+        coco.write(fp)
+        self.assertEqual(fp.getvalue(), ''.join(pieces))
+
+        blob = FakeBlockBlobClient()
+        upload_blocks(blob, (piece.encode('utf-8') for piece in pieces), block_size=100)
+        self.assertEqual(blob.committed.decode('utf-8'), ''.join(pieces))
+        self.assertGreater(len(blob.staged), 3)
+        self.assertEqual(blob.content_type, 'application/json')
+
+
+class FakeTrainer:
+    def __init__(self, n_images, page_size, delay, fail_at=None):
+        self._images = [_image(i + 1, tags=['cat']) for i in range(n_images)]
+        self._page_size = page_size
+        self._delay = delay
+        self._fail_at = fail_at
+        self.skips = []
+
+    def get_images(self, project_id, take, skip):
+        self.skips.append(skip)
+        if skip == self._fail_at:
+            raise RuntimeError('listing failed')
+        time.sleep(self._delay)
+        return self._images[skip:skip + self._page_size]
+
+
+class SlowCopyBlobs(dict):
+    def __init__(self, delay):
+        super().__init__()
+        self._delay = delay
+        self._lock = threading.Lock()
+
+    def __missing__(self, name):
+        with self._lock:
+            blob = self.setdefault(name, FakeBlobClient(url=name))
+
+        def start_copy_from_url(url):
+            blob.n_copies += 1
+            time.sleep(self._delay)
+            return {'copy_status': 'success'}
+
+        blob.start_copy_from_url = start_copy_from_url
+        return blob
+
+
+class TestExportPipeline(unittest.TestCase):
+    pool = SimpleNamespace(map=lambda func, items: [func(item) for item in items])
+
+    def test_batches_in_order_with_overlap(self):
+        trainer = FakeTrainer(n_images=20, page_size=2, delay=0.05)
+        container_client = FakeContainerClient(SlowCopyBlobs(delay=0.05))
+        start = time.perf_counter()
+        batches = list(export_batches(trainer, 'project', self.pool, container_client, 'proj', skip=4, batch_id=2))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([(batch_id, skip) for batch_id, skip, _ in batches], [(2 + i, 6 + 2 * i) for i in range(8)])
+        self.assertEqual([entry['coco_url'] for _, _, entries in batches for entry in entries], [f'proj/images/{i}' for i in range(5, 21)])
+        # 9 listings of 0.05s and 16 sequential copies of 0.05s take 1.25s back to back
+        self.assertLess(elapsed, 0.9)
+
+    def test_delta_copies_new_images_only(self):
+        trainer = FakeTrainer(n_images=6, page_size=4, delay=0)
+        blobs = SlowCopyBlobs(delay=0)
+        batches = list(export_batches(trainer, 'project', self.pool, FakeContainerClient(blobs), 'proj', exported={1, 2, 5}))
+
+        self.assertEqual([entry['coco_url'] for _, _, entries in batches for entry in entries], [f'proj/images/{i}' for i in range(1, 7)])
+        self.assertEqual([entry['image_id'] for _, _, entries in batches for entry in entries], list(range(1, 7)))
+        self.assertEqual([name for name, blob in sorted(blobs.items()) if blob.n_copies], [f'proj/images/{i}' for i in (3, 4, 6)])
+
+    def test_manifest_round_trip(self):
+        blobs = {'proj/export_manifest.json': FakeBlockBlobClient()}
+        self.assertEqual(load_manifest(FakeContainerClient(blobs), 'proj'), {})
+
+        manifest = {'a': annotations_fingerprint([['cat', None]]), 'b': annotations_fingerprint([['cat', [0.1, 0.2, 0.3, 0.4]]])}
+        upload_manifest(FakeContainerClient(blobs), 'proj', manifest)
+        self.assertEqual(load_manifest(FakeContainerClient(blobs), 'proj'), manifest)
+        self.assertNotEqual(manifest['a'], manifest['b'])
+
+    def test_manifest_is_uploaded_with_the_coco_json_only(self):
+        blobs = {'proj/train.json': FakeBlockBlobClient(url='proj/train.json'), 'proj/export_manifest.json': FakeBlockBlobClient()}
+        container_client = FakeContainerClient(blobs)
+        coco = CocoOperator()
+        coco.add_category('cat')
+        coco.add_entries(_coco_entries([_image(1, tags=['cat'])], ['url1'], 'proj'))
+        self.assertTrue(upload_coco_json(container_client, 'proj', coco, {'1': 'a'}, overwrite=False))
+
+        # a later export without --delta leaves the existing coco json, and the manifest describing it
+        coco.add_entries(_coco_entries([_image(2, tags=['cat'])], ['url2'], 'proj'))
+        self.assertFalse(upload_coco_json(container_client, 'proj', coco, {'1': 'a', '2': 'b'}, overwrite=False))
+        self.assertEqual(len(json.loads(blobs['proj/train.json'].committed)['images']), 1)
+        self.assertEqual(load_manifest(container_client, 'proj'), {'1': 'a'})
+
+        self.assertTrue(upload_coco_json(container_client, 'proj', coco, {'1': 'a', '2': 'b'}, overwrite=True))
+        self.assertEqual(len(json.loads(blobs['proj/train.json'].committed)['images']), 2)
+        self.assertEqual(load_manifest(container_client, 'proj'), {'1': 'a', '2': 'b'})
+
+    def test_listing_error_is_raised(self):
+        trainer = FakeTrainer(n_images=20, page_size=2, delay=0, fail_at=6)
+        batches = export_batches(trainer, 'project', self.pool, FakeContainerClient(SlowCopyBlobs(delay=0)), 'proj')
+        with self.assertRaises(RuntimeError):
+            for _ in batches:
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
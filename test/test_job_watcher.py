@@ -0,0 +1,130 @@
+import concurrent.futures
+import threading
+import time
+import unittest
+
+from cognitive_service_vision_model_customization_python_samples import JobWatcher, ProductRecognitionStatus
+from cognitive_service_vision_model_customization_python_samples.clients.job_watcher import wait_for
+
+
+class FakeRun:
+    def __init__(self, status):
+        self.status = status
+
+
+class FakeProductRecognitionClient:
+    def __init__(self, polls_until_done):
+        self.polls_until_done = polls_until_done
+        self.polls = {}
+        self.lock = threading.Lock()
+
+    def query_run(self, name, model_name):
+        with self.lock:
+            self.polls[name] = self.polls.get(name, 0) + 1
+            done = self.polls[name] >= self.polls_until_done
+        return FakeRun(ProductRecognitionStatus.SUCCEEDED if done else ProductRecognitionStatus.RUNNING)
+
+
+class TestJobWatcher(unittest.TestCase):
+    def test_many_jobs_resolve_with_bounded_threads(self):
+        client = FakeProductRecognitionClient(polls_until_done=3)
+        threads_before = threading.active_count()
+        with JobWatcher(initial_interval=0.01, max_interval=0.05, max_workers=2) as watcher:
+            futures = [watcher.watch_product_recognition(client, f'run{i}', 'model') for i in range(200)]
+            self.assertLessEqual(threading.active_count() - threads_before, 3)
+            results = [f.result(timeout=10) for f in futures]
+
+        self.assertTrue(all(r.status == ProductRecognitionStatus.SUCCEEDED for r in results))
+        self.assertEqual(set(client.polls.values()), {3})
+
+    def test_failed_query_fails_the_future(self):
+        def query():
+            raise RuntimeError('boom')
+
+        with JobWatcher(initial_interval=0.01) as watcher:
+            with self.assertRaises(RuntimeError):
+                watcher.watch(query, []).result(timeout=5)
+
+    def test_fixed_interval(self):
+        polls = []
+
+        def query():
+            polls.append(time.monotonic())
+            return FakeRun(ProductRecognitionStatus.SUCCEEDED if len(polls) == 4 else ProductRecognitionStatus.RUNNING)
+
+        with JobWatcher(initial_interval=60, backoff_factor=10, jitter=0) as watcher:
+            watcher.watch(query, [ProductRecognitionStatus.SUCCEEDED], interval=0.05).result(timeout=5)
+
+        intervals = [b - a for a, b in zip(polls, polls[1:])]
+        self.assertTrue(all(0.04 < interval < 0.5 for interval in intervals), intervals)
+
+    def test_interrupted_wait_stops_watching(self):
+        class Interrupted(BaseException):
+            pass
+
+        class InterruptedFuture(concurrent.futures.Future):
+            def result(self, timeout=None):
+                raise Interrupted()
+
+        future = InterruptedFuture()
+        with self.assertRaises(Interrupted):
+            wait_for(future)
+        self.assertTrue(future.cancelled())
+
+    def test_timeout_and_callbacks(self):
+        finished = []
+        with JobWatcher(initial_interval=0.01, max_interval=0.01) as watcher:
+            future = watcher.watch(lambda: FakeRun(ProductRecognitionStatus.RUNNING), [ProductRecognitionStatus.SUCCEEDED], timeout=0.1)
+            future.add_done_callback(finished.append)
+            with self.assertRaises(TimeoutError):
+                future.result(timeout=5)
+
+        self.assertEqual(finished, [future])
+
+    def test_close_cancels_pending_jobs(self):
+        watcher = JobWatcher(initial_interval=60)
+        future = watcher.watch(lambda: FakeRun(ProductRecognitionStatus.RUNNING), [ProductRecognitionStatus.SUCCEEDED])
+        concurrent.futures.wait([future], timeout=0.2)
+        watcher.close()
+        self.assertTrue(future.cancelled())
+
+    def test_cancel_while_polling(self):
+        polling, cancelled = threading.Event(), threading.Event()
+
+        def query():
+            polling.set()
+            cancelled.wait(5)
+            return FakeRun(ProductRecognitionStatus.SUCCEEDED)
+
+        with JobWatcher(initial_interval=0.01) as watcher:
+            future = watcher.watch(query, [ProductRecognitionStatus.SUCCEEDED])
+            polling.wait(5)
+            self.assertTrue(future.cancel())
+            cancelled.set()
+
+        self.assertTrue(future.cancelled())
+
+    def test_close_without_waiting_during_a_submit(self):
+        watcher = JobWatcher(initial_interval=0.01)
+        executor = watcher._executor
+        submitting = threading.Event()
+
+        class SlowExecutor:
+            def submit(self, fn, *args):
+                submitting.set()
+                time.sleep(0.1)
+                return executor.submit(fn, *args)
+
+            def shutdown(self, wait=True):
+                executor.shutdown(wait)
+
+        watcher._executor = SlowExecutor()
+        future = watcher.watch(lambda: FakeRun(ProductRecognitionStatus.RUNNING), [ProductRecognitionStatus.SUCCEEDED])
+        submitting.wait(5)
+        watcher.close(wait=False)
+
+        # the poll submitted before close() still runs, and cancels the job instead of scheduling it again
+        deadline = time.monotonic() + 5
+        while not future.done() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(future.cancelled())
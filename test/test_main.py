@@ -0,0 +1,68 @@
+import pathlib
+import sys
+
+import pytest
+
+from cognitive_service_vision_model_customization_python_samples.clients.batch import BatchResult
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / 'aml-pipeline'))
+
+pytest.importorskip('azureml.core')
+pytest.importorskip('matplotlib')
+pytest.importorskip('mlflow')
+pytest.importorskip('pandas')
+pytest.importorskip('loguru')
+pytest.importorskip('sklearn')
+pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+
+import main  # noqa: E402
+from common.analyser.parsers.classification_parser import ClassificationParser  # noqa: E402
+
+GROUND_TRUTH = {
+    'images': [{'id': 1, 'file_name': 'a.png'}, {'id': 2, 'file_name': 'b.png'}, {'id': 3, 'file_name': 'c.png'}],
+    'categories': [{'id': 1, 'name': 'cat'}, {'id': 2, 'name': 'dog'}],
+    'annotations': [{'id': 1, 'image_id': 1, 'category_id': 1}, {'id': 2, 'image_id': 2, 'category_id': 2}, {'id': 3, 'image_id': 3, 'category_id': 2}],
+}
+
+
+class FakePredictionClient:
+    def __init__(self, failing):
+        self.failing = failing
+
+    def predict_many(self, model_name, images, **kwargs):
+        for i, image in enumerate(images):
+            if image.endswith(self.failing):
+                yield BatchResult(i, image, error=RuntimeError('service unavailable'))
+            else:
+                values = [{'name': 'cat', 'confidence': 0.3}, {'name': 'dog', 'confidence': 0.7}]
+                yield BatchResult(i, image, result={'customModelResult': {'tagsResult': {'values': values}}})
+
+
+def test_failed_predictions_are_excluded_from_the_ground_truth():
+    ground_truth, predictions, inference_results = main.predict_dataset(FakePredictionClient(failing='b.png'), 'model', 'data', GROUND_TRUTH)
+
+    assert [x['id'] for x in ground_truth['images']] == [1, 3]
+    assert [x['image_id'] for x in ground_truth['annotations']] == [1, 3]
+    assert [x['id'] for x in predictions['images']] == [1, 3]
+    assert [x['image_id'] for x in predictions['predictions']['classification']] == [1, 3]
+    assert [x['image_id'] for x in inference_results] == [1, 3]
+    # the input ground truth is left as it is
+    assert len(GROUND_TRUTH['images']) == 3
+
+    # one row per predicted image in the analysis
+    y_true, y_pred, _, _, img_list = ClassificationParser(ground_truth=ground_truth, predictions=predictions).parse()
+    assert img_list == ['a.png', 'c.png']
+    assert y_true.tolist() == [1, 2]
+    assert y_pred.tolist() == [2, 2]
+
+
+def test_all_predictions_failed():
+    with pytest.raises(RuntimeError):
+        main.predict_dataset(FakePredictionClient(failing='.png'), 'model', 'data', GROUND_TRUTH)
+
+
+def test_no_failed_predictions():
+    ground_truth, predictions, _ = main.predict_dataset(FakePredictionClient(failing='none'), 'model', 'data', GROUND_TRUTH)
+    assert ground_truth is GROUND_TRUTH
+    assert len(predictions['predictions']['classification']) == 3
@@ -0,0 +1,206 @@
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from cognitive_service_vision_model_customization_python_samples import ProductRecognitionClient, ResourceType, JobWatcher, ProductRecognitionStatus, create_session, \
+    ImagePreprocessor, ProductRecognition, PredictionCache
+from .stub_server import StubServer
+
+
+class ProductRecognitionService:
+    """Stub of the product recognition runs API, each run succeeds after being polled twice, images with content b'bad' fail."""
+
+    def __init__(self):
+        self.runs = {}
+        self.deleted = []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, path, body):
+        name = path.split('?')[0].split('/')[-1]
+        with self.lock:
+            if method == 'PUT':
+                self.runs[name] = {'polls': 0, 'image': body}
+            elif method == 'DELETE':
+                self.deleted.append(name)
+                return 200, {}, {}
+            else:
+                self.runs[name]['polls'] += 1
+
+            run = self.runs[name]
+            if run['polls'] < 2:
+                status = 'notStarted' if method == 'PUT' else 'running'
+            else:
+                status = 'failed' if run['image'] == b'bad' else 'succeeded'
+
+        return 200, {}, {'runName': name, 'modelName': 'model', 'status': status, 'createdDateTime': '', 'updatedDateTime': '',
+                         'result': {'image': run['image'].decode()}}
+
+
+class ManualWatcher:
+    """Watcher whose runs are resolved by the test, and cannot be cancelled once watched, as runs whose last poll is in flight."""
+
+    def __init__(self):
+        self.runs = []
+
+    def watch_product_recognition(self, client, name, model_name):
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
+        self.runs.append((future, lambda: client.query_run(name, model_name)))
+        return future
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestProductRecognition(unittest.TestCase):
+    def test_recognize_many_pipelines_runs(self):
+        service = ProductRecognitionService()
+        images = [str(i).encode() for i in range(30)] + [b'bad']
+        with StubServer(service) as server, JobWatcher(initial_interval=0.01, max_interval=0.02) as watcher:
+            client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session())
+            results = list(client.recognize_many('model', images, max_in_flight=8, watcher=watcher))
+
+        self.assertEqual(sorted(r.index for r in results), list(range(31)))
+        for r in results:
+            if r.item == b'bad':
+                self.assertIsInstance(r.error, RuntimeError)
+            else:
+                self.assertEqual(r.result.status, ProductRecognitionStatus.SUCCEEDED)
+                self.assertEqual(r.result.result, {'image': r.item.decode()})
+        self.assertEqual(sorted(service.deleted), sorted(service.runs))
+
+    def test_recognize_many_captures_upload_errors(self):
+        def responder(method, path, body):
+            return 400, {}, json.dumps({'error': 'invalid image'}).encode()
+
+        with StubServer(responder) as server:
+            client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session())
+            results = list(client.recognize_many('model', [b'0', b'1']))
+
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(r.error is not None for r in results))
+
+    def test_wait_for_completion_polls_from_the_watcher(self):
+        service = ProductRecognitionService()
+        polling_threads = []
+
+        class Client(ProductRecognitionClient):
+            def query_run(self, name, model_name):
+                polling_threads.append(threading.current_thread().name)
+                return super().query_run(name, model_name)
+
+        with StubServer(service) as server, JobWatcher(initial_interval=60) as watcher:
+            client = Client(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session())
+            client.create_run(ProductRecognition('run1', 'model'), b'0')
+            client.create_run(ProductRecognition('run2', 'model'), b'1')
+            # check_wait_in_secs rather than the watcher's intervals
+            run1 = client.wait_for_completion('run1', 'model', check_wait_in_secs=0.01, watcher=watcher)
+            # the default watcher
+            run2 = client.wait_for_completion('run2', 'model', check_wait_in_secs=0.01)
+
+        self.assertEqual([run1.status, run2.status], [ProductRecognitionStatus.SUCCEEDED] * 2)
+        self.assertEqual(service.runs['run1']['polls'], 2)
+        self.assertEqual(len(polling_threads), 4)
+        self.assertTrue(all(name.startswith('JobWatcherPoll') for name in polling_threads), polling_threads)
+
+    def test_preprocessor_restores_run_coordinates(self):
+        def responder(method, path, body):
+            if method == 'DELETE':
+                return 200, {}, {}
+            result = {'imageMetadata': {'width': 500, 'height': 250}, 'products': [{'id': '1', 'boundingBox': {'x': 50, 'y': 25, 'w': 100, 'h': 50}}], 'gaps': []}
+            return 200, {}, {'runName': 'run', 'modelName': 'model', 'status': 'succeeded', 'createdDateTime': '', 'updatedDateTime': '', 'result': result}
+
+        image = cv2.imencode('.png', np.zeros((500, 1000, 3), np.uint8))[1].tobytes()
+        with StubServer(responder) as server, ImagePreprocessor(max_long_edge=500, max_workers=1) as preprocessor:
+            client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), preprocessor=preprocessor)
+            client.create_run(ProductRecognition('run', 'model'), image)
+            # the sizes of the upload rather than the image
+            self.assertEqual(client._shrunk_runs, {('model', 'run'): ((1000, 500), (500, 250))})
+            run = client.query_run('run', 'model')
+            client.delete_run('run', 'model')
+            raw = client.query_run('run', 'model')
+
+        self.assertEqual(run.result['imageMetadata'], {'width': 1000, 'height': 500})
+        self.assertEqual(run.result['products'][0]['boundingBox'], {'x': 100, 'y': 50, 'w': 200, 'h': 100})
+        self.assertEqual(raw.result['products'][0]['boundingBox'], {'x': 50, 'y': 25, 'w': 100, 'h': 50})
+
+    def test_preprocessor_failed_run_creation_is_forgotten(self):
+        def responder(method, path, body):
+            return 400, {}, json.dumps({'error': 'invalid image'}).encode()
+
+        image = cv2.imencode('.png', np.zeros((500, 1000, 3), np.uint8))[1].tobytes()
+        with StubServer(responder) as server, ImagePreprocessor(max_long_edge=500, max_workers=1) as preprocessor:
+            client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), preprocessor=preprocessor)
+            with self.assertRaises(Exception):
+                client.create_run(ProductRecognition('run', 'model'), image)
+
+        self.assertEqual(client._shrunk_runs, {})
+
+    def test_recognize_many_answers_repeated_images_from_cache(self):
+        service = ProductRecognitionService()
+        with StubServer(service) as server, JobWatcher(initial_interval=0.01, max_interval=0.02) as watcher:
+            client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), cache=PredictionCache())
+            first = list(client.recognize_many('model', [b'0', b'1', b'bad'], watcher=watcher))
+            second = list(client.recognize_many('model', [b'1', b'0', b'bad'], watcher=watcher))
+
+        self.assertEqual(len(service.runs), 4)
+        self.assertEqual(sum(r.error is not None for r in first + second), 2)
+        self.assertEqual(sorted(r.result.result['image'] for r in second if r.ok), ['0', '1'])
+
+    def test_recognize_many_runs_finishing_after_close(self):
+        service = ProductRecognitionService()
+        watcher = ManualWatcher()
+        handler = ListHandler()
+        logging.getLogger('concurrent.futures').addHandler(handler)
+        try:
+            with StubServer(service) as server:
+                client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session())
+                results = client.recognize_many('model', [b'0', b'1', b'2'], watcher=watcher)
+                first = []
+                consumer = threading.Thread(target=lambda: first.append(next(results)))
+                consumer.start()
+                deadline = time.monotonic() + 10
+                while len(watcher.runs) < 3 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                future, query = watcher.runs[0]
+                future.set_result(query())
+                consumer.join()
+
+                # the caller stops consuming while the other runs are still watched, they finish afterwards
+                results.close()
+                for future, query in watcher.runs[1:]:
+                    future.set_result(query())
+        finally:
+            logging.getLogger('concurrent.futures').removeHandler(handler)
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual(handler.records, [])
+        self.assertEqual(sorted(service.deleted), sorted(service.runs))
+
+    def test_recognize_many_without_deleting_runs_forgets_restored_runs(self):
+        def responder(method, path, body):
+            result = {'imageMetadata': {'width': 500, 'height': 250}, 'products': [{'id': '1', 'boundingBox': {'x': 50, 'y': 25, 'w': 100, 'h': 50}}], 'gaps': []}
+            return 200, {}, {'runName': path.split('?')[0].split('/')[-1], 'modelName': 'model', 'status': 'succeeded', 'createdDateTime': '', 'updatedDateTime': '',
+                             'result': result}
+
+        image = cv2.imencode('.png', np.zeros((500, 1000, 3), np.uint8))[1].tobytes()
+        with StubServer(responder) as server, ImagePreprocessor(max_long_edge=500, max_workers=1) as preprocessor, \
+                JobWatcher(initial_interval=0.01, max_interval=0.02) as watcher:
+            client = ProductRecognitionClient(ResourceType.MULTI_SERVICE_RESOURCE, None, server.url, 'test_key', session=create_session(), preprocessor=preprocessor)
+            results = list(client.recognize_many('model', [image, image], delete_runs=False, watcher=watcher))
+
+        self.assertEqual([r.result.result['products'][0]['boundingBox'] for r in results], [{'x': 100, 'y': 50, 'w': 200, 'h': 100}] * 2)
+        self.assertEqual(client._shrunk_runs, {})
+        self.assertFalse(any(method == 'DELETE' for method, _, _, _ in server.requests))